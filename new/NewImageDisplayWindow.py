@@ -215,6 +215,29 @@ class ImageDisplayWindow(QMainWindow):
         except Exception as e:
             QMessageBox.warning(self, "错误", f"加载二值化图像失败: {str(e)}")
             
+    def displayArray(self, image, title="图像显示"):
+        """直接显示内存中的图像数组（BGR或灰度），不经过磁盘文件"""
+        try:
+            height, width = image.shape[:2]
+            if image.ndim == 2:
+                q_image = QImage(image.data, width, height, image.strides[0], QImage.Format_Grayscale8)
+            else:
+                q_image = QImage(image.data, width, height, image.strides[0], QImage.Format_RGB888)
+                q_image = q_image.rgbSwapped()
+            
+            # 创建QPixmap（复制像素数据，之后不再引用原数组）
+            self.original_pixmap = QPixmap.fromImage(q_image)
+            
+            # 设置标题
+            self.setWindowTitle(title)
+            self.title_label.setText(title)
+            
+            # 适应窗口显示
+            self.fitToWindow()
+            
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"加载图像失败: {str(e)}")
+            
     def displayDetectionResult(self, image_path):
         """显示检测结果图像"""
         self.displayImage(image_path, "缺陷检测结果")
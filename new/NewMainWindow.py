@@ -1,14 +1,11 @@
 import sys
 import os
 import cv2
-import torch
 import numpy as np
 import matplotlib.pyplot as plt
 import datetime
 import json
 import glob
-from PIL import Image
-from torchvision import transforms
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLabel, QPushButton, QMessageBox, QFrame, QApplication,
                              QGraphicsDropShadowEffect, QFileDialog, QProgressBar,
@@ -21,7 +18,9 @@ from PyQt5.QtGui import QPixmap, QImage, QFont, QPalette, QColor
 from NewImageDisplayWindow import ImageDisplayWindow
 from NewTestWindow import NewTestWindow
 from NewDefectWindow import NewDefectWindow
-import opration
+import result_sink
+import segment
+import stage_cache
 
 # 获取当前文件所在目录
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -30,22 +29,13 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 filepath = []
 filepath1 = []
 
-# 数据变换
-data_transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-])
-
-# 加载模型
+# 加载推理引擎
 try:
-    from model import model as ModelClass
-    model = ModelClass()
-    model.load_state_dict(torch.load(os.path.join(current_dir, "EfficientNet_self1.pth"), map_location='cpu'))
-    model.eval()
+    from engine import get_engine
+    engine = get_engine()
 except Exception as e:
     print(f"模型加载失败: {e}")
-    model = None
+    engine = None
 
 # 加载类别索引
 try:
@@ -89,44 +79,82 @@ class DetectionThread(QThread):
     """检测线程"""
     finishSignal = pyqtSignal(list)
     progressSignal = pyqtSignal(int)
+    errorSignal = pyqtSignal(str, str)  # (图片路径, 错误信息)
     
     def __init__(self, filepath, parent=None):
         super(DetectionThread, self).__init__(parent)
         self.filepath = filepath
         self.resultList = [0, 0, 0]  # [正常, 划痕, 漏涂]
+        self.failed = []  # 检测失败的图片（不计入正常）
         self.is_running = True
         
     def predict(self, file_path):
-        """预测单张图片"""
+        """预测单张图片，失败时返回 None"""
+        return self.predictBatch([file_path])[0]
+        
+    def predictBatch(self, file_paths):
+        """
+        批量预测多张图片，返回 [(类别, 置信度) 或 None, ...]
+        读取或推理失败的图片为 None 并发出 errorSignal，不能当作正常（缺陷检测中漏检比误报更严重）；
+        整批推理出错时逐张重试，只有出错的那张图片失败
+        """
+        images = [cv2.imread(file_path) for file_path in file_paths]
+        results = [None] * len(file_paths)
+        valid = []
+        for i, img in enumerate(images):
+            if img is None:
+                self.reportError(file_paths[i], "无法读取图像")
+            else:
+                valid.append(i)
+        if not valid:
+            return results
+        
         try:
-            img = Image.open(file_path)
-            img = data_transform(img)
-            img = torch.unsqueeze(img, dim=0)
-            
-            with torch.no_grad():
-                result = model(img)
-                result = torch.squeeze(result)
-                predict = torch.softmax(result, dim=0)
-                predict_cla = torch.argmax(predict).numpy()
-                
-            return predict_cla, predict[predict_cla].item()
+            classes, probs = engine.classify([images[i] for i in valid])
+            for i, cla, prob in zip(valid, classes, probs):
+                results[i] = (int(cla), float(prob))
         except Exception as e:
-            print(f"预测错误: {e}")
-            return 0, 0.0
+            if len(valid) == 1:
+                self.reportError(file_paths[valid[0]], f"预测错误: {e}")
+                return results
+            print(f"整批预测错误，逐张重试: {e}")
+            for i in valid:
+                if not self.is_running:
+                    break
+                results[i] = self.predict(file_paths[i])
+        return results
+        
+    def reportError(self, file_path, message):
+        print(f"处理图片 {file_path} 时出错: {message}")
+        self.failed.append(file_path)
+        self.errorSignal.emit(file_path, message)
             
     def run(self):
         """运行检测"""
         # 重置结果
         self.resultList = [0, 0, 0]  # [正常, 划痕, 漏涂]
+        self.failed = []
         
         print(f"开始检测 {len(self.filepath)} 张图像")
         
-        for i, file_path in enumerate(self.filepath):
+        # 多张图像按批组合，一次前向处理一批
+        batch_size = engine.batch_size if engine is not None else 1
+        for start in range(0, len(self.filepath), batch_size):
             if not self.is_running:
                 break
                 
-            try:
-                predict, prob = self.predict(file_path)
+            batch_paths = self.filepath[start:start + batch_size]
+            results = self.predictBatch(batch_paths)
+            
+            for i, result in enumerate(results, start=start):
+                # 每张图片之间都检查停止标志，停止不必等整批统计完
+                if not self.is_running:
+                    break
+                if result is None:
+                    print(f"图像 {i+1}: 检测失败")
+                    self.progressSignal.emit(i + 1)
+                    continue
+                predict, prob = result
                 
                 # 根据类别映射统计结果
                 # 正常类别: 0,1,2,3,5,7 (class1OK, class2OK, class3OK, class4OK, class6OK, class8OK)
@@ -147,42 +175,10 @@ class DetectionThread(QThread):
                     
                 self.progressSignal.emit(i + 1)
                 
-            except Exception as e:
-                print(f"处理图片 {file_path} 时出错: {e}")
-                continue
-                
-        print(f"检测完成，统计结果: 正常={self.resultList[0]}, 划痕={self.resultList[1]}, 漏涂={self.resultList[2]}")
+        print(f"检测完成，统计结果: 正常={self.resultList[0]}, 划痕={self.resultList[1]}, 漏涂={self.resultList[2]}, "
+              f"失败={len(self.failed)}")
         self.finishSignal.emit(self.resultList)
 
-class DatabaseThread(QThread):
-    """数据库操作线程"""
-    finishSignal = pyqtSignal(bool)
-    
-    def __init__(self, picture_data, defect_data, parent=None):
-        super(DatabaseThread, self).__init__(parent)
-        self.picture_data = picture_data
-        self.defect_data = defect_data
-        
-    def run(self):
-        """运行数据库操作"""
-        try:
-            # 插入图片数据
-            picid = opration.insert_picture(
-                self.picture_data[0], 
-                int(self.picture_data[1]), 
-                self.picture_data[2]
-            )
-            
-            # 插入缺陷数据
-            for defect in self.defect_data:
-                defect[0] = picid
-                opration.insert_defect(*defect)
-                
-            self.finishSignal.emit(True)
-        except Exception as e:
-            print(f"数据库操作失败: {e}")
-            self.finishSignal.emit(False) 
-
 class NewMainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -197,12 +193,25 @@ class NewMainWindow(QMainWindow):
         self.current_image = None
         self.resultList = [0, 0, 0]
         self.detection_thread = None
-        self.database_thread = None
         self.isPause = False
         self.countPicture = 0
         self.rects = []
         self.db_picture = []
         self.db_defect = [[0 for i in range(6)] for i in range(116)]
+        # 区域分类的批大小（默认取config.ini中[inference]的配置）
+        self.batch_size = engine.batch_size if engine is not None else 32
+        # 是否在后台把候选区域保存到 data/detect（默认关闭，不影响检测流程）
+        self.save_crops = False
+        self.crop_writer = segment.CropWriter(os.path.join(current_dir, "data/detect"))
+        # 分割配置：候选区域提取方式 'contours'(轮廓)/'components'(连通域统计)，以及超宽图像的分块大小
+        self.segment_config = segment.read_segment_config()
+        # 中间结果缓存：原图、二值图、轮廓、检测结果，二值化/检测结果/定位图窗口直接复用
+        self.stage_cache = stage_cache.get_cache()
+        # 是否把二值图保存到 data/binary（默认关闭，显示时直接使用缓存）
+        self.save_binary = False
+        # 检测结果后台写入数据库（数据库不可用时暂存到 data/spool.sqlite，恢复后补写）
+        self.sink_config = result_sink.read_sink_config()
+        self.result_sink = result_sink.get_sink()
         
         # 图像显示窗口
         self.image_display_window = None
@@ -210,6 +219,11 @@ class NewMainWindow(QMainWindow):
         self.initUI()
         self.setupConnections()
         
+        # 状态栏每秒显示一次后台写入的队列深度、写入耗时与暂存情况
+        self.sink_timer = QTimer(self)
+        self.sink_timer.timeout.connect(self.updateSinkStatus)
+        self.sink_timer.start(1000)
+        
         # 窗口居中
         self.centerWindow()
         
@@ -631,8 +645,8 @@ class NewMainWindow(QMainWindow):
     def loadImage(self, file_path):
         """加载图像"""
         try:
-            # 读取图像
-            image = cv2.imread(file_path)
+            # 读取图像（解码结果进入缓存，检测与结果显示时复用）
+            image = self.stage_cache.image(file_path)
             if image is None:
                 raise Exception("无法读取图像文件")
                 
@@ -654,6 +668,13 @@ class NewMainWindow(QMainWindow):
             self.image_display.setPixmap(scaled_pixmap)
             self.current_image = file_path
             
+            # 已检测过的图像直接恢复缓存的检测结果
+            cached = self.stage_cache.get(file_path, 'detections', self.detectionParams())
+            if cached is not None:
+                self.resultList = list(cached[0])
+                self.current_detection_results = cached[1]
+                self.updateResultDisplay()
+            
         except Exception as e:
             QMessageBox.warning(self, "错误", f"加载图像失败: {str(e)}")
             
@@ -667,119 +688,99 @@ class NewMainWindow(QMainWindow):
         self.resultList = [0, 0, 0]
         self.updateResultDisplay()
         
-        # 读取当前图像
-        src = cv2.imread(self.current_image)
+        # 读取当前图像（中间结果缓存，加载时已解码过）
+        src = self.stage_cache.image(self.current_image)
         if src is None:
             QMessageBox.warning(self, "错误", "无法读取当前图像")
             return
             
         try:
-            # 1. 对大图进行二值化和轮廓检测
-            gray = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)
-            ret, binary = cv2.threshold(gray, 39, 255, cv2.THRESH_BINARY_INV)
-            se = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3), (-1, -1))
-            binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, se)
-            binary = cv2.erode(binary, se, iterations=2)
-            binary = cv2.dilate(binary, se, iterations=3)
-            binary = cv2.dilate(binary, se, iterations=1)
-            binary = cv2.erode(binary, se, iterations=2)
-            binary = cv2.dilate(binary, se, iterations=1)
-            
-            # 保存二值化图像
-            binary_dir = os.path.join(current_dir, "data/binary")
-            os.makedirs(binary_dir, exist_ok=True)
-            current_filename = os.path.splitext(os.path.basename(self.current_image))[0]
-            binary_path = os.path.join(binary_dir, f"{current_filename}_binary.bmp")
-            cv2.imwrite(binary_path, binary)
-            
-            # 2. 查找轮廓并筛选
-            contours, hierarchy = cv2.findContours(binary, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-            height, width = src.shape[:2]
-            rects = []
-            
-            # 轮廓筛选 - 使用demo.py的参数
-            index = 1
-            for c in range(len(contours)):
-                x, y, w, h = cv2.boundingRect(contours[c])
-                area = cv2.contourArea(contours[c])
-                if h > (height//2):
-                    continue
-                if area < 800:
-                    continue
-                if area > 150000:
-                    continue
-                if w/h > 3:
-                    continue
-                if h/w > 3:
-                    continue
-                rects.append([x, y, w, h])
-                
-                # 保存检测到的区域
-                detect_dir = os.path.join(current_dir, "data/detect")
-                os.makedirs(detect_dir, exist_ok=True)
-                recimg = src[y:y + h, x:x + w]
-                cv2.imwrite(os.path.join(detect_dir, f"region_{index}.png"), recimg)
-                index += 1
-            
-            self.addInfo(f"检测到 {len(rects)} 个可能的缺陷区域")
-            
-            # 3. 对每个缺陷区域进行分类
-            image_path = os.path.join(current_dir, "data/detect")
-            filepath = glob.glob(os.path.join(image_path, "*.png"))
-            filepath = sorted(filepath, key=os.path.getctime)
-            
+            # 1. 对大图进行二值化和轮廓检测（结果进入缓存，二值化图像窗口直接复用）
+            binary = self.stage_cache.binary(self.current_image, self.segment_config)
+            
+            # 可选：保存二值化图像
+            if self.save_binary:
+                binary_dir = os.path.join(current_dir, "data/binary")
+                os.makedirs(binary_dir, exist_ok=True)
+                current_filename = os.path.splitext(os.path.basename(self.current_image))[0]
+                binary_path = os.path.join(binary_dir, f"{current_filename}_binary.bmp")
+                cv2.imwrite(binary_path, binary)
+            
+            # 2. 查找轮廓并筛选 - 使用demo.py的参数（轮廓统计来自缓存，只改筛选规则时不重新提取）
+            candidate_stats = {}
+            rects = self.stage_cache.candidates(self.current_image, self.segment_config, segment.DEFAULT_RULES,
+                                                candidate_stats)
+            crops = segment.crop_regions(src, rects)
+            
+            # 可选：在后台把检测到的区域保存到 data/detect
+            if self.save_crops:
+                self.crop_writer.save(crops)
+            
+            self.addInfo(f"检测到 {len(rects)} 个可能的缺陷区域 (重复的内轮廓: {candidate_stats['duplicates']})")
+            
+            # 3. 对每个缺陷区域进行分类（区域直接在内存中传给分类器，顺序与rects一致）
             defect_count = 0
             self.current_detection_results = []
             
-            for i in range(len(filepath)):
-                try:
-                    # 对每个缺陷区域进行分类
-                    img = Image.open(filepath[i])
-                    img = data_transform(img)
-                    img = torch.unsqueeze(img, dim=0)
-                    
-                    with torch.no_grad():
-                        result = model(img)
-                        result = torch.squeeze(result)
-                        predict = torch.softmax(result, dim=0)
-                        predict_cla = torch.argmax(predict).numpy()
-                        confidence = predict[predict_cla].item()
+            # 所有区域按批组合后统一分类，每批只做一次前向推理
+            predictions = {}
+            try:
+                classes, probs = engine.classify(crops, batch_size=self.batch_size)
+                predictions = {i: (int(cla), float(prob)) for i, (cla, prob) in enumerate(zip(classes, probs))}
+            except Exception as e:
+                print(f"批量分类时出错: {e}")
+            
+            for i in range(len(rects)):
+                if i not in predictions:
+                    print(f"分类区域 {i+1} 时出错")
+                    self.resultList[0] += 1  # 分类失败时归类为正常
+                    continue
                     
-                    # 根据分类结果统计
-                    if predict_cla in [0, 1, 2, 3, 5, 7]:  # 正常类别
-                        self.resultList[0] += 1
-                    elif predict_cla == 4:  # 漏涂
-                        self.resultList[2] += 1
-                        defect_count += 1
-                        # 保存检测结果用于图像生成
-                        if i < len(rects):
-                            x, y, w, h = rects[i]
-                            self.current_detection_results.append([x, y, w, h, 2, confidence])  # 2表示漏涂
-                    elif predict_cla == 6:  # 划痕
-                        self.resultList[1] += 1
-                        defect_count += 1
-                        # 保存检测结果用于图像生成
-                        if i < len(rects):
-                            x, y, w, h = rects[i]
-                            self.current_detection_results.append([x, y, w, h, 1, confidence])  # 1表示划痕
-                    else:
-                        self.resultList[0] += 1
-                        
-                    class_name = class_indices.get(str(predict_cla), f"未知类别{predict_cla}")
-                    self.addInfo(f"区域 {i+1}: {class_name} (置信度: {confidence:.4f})")
+                predict_cla, confidence = predictions[i]
+                
+                # 根据分类结果统计
+                if predict_cla in [0, 1, 2, 3, 5, 7]:  # 正常类别
+                    self.resultList[0] += 1
+                elif predict_cla == 4:  # 漏涂
+                    self.resultList[2] += 1
+                    defect_count += 1
+                    # 保存检测结果用于图像生成
+                    x, y, w, h = rects[i]
+                    self.current_detection_results.append([x, y, w, h, 2, confidence])  # 2表示漏涂
+                elif predict_cla == 6:  # 划痕
+                    self.resultList[1] += 1
+                    defect_count += 1
+                    # 保存检测结果用于图像生成
+                    x, y, w, h = rects[i]
+                    self.current_detection_results.append([x, y, w, h, 1, confidence])  # 1表示划痕
+                else:
+                    self.resultList[0] += 1
                     
-                except Exception as e:
-                    print(f"分类区域 {i+1} 时出错: {e}")
-                    self.resultList[0] += 1  # 分类失败时归类为正常
+                class_name = class_indices.get(str(predict_cla), f"未知类别{predict_cla}")
+                self.addInfo(f"区域 {i+1}: {class_name} (置信度: {confidence:.4f})")
+            
+            # 缓存本图的检测结果，切换回该图时直接恢复
+            self.stage_cache.put(self.current_image, 'detections',
+                                 (list(self.resultList), self.current_detection_results), self.detectionParams())
             
             # 更新显示
             self.updateResultDisplay()
             self.addInfo(f"检测完成 - 检测到 {defect_count} 个缺陷，正常:{self.resultList[0]}, 划痕:{self.resultList[1]}, 漏涂:{self.resultList[2]}")
             
+            # 自动保存：检测完成即提交到后台写入，不等待数据库
+            if self.sink_config['auto_save']:
+                self.submitResults()
+            
         except Exception as e:
             self.addInfo(f"检测失败: {str(e)}")
             QMessageBox.warning(self, "错误", f"检测失败: {str(e)}")
         
+    def detectionParams(self):
+        """检测结果依赖的处理参数（分割参数 + 筛选规则 + 模型权重），作为检测结果的缓存键"""
+        model_id = (engine.backend, engine.weight_path) if engine is not None else None
+        return stage_cache.contour_params(self.segment_config) + (
+            tuple(segment.DEFAULT_RULES.items()), self.segment_config['suppress_nested'], model_id)
+        
     def pauseDetection(self):
         """暂停/继续检测"""
         if self.detection_thread and self.detection_thread.isRunning():
@@ -801,6 +802,10 @@ class NewMainWindow(QMainWindow):
         self.progress_bar.setVisible(False)
         self.addInfo(f"检测完成 - 正常: {result_list[0]}, 缺陷: {result_list[1] + result_list[2]}")
         
+    def onDetectionError(self, file_path, message):
+        """单张图片检测失败回调（该图片不计入统计）"""
+        self.addInfo(f"检测失败: {os.path.basename(file_path)} - {message}")
+        
     def updateProgress(self, value):
         """更新进度条"""
         self.progress_bar.setValue(value)
@@ -834,59 +839,28 @@ class NewMainWindow(QMainWindow):
             return
             
         try:
-            # 生成二值化图像文件路径 - 使用当前图像的文件名
-            current_filename = os.path.splitext(os.path.basename(self.current_image))[0]
-            binary_path = os.path.join(current_dir, "data/binary", f"{current_filename}_binary.bmp")
-            
-            # 每次都重新生成二值化图像
-            self.generateBinaryImage()
-            binary_path = os.path.join(current_dir, "data/binary", f"{current_filename}_binary.bmp")
-                
-            if os.path.exists(binary_path):
-                # 创建图像显示窗口
-                self.image_display_window = ImageDisplayWindow("二值化图像")
-                self.image_display_window.displayBinaryImage(binary_path)
-                self.image_display_window.show()
-                self.addInfo("已打开二值化图像窗口")
-            else:
-                QMessageBox.warning(self, "错误", "无法生成二值化图像")
+            # 二值图来自中间结果缓存，检测过的图像无需重新计算
+            binary = self.generateBinaryImage()
+            
+            # 创建图像显示窗口
+            self.image_display_window = ImageDisplayWindow("二值化图像")
+            self.image_display_window.displayArray(binary, "二值化图像")
+            self.image_display_window.show()
+            self.addInfo("已打开二值化图像窗口")
                 
         except Exception as e:
             QMessageBox.warning(self, "错误", f"显示二值化图像失败: {str(e)}")
             
     def generateBinaryImage(self):
-        """生成二值化图像 - 使用原始代码的参数和逻辑"""
+        """生成二值化图像 - 使用原始代码的参数和逻辑，返回二值图（优先取缓存）"""
         try:
-            # 读取原始图像
-            image = cv2.imread(self.current_image)
-            if image is None:
+            # 灰度化、二值化与形态学处理 - 使用原始代码的参数
+            binary = self.stage_cache.binary(self.current_image, self.segment_config)
+            if binary is None:
                 raise Exception("无法读取原始图像")
-                
-            # 转换为灰度图
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # 使用原始代码的二值化参数
-            ret, binary = cv2.threshold(gray, 39, 255, cv2.THRESH_BINARY_INV)
-            
-            # 形态学处理 - 参考原始代码
-            se = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3), (-1, -1))
-            binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, se)
-            binary = cv2.erode(binary, se, iterations=2)
-            binary = cv2.dilate(binary, se, iterations=3)
-            binary = cv2.dilate(binary, se, iterations=1)
-            binary = cv2.erode(binary, se, iterations=2)
-            binary = cv2.dilate(binary, se, iterations=1)
-            
-            # 保存二值化图像 - 使用当前图像的文件名
-            binary_dir = os.path.join(current_dir, "data/binary")
-            os.makedirs(binary_dir, exist_ok=True)
-            
-            # 使用当前图像的文件名作为基础
-            current_filename = os.path.splitext(os.path.basename(self.current_image))[0]
-            binary_path = os.path.join(binary_dir, f"{current_filename}_binary.bmp")
-            cv2.imwrite(binary_path, binary)
             
-            self.addInfo(f"已生成二值化图像: {os.path.basename(binary_path)}")
+            self.addInfo(f"已生成二值化图像: {os.path.basename(self.current_image)}")
+            return binary
             
         except Exception as e:
             raise Exception(f"生成二值化图像失败: {str(e)}")
@@ -898,22 +872,14 @@ class NewMainWindow(QMainWindow):
             return
             
         try:
-            # 生成检测结果图像文件路径 - 使用当前图像的文件名
-            current_filename = os.path.splitext(os.path.basename(self.current_image))[0]
-            result_path = os.path.join(current_dir, "data/binary", f"{current_filename}_detection_result.bmp")
-            
-            # 每次都重新生成检测结果图像
-            self.generateDetectionResult()
-            result_path = os.path.join(current_dir, "data/binary", f"{current_filename}_detection_result.bmp")
-                
-            if os.path.exists(result_path):
-                # 创建图像显示窗口
-                self.image_display_window = ImageDisplayWindow("缺陷检测结果")
-                self.image_display_window.displayDetectionResult(result_path)
-                self.image_display_window.show()
-                self.addInfo("已打开缺陷检测结果窗口")
-            else:
-                QMessageBox.warning(self, "错误", "无法生成检测结果图像")
+            # 在缓存的原图上标注，直接显示，不再写入、读回BMP文件
+            result_image = self.generateDetectionResult()
+            
+            # 创建图像显示窗口
+            self.image_display_window = ImageDisplayWindow("缺陷检测结果")
+            self.image_display_window.displayArray(result_image, "缺陷检测结果")
+            self.image_display_window.show()
+            self.addInfo("已打开缺陷检测结果窗口")
                 
         except Exception as e:
             QMessageBox.warning(self, "错误", f"显示检测结果失败: {str(e)}")
@@ -921,12 +887,12 @@ class NewMainWindow(QMainWindow):
     def generateDetectionResult(self):
         """生成检测结果图像"""
         try:
-            # 读取原始图像
-            src = cv2.imread(self.current_image)
+            # 读取原始图像（缓存）
+            src = self.stage_cache.image(self.current_image)
             if src is None:
                 raise Exception("无法读取原始图像")
                 
-            # 创建检测结果图像
+            # 创建检测结果图像（缓存中的原图不能原地修改）
             result_image = src.copy()
             
             # 根据检测结果在原图上标注缺陷区域
@@ -951,15 +917,8 @@ class NewMainWindow(QMainWindow):
                     cv2.putText(result_image, label, (x, y - 10), 
                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
             
-            # 保存检测结果图像
-            result_dir = os.path.join(current_dir, "data/binary")
-            os.makedirs(result_dir, exist_ok=True)
-            
-            current_filename = os.path.splitext(os.path.basename(self.current_image))[0]
-            result_path = os.path.join(result_dir, f"{current_filename}_detection_result.bmp")
-            cv2.imwrite(result_path, result_image)
-            
-            self.addInfo(f"已生成检测结果图像: {os.path.basename(result_path)}")
+            self.addInfo(f"已生成检测结果图像: {os.path.basename(self.current_image)}")
+            return result_image
             
         except Exception as e:
             raise Exception(f"生成检测结果图像失败: {str(e)}")
@@ -971,22 +930,14 @@ class NewMainWindow(QMainWindow):
             return
             
         try:
-            # 生成定位结果图像文件路径 - 使用当前图像的文件名
-            current_filename = os.path.splitext(os.path.basename(self.current_image))[0]
-            location_path = os.path.join(current_dir, "data/binary", f"{current_filename}_location_result.bmp")
-            
-            # 每次都重新生成定位结果图像
-            self.generateLocationResult()
-            location_path = os.path.join(current_dir, "data/binary", f"{current_filename}_location_result.bmp")
-                
-            if os.path.exists(location_path):
-                # 创建图像显示窗口
-                self.image_display_window = ImageDisplayWindow("缺陷定位图")
-                self.image_display_window.displayLocationResult(location_path)
-                self.image_display_window.show()
-                self.addInfo("已打开缺陷定位图窗口")
-            else:
-                QMessageBox.warning(self, "错误", "无法生成定位结果图像")
+            # 在缓存的原图上标注，直接显示，不再写入、读回BMP文件
+            location_image = self.generateLocationResult()
+            
+            # 创建图像显示窗口
+            self.image_display_window = ImageDisplayWindow("缺陷定位图")
+            self.image_display_window.displayArray(location_image, "缺陷定位图")
+            self.image_display_window.show()
+            self.addInfo("已打开缺陷定位图窗口")
                 
         except Exception as e:
             QMessageBox.warning(self, "错误", f"显示定位结果失败: {str(e)}")
@@ -994,12 +945,12 @@ class NewMainWindow(QMainWindow):
     def generateLocationResult(self):
         """生成定位结果图像 - 显示所有检测到的缺陷区域"""
         try:
-            # 读取原始图像
-            src = cv2.imread(self.current_image)
+            # 读取原始图像（缓存）
+            src = self.stage_cache.image(self.current_image)
             if src is None:
                 raise Exception("无法读取原始图像")
                 
-            # 创建定位结果图像
+            # 创建定位结果图像（缓存中的原图不能原地修改）
             location_image = src.copy()
             
             # 显示所有检测到的缺陷区域（绿色框）
@@ -1018,16 +969,9 @@ class NewMainWindow(QMainWindow):
                     cv2.putText(location_image, label, (x, y - 10), 
                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
             
-            # 保存定位结果图像
-            result_dir = os.path.join(current_dir, "data/binary")
-            os.makedirs(result_dir, exist_ok=True)
-            
-            current_filename = os.path.splitext(os.path.basename(self.current_image))[0]
-            location_path = os.path.join(result_dir, f"{current_filename}_location_result.bmp")
-            cv2.imwrite(location_path, location_image)
-            
             defect_count = len(self.current_detection_results) if hasattr(self, 'current_detection_results') else 0
-            self.addInfo(f"已生成定位结果图像: {os.path.basename(location_path)} (检测到 {defect_count} 个缺陷区域)")
+            self.addInfo(f"已生成定位结果图像: {os.path.basename(self.current_image)} (检测到 {defect_count} 个缺陷区域)")
+            return location_image
             
         except Exception as e:
             raise Exception(f"生成定位结果图像失败: {str(e)}")
@@ -1039,20 +983,13 @@ class NewMainWindow(QMainWindow):
                 return
                 
             # 使用模型预测当前图像
-            img = Image.open(self.current_image)
-            img = data_transform(img)
-            img = torch.unsqueeze(img, dim=0)
-            
-            with torch.no_grad():
-                result = model(img)
-                result = torch.squeeze(result)
-                predict = torch.softmax(result, dim=0)
-                predict_cla = torch.argmax(predict).numpy()
-                confidence = predict[predict_cla].item()
+            image = self.stage_cache.image(self.current_image)
+            classes, probs = engine.classify([image])
+            predict_cla = int(classes[0])
+            confidence = float(probs[0])
             
             # 模拟缺陷位置（实际应用中应该从模型输出中获取）
             # 这里使用图像中心作为示例
-            image = cv2.imread(self.current_image)
             height, width = image.shape[:2]
             
             self.current_detection_results = []
@@ -1086,50 +1023,12 @@ class NewMainWindow(QMainWindow):
     def detectDefects(self, image):
         """缺陷检测 - 参考原始代码的detect方法"""
         try:
-            # 转换为灰度图
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # 使用原始代码的二值化参数
-            ret, binary = cv2.threshold(gray, 39, 255, cv2.THRESH_BINARY_INV)
-            
-            # 形态学处理 - 参考原始代码
-            se = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3), (-1, -1))
-            binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, se)
-            binary = cv2.erode(binary, se, iterations=2)
-            binary = cv2.dilate(binary, se, iterations=3)
-            binary = cv2.dilate(binary, se, iterations=1)
-            binary = cv2.erode(binary, se, iterations=2)
-            binary = cv2.dilate(binary, se, iterations=1)
-            
-            # 查找轮廓
-            contours, hierarchy = cv2.findContours(binary, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-            height, width = image.shape[:2]
+            # 灰度化、二值化与形态学处理 - 使用原始代码的参数
+            binary = segment.segment_binary(image, self.segment_config)
             
-            # 轮廓筛选 - 更严格的筛选条件
-            rects = []
-            for c in range(len(contours)):
-                # 轮廓外接矩形
-                x, y, w, h = cv2.boundingRect(contours[c])
-                # 轮廓面积
-                area = cv2.contourArea(contours[c])
-                
-                # 更严格的筛选条件
-                if h > (height // 3):  # 高度不能超过图像高度的1/3
-                    continue
-                if area < 1000:  # 最小面积增加到1000
-                    continue
-                if area > 50000:  # 最大面积减少到50000
-                    continue
-                if w / h > 2:  # 宽高比不能超过2:1
-                    continue
-                if h / w > 2:  # 高宽比不能超过2:1
-                    continue
-                if w < 30 or h < 30:  # 最小尺寸限制
-                    continue
-                if w > width // 4 or h > height // 4:  # 最大尺寸限制
-                    continue
-                    
-                rects.append([x, y, w, h])
+            # 查找轮廓并筛选 - 更严格的筛选条件
+            rects = segment.find_candidates(binary, segment.STRICT_RULES, self.segment_config['method'],
+                                            self.segment_config['suppress_nested'])
             
             return rects, binary
             
@@ -1163,6 +1062,28 @@ class NewMainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.warning(self, "错误", f"显示统计结果失败: {str(e)}")
             
+    def buildDbRecords(self):
+        """根据当前图像的检测结果生成图片与缺陷记录（缺陷数据的第一列是占位的图片id，写入时由新插入的图片id代替）"""
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        num = self.resultList[1] + self.resultList[2]  # 缺陷总数
+        self.db_picture = [self.current_image, num, now]
+        
+        self.db_defect = []
+        for defect_info in getattr(self, 'current_detection_results', []):
+            x, y, w, h, defect_type, confidence = defect_info
+            if defect_type == 1:  # 划痕缺陷
+                self.db_defect.append([0, self.current_image, "划痕(class7NG)", confidence, f"位置({x},{y},{w},{h})", now])
+            elif defect_type == 2:  # 漏涂缺陷
+                self.db_defect.append([0, self.current_image, "漏涂(class5NG)", confidence, f"位置({x},{y},{w},{h})", now])
+        return self.db_picture, self.db_defect
+        
+    def submitResults(self):
+        """把当前图像的检测结果提交到后台写入（立即返回），返回 (是否进入写入队列, 缺陷数)"""
+        picture, defects = self.buildDbRecords()
+        queued = self.result_sink.submit(picture[0], picture[1], picture[2], [defect[1:] for defect in defects])
+        self.addInfo(f"检测结果已提交保存: {len(defects)} 个缺陷" + ("" if queued else "（队列已满，已暂存到本地）"))
+        return queued, len(defects)
+        
     def saveToDatabase(self):
         """保存到数据库"""
         try:
@@ -1170,52 +1091,37 @@ class NewMainWindow(QMainWindow):
                 QMessageBox.warning(self, "提示", "请先选择图像文件")
                 return
                 
-            # 准备图片数据
-            num = self.resultList[1] + self.resultList[2]  # 缺陷总数
-            self.db_picture = [
-                self.current_image,
-                num,
-                datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            ]
-            
-            # 准备缺陷数据 - 根据实际检测结果
-            self.db_defect = []
-            
             # 检测当前图像
             if not hasattr(self, 'current_detection_results'):
                 self.detectCurrentImage()
             
-            # 根据检测结果生成缺陷数据
-            if hasattr(self, 'current_detection_results'):
-                for defect_info in self.current_detection_results:
-                    x, y, w, h, defect_type, confidence = defect_info
-                    
-                    if defect_type == 1:  # 划痕缺陷
-                        defect = [0, self.current_image, "划痕(class7NG)", confidence, f"位置({x},{y},{w},{h})", datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")]
-                        self.db_defect.append(defect)
-                        
-                    elif defect_type == 2:  # 漏涂缺陷
-                        defect = [0, self.current_image, "漏涂(class5NG)", confidence, f"位置({x},{y},{w},{h})", datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")]
-                        self.db_defect.append(defect)
-            
-            # 创建数据库线程
-            self.database_thread = DatabaseThread(self.db_picture, self.db_defect)
-            self.database_thread.finishSignal.connect(self.onDatabaseFinished)
-            self.database_thread.start()
-            
-            self.addInfo("正在保存到数据库...")
+            queued, count = self.submitResults()
+            if not queued:
+                QMessageBox.information(self, "已暂存", f"写入队列已满，检测结果（{count} 个缺陷）已暂存到本地，稍后自动补写数据库")
+            elif not self.result_sink.available:
+                QMessageBox.information(self, "已暂存", f"数据库暂不可用，检测结果（{count} 个缺陷）将暂存到本地，恢复后自动补写")
+            else:
+                QMessageBox.information(self, "已提交", f"检测结果（{count} 个缺陷）已提交，正在后台写入数据库")
             
         except Exception as e:
             QMessageBox.warning(self, "错误", f"保存到数据库失败: {str(e)}")
             
-    def onDatabaseFinished(self, success):
-        """数据库操作完成回调"""
-        if success:
-            QMessageBox.information(self, "提示", "数据已成功保存到数据库")
-            self.addInfo("数据保存成功")
-        else:
-            QMessageBox.warning(self, "错误", "数据保存失败")
-            self.addInfo("数据保存失败")
+    def updateSinkStatus(self):
+        """状态栏显示后台写入的运行指标"""
+        metrics = self.result_sink.metrics()
+        latency = metrics['flush_latency_ms']['p95']
+        speed = metrics['rows_per_sec']
+        text = (f"数据库: {'正常' if metrics['db_available'] else '不可用'} | "
+                f"待写入: {metrics['queue_depth']}/{metrics['queue_capacity']} | "
+                f"已写入: {metrics['written'] + metrics['replayed']} ({metrics['rows']} 行) | "
+                f"写入速度: {'-' if speed is None else f'{speed:.0f} 行/秒'} | "
+                f"写入耗时p95: {'-' if latency is None else f'{latency:.1f} ms'} | "
+                f"本地暂存: {metrics['spool_rows']} 条 ({metrics['spool_bytes'] / 1024:.0f} KB)")
+        if metrics['dead_rows']:
+            text += f" | 写入失败: {metrics['dead_rows']} 条"
+        if metrics['last_flush_error']:
+            text += f" | 最近写入错误: {metrics['last_flush_error'][:80]}"
+        self.statusBar().showMessage(text)
             
     def showHistory(self):
         """显示历史记录"""
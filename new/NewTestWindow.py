@@ -2,13 +2,128 @@ import sys
 import os
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLabel, QPushButton, QMessageBox, QFrame, QApplication,
-                             QGraphicsDropShadowEffect, QTableWidget, QTableWidgetItem,
-                             QHeaderView, QScrollArea)
-from PyQt5.QtCore import Qt, QPropertyAnimation, QEasingCurve
+                             QGraphicsDropShadowEffect, QTableView, QStyledItemDelegate, QStyle,
+                             QHeaderView, QScrollArea, QCheckBox, QDateEdit, QComboBox, QDoubleSpinBox)
+from PyQt5.QtCore import (Qt, QPropertyAnimation, QEasingCurve, QAbstractTableModel, QModelIndex, QEvent,
+                          pyqtSignal, QDate)
 from PyQt5.QtGui import QFont, QPixmap, QPainter, QColor, QLinearGradient, QPalette
-from opration import queryAll_picture
+from opration import query_picture_page, query_defect_page, PAGE_SIZE
 from NewDefectWindow import NewDefectWindow
 
+
+# 图片记录 / 缺陷记录两种列表的表头与列宽（图片路径列自动拉伸）
+PICTURE_HEADERS = ["ID", "图片路径", "缺陷数量", "检测时间", "操作"]
+PICTURE_WIDTHS = {0: 80, 2: 90, 3: 170, 4: 110}
+DEFECT_HEADERS = ["ID", "图片ID", "图片路径", "类别", "置信度", "位置", "检测时间", "操作"]
+DEFECT_WIDTHS = {0: 70, 1: 70, 3: 120, 4: 70, 5: 150, 6: 160, 7: 110}
+# 类别筛选：(显示文字, 数据库中的 cla)
+DEFECT_CLASSES = [("全部", None), ("划痕(class7NG)", "划痕(class7NG)"), ("漏涂(class5NG)", "漏涂(class5NG)")]
+
+
+class HistoryTableModel(QAbstractTableModel):
+    """
+    检测历史的表格模型：只保存已读取的行，滚动到底部时视图调用 fetchMore 再从数据库读取一页
+    fetch_page(before, limit): 按 (createtime, id) 从新到旧查询一页，每行第一列为 id、最后一列为 createtime；
+    最后一个表头为操作列，picture_column 为图片id所在的列
+    读取出错时发出 fetchFailed(错误信息)，暂停继续读取（不标记为已读完），调用 retry() 重新读取
+    """
+    fetchFailed = pyqtSignal(str)
+
+    def __init__(self, headers, fetch_page, picture_column=0, page_size=PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.headers = headers
+        self.fetch_page = fetch_page
+        self.picture_column = picture_column
+        self.page_size = page_size
+        self.rows = []
+        self.exhausted = False
+        self.error = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            if index.column() == len(self.headers) - 1:
+                return "查看详情"
+            value = self.rows[index.row()][index.column()]
+            return f"{value:.4f}" if isinstance(value, float) else str(value)
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        # 出错后不再自动读取（否则视图每次滚动都会重复查询不可用的数据库），等待 retry()
+        return not parent.isValid() and not self.exhausted and self.error is None
+
+    def fetchMore(self, parent=QModelIndex()):
+        """读取下一页（从上一页最后一行的 (createtime, id) 接着往前查）"""
+        if not self.canFetchMore(parent):
+            return
+        before = (self.rows[-1][-1], self.rows[-1][0]) if self.rows else None
+        try:
+            page = self.fetch_page(before, self.page_size)
+        except Exception as e:
+            print('读取历史记录失败:', e)
+            self.error = str(e)
+            self.fetchFailed.emit(self.error)
+            return
+        if len(page) < self.page_size:
+            self.exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+
+    def retry(self):
+        """清除错误，从已读取的最后一行接着读取"""
+        self.error = None
+        self.fetchMore()
+
+    def pictureId(self, row):
+        return self.rows[row][self.picture_column]
+
+
+class DetailButtonDelegate(QStyledItemDelegate):
+    """操作列：直接绘制“查看详情”按钮，点击时发出 clicked(行号)，不再为每一行创建一个 QPushButton"""
+    clicked = pyqtSignal(int)
+
+    def paint(self, painter, option, index):
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        rect = option.rect.adjusted(8, 8, -8, -8)
+        hover = bool(option.state & QStyle.State_MouseOver)
+        gradient = QLinearGradient(rect.left(), 0, rect.right(), 0)
+        gradient.setColorAt(0, QColor("#2980b9" if hover else "#3498db"))
+        gradient.setColorAt(1, QColor("#21618c" if hover else "#2980b9"))
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(gradient)
+        painter.drawRoundedRect(rect, 6, 6)
+        font = QFont("Microsoft YaHei", 8)
+        font.setBold(True)
+        painter.setFont(font)
+        painter.setPen(QColor("white"))
+        painter.drawText(rect, Qt.AlignCenter, index.data())
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton \
+                and option.rect.contains(event.pos()):
+            self.clicked.emit(index.row())
+            return True
+        return super().editorEvent(event, model, option, index)
+
+
 class NewTestWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -17,7 +132,6 @@ class NewTestWindow(QMainWindow):
         self.setWindowFlags(Qt.Window)
         
         # 初始化变量
-        self.search_buttons = []
         self.select_pic = 0
         self.defect_window = None
         
@@ -49,6 +163,36 @@ class NewTestWindow(QMainWindow):
         """)
         main_layout.addWidget(title_label)
         
+        # 筛选条件：选择类别或置信度时列出符合条件的缺陷，否则列出图片；条件在数据库中执行
+        filter_layout = QHBoxLayout()
+        self.date_check = QCheckBox("检测日期")
+        self.start_edit = QDateEdit(QDate.currentDate().addDays(-7))
+        self.end_edit = QDateEdit(QDate.currentDate())
+        for edit in (self.start_edit, self.end_edit):
+            edit.setCalendarPopup(True)
+            edit.setDisplayFormat("yyyy-MM-dd")
+        self.class_combo = QComboBox()
+        for text, cla in DEFECT_CLASSES:
+            self.class_combo.addItem(text, cla)
+        # 置信度范围 [最小, 最大)，0 与 1 表示不限
+        self.min_prob_spin = QDoubleSpinBox()
+        self.max_prob_spin = QDoubleSpinBox()
+        for spin, value in ((self.min_prob_spin, 0.0), (self.max_prob_spin, 1.0)):
+            spin.setRange(0.0, 1.0)
+            spin.setSingleStep(0.05)
+            spin.setDecimals(2)
+            spin.setValue(value)
+        search_btn = QPushButton("查询")
+        search_btn.clicked.connect(self.searchHistory)
+        reset_btn = QPushButton("重置")
+        reset_btn.clicked.connect(self.resetFilters)
+        for widget in (self.date_check, self.start_edit, QLabel("至"), self.end_edit, QLabel("类别"),
+                       self.class_combo, QLabel("置信度"), self.min_prob_spin, QLabel("~"), self.max_prob_spin,
+                       search_btn, reset_btn):
+            filter_layout.addWidget(widget)
+        filter_layout.addStretch()
+        main_layout.addLayout(filter_layout)
+        
         # 表格容器
         table_frame = QFrame()
         table_frame.setObjectName("tableFrame")
@@ -70,10 +214,13 @@ class NewTestWindow(QMainWindow):
         table_layout = QVBoxLayout(table_frame)
         table_layout.setContentsMargins(20, 20, 20, 20)
         
-        # 创建表格
-        self.table_widget = QTableWidget()
+        # 创建表格（模型按页读取数据，操作列由委托绘制）
+        self.model = None
+        self.detail_delegate = DetailButtonDelegate(self)
+        self.detail_delegate.clicked.connect(self.showDefectDetail)
+        self.table_widget = QTableView()
         self.table_widget.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 background: white;
                 border: 2px solid #bdc3c7;
                 border-radius: 10px;
@@ -81,11 +228,11 @@ class NewTestWindow(QMainWindow):
                 font-family: 'Microsoft YaHei';
                 font-size: 12px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 8px;
                 border-bottom: 1px solid #ecf0f1;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
                     stop:0 #667eea, stop:1 #764ba2);
                 color: white;
@@ -104,10 +251,25 @@ class NewTestWindow(QMainWindow):
         
         # 设置表格属性
         self.table_widget.setAlternatingRowColors(True)
-        self.table_widget.setSelectionBehavior(QTableWidget.SelectRows)
-        self.table_widget.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table_widget.setSelectionBehavior(QTableView.SelectRows)
+        self.table_widget.setEditTriggers(QTableView.NoEditTriggers)
+        self.table_widget.setMouseTracking(True)  # 按钮的悬停效果
+        self.table_widget.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table_widget.verticalHeader().setDefaultSectionSize(50)
         
         table_layout.addWidget(self.table_widget)
+        
+        # 读取出错时显示错误与重试按钮（已读取的记录保留）
+        error_layout = QHBoxLayout()
+        self.error_label = QLabel()
+        self.error_label.setStyleSheet("color: #e74c3c; font-family: 'Microsoft YaHei'; font-size: 13px;")
+        self.error_label.setWordWrap(True)
+        self.retry_btn = QPushButton("重试")
+        self.retry_btn.clicked.connect(self.retryFetch)
+        error_layout.addWidget(self.error_label, 1)
+        error_layout.addWidget(self.retry_btn)
+        table_layout.addLayout(error_layout)
+        self.showFetchError(None)
         main_layout.addWidget(table_frame)
         
         # 底部按钮区域
@@ -140,104 +302,99 @@ class NewTestWindow(QMainWindow):
         main_layout.addLayout(button_layout)
         
     def loadHistoryData(self):
-        """加载历史数据"""
+        """加载历史数据：只读取第一页，其余的在滚动到底部时再读取"""
         try:
-            # 获取所有图片记录
-            results = queryAll_picture()
-            
-            if not results:
+            self.applyFilters()
+            if self.model.error is None and self.model.rowCount() == 0:
                 QMessageBox.information(self, "提示", "暂无检测历史记录")
-                return
                 
-            # 设置表格行列数
-            self.table_widget.setRowCount(len(results))
-            self.table_widget.setColumnCount(5)
-            
-            # 设置表头
-            headers = ["ID", "图片路径", "缺陷数量", "检测时间", "操作"]
-            self.table_widget.setHorizontalHeaderLabels(headers)
-            
-            # 填充数据
-            for index, value in enumerate(results):
-                # 数据库返回5列：id, url, num, createtime, created_at
-                # 我们只需要前4列
-                id_val, url, num, createtime, created_at = value
-                
-                # ID列
-                id_item = QTableWidgetItem(str(id_val))
-                id_item.setTextAlignment(Qt.AlignCenter)
-                self.table_widget.setItem(index, 0, id_item)
-                
-                # 图片路径列
-                url_item = QTableWidgetItem(url)
-                url_item.setTextAlignment(Qt.AlignCenter)
-                self.table_widget.setItem(index, 1, url_item)
-                
-                # 缺陷数量列
-                num_item = QTableWidgetItem(str(num))
-                num_item.setTextAlignment(Qt.AlignCenter)
-                self.table_widget.setItem(index, 2, num_item)
-                
-                # 检测时间列
-                time_item = QTableWidgetItem(str(createtime))
-                time_item.setTextAlignment(Qt.AlignCenter)
-                self.table_widget.setItem(index, 3, time_item)
-                
-                # 操作按钮列
-                detail_btn = QPushButton("查看详情")
-                detail_btn.setObjectName(f"detailBtn_{index}")
-                detail_btn.setStyleSheet("""
-                    QPushButton {
-                        background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
-                            stop:0 #3498db, stop:1 #2980b9);
-                        border: none;
-                        border-radius: 6px;
-                        color: white;
-                        font-size: 11px;
-                        font-weight: bold;
-                        font-family: 'Microsoft YaHei';
-                        padding: 6px 12px;
-                        margin: 2px;
-                    }
-                    QPushButton:hover {
-                        background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
-                            stop:0 #2980b9, stop:1 #21618c);
-                    }
-                """)
-                
-                # 连接按钮信号
-                detail_btn.clicked.connect(lambda checked, row=index: self.showDefectDetail(row))
-                
-                self.table_widget.setCellWidget(index, 4, detail_btn)
-                self.search_buttons.append(detail_btn)
-                
-            # 调整列宽
-            header = self.table_widget.horizontalHeader()
-            header.setSectionResizeMode(0, QHeaderView.ResizeToContents)  # ID列
-            header.setSectionResizeMode(1, QHeaderView.Stretch)  # 路径列
-            header.setSectionResizeMode(2, QHeaderView.ResizeToContents)  # 数量列
-            header.setSectionResizeMode(3, QHeaderView.ResizeToContents)  # 时间列
-            header.setSectionResizeMode(4, QHeaderView.ResizeToContents)  # 操作列
-            
-            # 调整行高
-            self.table_widget.verticalHeader().setDefaultSectionSize(50)
-            
         except Exception as e:
             QMessageBox.critical(self, "错误", f"加载历史数据失败: {str(e)}")
             
+    def applyFilters(self):
+        """按筛选条件重新查询（只读取第一页）"""
+        start, end = None, None
+        if self.date_check.isChecked():
+            start = self.start_edit.date().toPyDate()
+            end = self.end_edit.date().addDays(1).toPyDate()  # 包含结束日期当天
+        cla = self.class_combo.currentData()
+        min_prob = self.min_prob_spin.value() if self.min_prob_spin.value() > 0 else None
+        max_prob = self.max_prob_spin.value() if self.max_prob_spin.value() < 1 else None
+        
+        if cla is None and min_prob is None and max_prob is None:
+            model = HistoryTableModel(PICTURE_HEADERS, lambda before, limit: query_picture_page(
+                start, end, before, limit), parent=self)
+            self.setHistoryModel(model, PICTURE_WIDTHS, stretch=1)
+        else:
+            model = HistoryTableModel(DEFECT_HEADERS, lambda before, limit: query_defect_page(
+                start, end, cla, min_prob, max_prob, before, limit), picture_column=1, parent=self)
+            self.setHistoryModel(model, DEFECT_WIDTHS, stretch=2)
+        model.fetchMore()
+        
+    def searchHistory(self):
+        """查询按钮"""
+        try:
+            self.applyFilters()
+            if self.model.error is None and self.model.rowCount() == 0:
+                QMessageBox.information(self, "提示", "没有符合条件的记录")
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"查询历史数据失败: {str(e)}")
+            
+    def resetFilters(self):
+        """清除筛选条件，列出全部图片"""
+        self.date_check.setChecked(False)
+        self.class_combo.setCurrentIndex(0)
+        self.min_prob_spin.setValue(0.0)
+        self.max_prob_spin.setValue(1.0)
+        self.applyFilters()
+        
+    def setHistoryModel(self, model, widths, stretch):
+        """切换表格的模型：操作列使用按钮委托；列宽、行高固定，不随已读取的行数重新计算（ResizeToContents 需要遍历所有行）"""
+        if self.model is not None:
+            self.table_widget.setItemDelegateForColumn(len(self.model.headers) - 1, None)
+        selection = self.table_widget.selectionModel()
+        self.table_widget.setModel(model)
+        if selection is not None:
+            selection.deleteLater()
+        if self.model is not None:
+            self.model.deleteLater()
+        self.model = model
+        self.table_widget.setItemDelegateForColumn(len(model.headers) - 1, self.detail_delegate)
+        model.fetchFailed.connect(self.showFetchError)
+        self.showFetchError(None)
+        
+        header = self.table_widget.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Fixed)
+        header.setSectionResizeMode(stretch, QHeaderView.Stretch)  # 路径列
+        for column, width in widths.items():
+            self.table_widget.setColumnWidth(column, width)
+            
+    def showFetchError(self, message):
+        """显示读取历史记录的错误（message 为 None 时隐藏）"""
+        if message is None:
+            self.error_label.hide()
+            self.retry_btn.hide()
+            return
+        self.error_label.setText(f"读取历史记录失败（已读取 {self.model.rowCount()} 条）: {message}")
+        self.error_label.show()
+        self.retry_btn.show()
+        
+    def retryFetch(self):
+        """重试按钮：从已读取的最后一行接着读取"""
+        self.showFetchError(None)
+        self.model.retry()
+        
     def showDefectDetail(self, row):
         """显示缺陷详情"""
         try:
             # 获取选中行的ID
-            id_item = self.table_widget.item(row, 0)
-            if id_item:
-                pic_id = int(id_item.text())
-                self.select_pic = pic_id
-                
-                # 创建缺陷详情窗口
-                self.defect_window = NewDefectWindow(pic_id)
-                self.defect_window.setWindowTitle("缺陷检测详情")
-                self.defect_window.show()
+            pic_id = self.model.pictureId(row)
+            self.select_pic = pic_id
+            
+            # 创建缺陷详情窗口
+            self.defect_window = NewDefectWindow(pic_id)
+            self.defect_window.setWindowTitle("缺陷检测详情")
+            self.defect_window.show()
                 
         except Exception as e:
             QMessageBox.critical(self, "错误", f"显示缺陷详情失败: {str(e)}")
@@ -0,0 +1,530 @@
+"""
+性能基准与一致性校验脚本
+
+用法:
+    python benchmark.py morph [--size 8000] [--repeat 3] [--image data/Img/1.bmp]
+    python benchmark.py candidates [--size 4000] [--noise 0.02]
+    python benchmark.py tiles [--height 8000] [--width 16000] [--tile 2048] [--workers 8]
+    python benchmark.py stream [--height 16000] [--width 8192] [--strip 512]
+    python benchmark.py prescreen [--size 8000] [--defects 5] [--image data/Img/1.bmp]
+    python benchmark.py train-scaling [--procs 1 2 4 8] [--epochs 2] [--mode features]
+    python benchmark.py db [--ops 1000]
+    python benchmark.py db-save [--defects 200] [--repeat 10]
+    python benchmark.py db-query [--rows 10000000] [--repeat 3] [--pages 20] [--drop]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+
+import segment
+
+
+def synthetic_image(height, width, seed=0):
+    """生成带随机暗斑的合成隔膜图像（BGR），用于基准测试"""
+    rng = np.random.default_rng(seed)
+    gray = rng.integers(40, 90, (height, width), dtype=np.uint8)
+    # 随机暗色缺陷：大小不一的圆斑
+    count = max(1, height * width // 200000)
+    for _ in range(count):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        cv2.circle(gray, (x, y), int(rng.integers(3, 60)), int(rng.integers(0, 45)), -1)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def timeit(func, repeat):
+    """返回多次运行中的最短耗时（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_morph(args):
+    """形态学处理链：逐像素一致性校验 + 耗时对比"""
+    # 1. 一致性校验（黄金结果为原始处理链）
+    images = [synthetic_image(h, w, seed=i) for i, (h, w) in
+              enumerate([(1, 1), (7, 13), (480, 640), (1001, 1537)])]
+    for path in args.image:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"无法读取图像: {path}")
+            return 1
+        images.append(image)
+
+    for image in images:
+        if not np.array_equal(segment.binarize(image), segment.binarize_reference(image)):
+            print(f"一致性校验失败: 尺寸 {image.shape[:2]}")
+            return 1
+    print(f"一致性校验通过: {len(images)} 张图像")
+
+    # 2. 耗时对比
+    image = synthetic_image(args.size, args.size)
+    out = np.empty(image.shape[:2], dtype=np.uint8)
+    tmp = np.empty_like(out)
+    t_ref = timeit(lambda: segment.binarize_reference(image), args.repeat)
+    t_new = timeit(lambda: segment.binarize(image), args.repeat)
+    t_buf = timeit(lambda: segment.binarize(image, out=out, tmp=tmp), args.repeat)
+    print(f"图像尺寸: {args.size}x{args.size}")
+    print(f"原始处理链:          {t_ref * 1000:.1f} ms")
+    print(f"合并核处理链:        {t_new * 1000:.1f} ms ({t_ref / t_new:.2f}x)")
+    print(f"合并核+预分配缓冲区: {t_buf * 1000:.1f} ms ({t_ref / t_buf:.2f}x)")
+    return 0
+
+
+def bench_candidates(args):
+    """候选区域提取：轮廓方式与连通域方式的耗时对比（噪声图像）"""
+    rng = np.random.default_rng(0)
+    binary = (rng.random((args.size, args.size)) < args.noise).astype(np.uint8) * 255
+    binary = cv2.dilate(binary, np.ones((3, 3), np.uint8))
+    print(f"图像尺寸: {args.size}x{args.size}, 噪声比例: {args.noise}")
+    for method in segment.CANDIDATE_METHODS:
+        boxes, areas, nested = segment.CANDIDATE_METHODS[method](binary)
+        t = timeit(lambda: segment.find_candidates(binary, method=method), args.repeat)
+        print(f"{method:<12} 候选数: {len(boxes):>8}  耗时: {t * 1000:.1f} ms")
+    return 0
+
+
+def bench_tiles(args):
+    """分块多线程分割：与整图处理的候选矩形一致性校验 + 耗时对比"""
+    image = synthetic_image(args.height, args.width)
+    binary = segment.binarize(image)
+    tiled = segment.binarize_tiled(image, args.tile, args.workers)
+    if not np.array_equal(binary, tiled):
+        print("一致性校验失败: 分块二值图与整图不一致")
+        return 1
+    rects = segment.find_candidates(binary)
+    if rects != segment.find_candidates(tiled):
+        print("一致性校验失败: 候选矩形不一致")
+        return 1
+    print(f"一致性校验通过: {len(rects)} 个候选区域")
+
+    t_full = timeit(lambda: segment.binarize(image), args.repeat)
+    t_tile = timeit(lambda: segment.binarize_tiled(image, args.tile, args.workers), args.repeat)
+    print(f"图像尺寸: {args.height}x{args.width}, 块边长: {args.tile}, 线程数: {args.workers or '自动'}")
+    print(f"整图处理: {t_full * 1000:.1f} ms")
+    print(f"分块处理: {t_tile * 1000:.1f} ms ({t_full / t_tile:.2f}x)")
+    return 0
+
+
+def bench_stream(args):
+    """流式条带分割：与整图处理的候选矩形一致性校验 + 每条带处理耗时"""
+    import stream
+
+    image = synthetic_image(args.height, args.width)
+    full = sorted(segment.find_candidates(segment.binarize(image)))
+
+    segmenter = stream.StripSegmenter(ref_height=args.height)
+    rects = []
+    latencies = []
+    for y in range(0, args.height, args.strip):
+        start = time.perf_counter()
+        strip_rects, crops = segmenter.push(image[y:y + args.strip])
+        latencies.append(time.perf_counter() - start)
+        rects.extend(strip_rects)
+    rects.extend(segmenter.flush()[0])
+
+    if sorted(rects) != full:
+        print(f"一致性校验失败: 流式 {len(rects)} 个, 整图 {len(full)} 个")
+        return 1
+    print(f"一致性校验通过: {len(full)} 个候选区域")
+    latencies = np.array(latencies) * 1000
+    print(f"条带高度: {args.strip}, 条带数: {len(latencies)}")
+    print(f"每条带耗时: 平均 {latencies.mean():.1f} ms, 最大 {latencies.max():.1f} ms")
+    return bench_stream_vertical(args)
+
+
+def bench_stream_vertical(args):
+    """回归校验：贯穿整卷的纵向划痕不能让缓冲区与每条带耗时随卷长增长"""
+    import stream
+
+    image = synthetic_image(args.height, args.width, seed=1)
+    cv2.line(image, (args.width // 2, 0), (args.width // 2, args.height - 1), (0, 0, 0), 5)
+
+    segmenter = stream.StripSegmenter()
+    latencies = []
+    max_rows = 0
+    for y in range(0, args.height, args.strip):
+        start = time.perf_counter()
+        segmenter.push(image[y:y + args.strip])
+        latencies.append(time.perf_counter() - start)
+        max_rows = max(max_rows, len(segmenter.buffer))
+    segmenter.flush()
+
+    latencies = np.array(latencies) * 1000
+    quarter = max(1, len(latencies) // 4)
+    head, tail = np.median(latencies[:quarter]), np.median(latencies[-quarter:])
+    max_h = segmenter.ref_height // segmenter.rules['max_height_div']
+    print(f"纵向划痕: 缓冲区最大 {max_rows} 行, 每条带耗时 前1/4 {head:.1f} ms, 后1/4 {tail:.1f} ms")
+    if max_rows > max_h + args.strip + 4 * segment.MORPH_RADIUS:
+        print("回归校验失败: 纵向划痕使缓冲区持续增长")
+        return 1
+    if tail > 2 * head + 1:
+        print("回归校验失败: 每条带耗时随卷长增长")
+        return 1
+    return 0
+
+
+def clean_image(height, width, defects, seed=0):
+    """生成几乎无缺陷的合成图像（模拟正常卷材），只包含少量暗斑"""
+    rng = np.random.default_rng(seed)
+    gray = cv2.GaussianBlur(rng.integers(45, 90, (height, width), dtype=np.uint8), (5, 5), 0)
+    for _ in range(defects):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        cv2.circle(gray, (x, y), int(rng.integers(20, 60)), int(rng.integers(0, 30)), -1)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def bench_prescreen(args):
+    """粗筛：召回率校验 + 与全分辨率整图处理的耗时对比"""
+    images = [(f"合成图像 {args.size}x{args.size}", clean_image(args.size, args.size, args.defects))]
+    for path in args.image:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"无法读取图像: {path}")
+            return 1
+        images.append((path, image))
+
+    status = 0
+    for name, image in images:
+        print(name)
+        t_full = timeit(lambda: segment.find_candidates(segment.binarize(image)), args.repeat)
+        print(f"  全分辨率处理: {t_full * 1000:.1f} ms")
+        for factor in args.factor or [4, 8]:
+            recall, missed = segment.prescreen_recall(image, factor)
+            t_pre = timeit(lambda: segment.find_candidates(segment.binarize_prescreen(image, factor, 1.0)),
+                           args.repeat)
+            print(f"  粗筛 {factor}x: {t_pre * 1000:.1f} ms ({t_full / t_pre:.2f}x), 召回率 {recall:.4f}")
+            for rect in missed:
+                print(f"    漏检: {rect}")
+            if factor <= 4 and missed:
+                status = 1
+    return status
+
+
+def bench_train_scaling(args):
+    """
+    多进程数据并行训练的扩展性：同一数据集上分别以 1/2/4/8 个进程训练，比较训练吞吐量（图像/秒）
+    每次在临时目录中运行（检查点、训练状态、指标记录不影响正式训练），取最后一个epoch的训练时间
+    """
+    import launch
+
+    script = os.path.abspath(args.script)
+    train_args = ['--epochs', str(args.epochs), '--batch-size', str(args.batch_size), '--mode', args.mode,
+                  '--patience', '0', '--checkpoint-every', str(args.epochs)] + args.train_args
+    # 训练结束时的曲线图不弹出窗口
+    os.environ['MPLBACKEND'] = 'Agg'
+    results = []
+    for nproc in args.procs:
+        with tempfile.TemporaryDirectory() as cwd:
+            start = time.perf_counter()
+            status = launch.launch(script, train_args, nproc, master_port=args.master_port, cwd=cwd)
+            total = time.perf_counter() - start
+            if status != 0:
+                print(f"{nproc} 个进程: 训练失败 ({status})")
+                return status
+            with open(os.path.join(cwd, 'train_history.jsonl'), 'r', encoding='utf-8') as f:
+                record = [json.loads(line) for line in f][-1]
+        throughput = record['train_samples'] / record['train_time']
+        results.append((nproc, throughput, record['train_time'], total))
+
+    print(f"模式: {args.mode}, 每进程批大小: {args.batch_size}, CPU核数: {os.cpu_count()}")
+    print(f"{'进程数':>6} {'吞吐量(张/秒)':>14} {'加速比':>8} {'效率':>8} {'每epoch训练(s)':>16} {'总耗时(s)':>10}")
+    base = results[0][1] / results[0][0]
+    for nproc, throughput, train_time, total in results:
+        speedup = throughput / results[0][1]
+        print(f"{nproc:>6} {throughput:>14.1f} {speedup:>8.2f} {throughput / (base * nproc):>8.1%} "
+              f"{train_time:>16.2f} {total:>10.1f}")
+    return 0
+
+
+def bench_db(args):
+    """
+    数据访问层：每次操作新建连接（原来的方式）与连接池的每秒操作数对比
+    需要可连接的 MySQL（config.ini 中的 [mysql]，表结构见 init_database.sql）；写入的测试数据在结束时删除
+    """
+    from mysql.connector import MySQLConnection
+    from read_config import read_db_config
+    import db_pool
+    import opration
+
+    def legacy(query, params, fetch):
+        # 与连接池之前的实现相同：每次读取配置、建立连接、执行、提交、关闭
+        conn = MySQLConnection(**read_db_config())
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        result = cursor.fetchall() if fetch else cursor.lastrowid
+        if not fetch:
+            print('last insert id', result)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return result
+
+    marker = 'benchmark.py db'
+    select = "SELECT * FROM user WHERE username = %s"
+    insert = "INSERT INTO picture(url, num, createtime) VALUES(%s,%s,%s)"
+    createtime = time.strftime('%Y-%m-%d %H:%M:%S')
+    cases = [
+        ('查询 query_username', lambda: legacy(select, ('admin',), True),
+         lambda: opration.query_username('admin')),
+        ('写入 insert_picture', lambda: legacy(insert, (marker, 0, createtime), False),
+         lambda: opration.insert_picture(marker, 0, createtime)),
+    ]
+
+    print(f"操作数: {args.ops}")
+    for name, before, after in cases:
+        t_before = timeit_ops(before, args.ops)
+        t_after = timeit_ops(after, args.ops)
+        print(f"{name}: 每次新建连接 {args.ops / t_before:.0f} 次/秒, 连接池 {args.ops / t_after:.0f} 次/秒 "
+              f"({t_before / t_after:.1f}x)")
+    print(f"连接池统计: {db_pool.get_pool().stats}")
+
+    with db_pool.get_pool().cursor("DELETE FROM picture WHERE url = %s") as cursor:
+        cursor.execute("DELETE FROM picture WHERE url = %s", (marker,))
+    return 0
+
+
+def bench_db_save(args):
+    """
+    保存一张图片及其缺陷：逐条 insert_picture + insert_defect（每条单独提交）与单事务批量写入的每秒行数对比
+    需要可连接的 MySQL；写入的测试数据在结束时删除（defect 随 picture 级联删除）
+    """
+    import db_pool
+    import opration
+
+    marker = 'benchmark.py db-save'
+    createtime = time.strftime('%Y-%m-%d %H:%M:%S')
+    defects = [(marker, '划痕(class7NG)', 0.9, f"位置({i},{i},10,10)", createtime) for i in range(args.defects)]
+    rows = 1 + len(defects)
+
+    def per_row():
+        picid = opration.insert_picture(marker, len(defects), createtime)
+        for defect in defects:
+            opration.insert_defect(picid, *defect)
+
+    def bulk():
+        if opration.save_picture_with_defects(marker, len(defects), createtime, defects) is None:
+            raise RuntimeError("批量写入失败")
+
+    t_before = timeit_ops(per_row, args.repeat)
+    t_after = timeit_ops(bulk, args.repeat)
+    print(f"每张图片 {args.defects} 个缺陷（{rows} 行），重复 {args.repeat} 次")
+    print(f"逐条写入: {t_before / args.repeat * 1000:.1f} ms/张, {rows * args.repeat / t_before:.0f} 行/秒")
+    print(f"单事务批量写入: {t_after / args.repeat * 1000:.1f} ms/张, {rows * args.repeat / t_after:.0f} 行/秒 "
+          f"({t_before / t_after:.1f}x)")
+
+    with db_pool.get_pool().cursor("DELETE FROM picture WHERE url = %s") as cursor:
+        cursor.execute("DELETE FROM picture WHERE url = %s", (marker,))
+    return 0
+
+
+# 合成缺陷表：先逐批写入的种子行数，之后在服务器端 INSERT ... SELECT 倍增，每条语句最多写入的行数
+QUERY_SEED_ROWS = 10000
+QUERY_FILL_ROWS = 1000000
+# 与 migrate_history_indexes.sql 相同的索引
+HISTORY_INDEXES = {
+    'idx_defect_createtime': "createtime",
+    'idx_defect_cla_createtime': "cla, createtime",
+}
+
+
+def bench_db_query(args):
+    """
+    检测历史筛选查询（opration.defect_page_query 生成的 SQL）在合成的大缺陷表上建索引前后的耗时：
+    第一页，以及按 keyset 连续翻 --pages 页后的那一页
+    需要可连接的 MySQL 且账号有建库权限；合成数据写在单独的数据库（默认 <库名>_bench）中，不影响生产数据，
+    再次运行时复用已生成的数据，--drop 在结束时删除该数据库
+    """
+    import datetime
+    from read_config import read_db_config
+    import db_pool
+    import opration
+
+    db_config = read_db_config()
+    database = args.database or f"{db_config['database']}_bench"
+    server = db_pool.ConnectionPool({k: v for k, v in db_config.items() if k != 'database'}, pool_size=1)
+    with server.cursor(f"CREATE DATABASE IF NOT EXISTS `{database}`", prepared=False) as cursor:
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{database}` CHARACTER SET utf8mb4")
+    pool = db_pool.ConnectionPool(dict(db_config, database=database), pool_size=1)
+
+    def execute(query, params=(), prepared=False):
+        with pool.cursor(query, prepared) as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall() if cursor.description else None
+
+    # 与 init_database.sql 的 defect 表相同的列（不建外键，筛选用的索引由下面按需添加/删除）
+    execute("CREATE TABLE IF NOT EXISTS defect ("
+            "id INT AUTO_INCREMENT PRIMARY KEY, ficid INT NOT NULL, url VARCHAR(500) NOT NULL, "
+            "cla VARCHAR(100) NOT NULL, prob FLOAT NOT NULL, location VARCHAR(255) NOT NULL, "
+            "createtime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+            "INDEX (ficid))")
+    classes = ["划痕(class7NG)", "漏涂(class5NG)"]
+    now = datetime.datetime.now().replace(microsecond=0)
+    count = execute("SELECT COUNT(*) FROM defect")[0][0]
+    if count < args.rows:
+        print(f"生成合成数据: {count} -> {args.rows} 行（检测时间均匀分布在最近一年）")
+        start = time.perf_counter()
+        if count == 0:
+            rng = np.random.default_rng(0)
+            seed = min(QUERY_SEED_ROWS, args.rows)
+            rows = [(i // 5, f"data/Img/{i // 5}.bmp", classes[int(rng.integers(2))], float(rng.uniform(0.5, 1.0)),
+                     f"位置({i},{i},10,10)", now - datetime.timedelta(seconds=int(rng.integers(365 * 86400))))
+                    for i in range(seed)]
+            with pool.cursor(opration.DEFECT_INSERT, prepared=False) as cursor:
+                for index in range(0, seed, opration.BULK_ROWS):
+                    cursor.executemany(opration.DEFECT_INSERT, rows[index:index + opration.BULK_ROWS])
+            count = seed
+        while count < args.rows:
+            # 复制已有的行，类别、置信度、检测时间重新随机
+            n = min(count, args.rows - count, QUERY_FILL_ROWS)
+            execute("INSERT INTO defect(ficid, url, cla, prob, location, createtime) "
+                    "SELECT ficid, url, IF(RAND() < 0.5, %s, %s), 0.5 + RAND() * 0.5, location, "
+                    "%s - INTERVAL FLOOR(RAND() * 31536000) SECOND FROM defect LIMIT %s",
+                    (classes[0], classes[1], now, n))
+            count += n
+            print(f"  {count} 行 ({time.perf_counter() - start:.0f} s)")
+        execute("ANALYZE TABLE defect")
+
+    week = now - datetime.timedelta(days=7)
+    day = (now - datetime.timedelta(days=30)).replace(hour=0, minute=0, second=0)
+    cases = [
+        ('全部缺陷', {}),
+        ('最近7天', {'start': week}),
+        ('最近7天 漏涂 置信度<0.7', {'start': week, 'cla': classes[1], 'max_prob': 0.7}),
+        ('某一天 划痕', {'start': day, 'end': day + datetime.timedelta(days=1), 'cla': classes[0]}),
+    ]
+
+    def deep_page(filters):
+        """按 keyset 连续翻 args.pages 页，返回最后一页的 before"""
+        before = None
+        for _ in range(args.pages):
+            page = execute(*opration.defect_page_query(before=before, **filters), prepared=True)
+            if len(page) < opration.PAGE_SIZE:
+                break
+            before = (page[-1][-1], page[-1][0])
+        return before
+
+    existing = {row[0] for row in execute(
+        "SELECT DISTINCT index_name FROM information_schema.statistics WHERE table_schema = %s AND table_name = 'defect'",
+        (database,))}
+    print(f"缺陷表 {count} 行，每页 {opration.PAGE_SIZE} 行，耗时取 {args.repeat} 次中最短的")
+    for indexed in (False, True):
+        start = time.perf_counter()
+        for name, columns in HISTORY_INDEXES.items():
+            if indexed and name not in existing:
+                execute(f"ALTER TABLE defect ADD INDEX {name} ({columns})")
+            elif not indexed and name in existing:
+                execute(f"ALTER TABLE defect DROP INDEX {name}")
+        existing = set(HISTORY_INDEXES) if indexed else set()
+        print(f"{'有索引' if indexed else '无索引'}" + (f"（建索引 {time.perf_counter() - start:.1f} s）" if indexed else ""))
+        print(f"  {'查询':<24} {'第一页(ms)':>10} {'第' + str(args.pages) + '页后(ms)':>12}  使用的索引")
+        for name, filters in cases:
+            query, params = opration.defect_page_query(**filters)
+            first = timeit(lambda: execute(query, params, prepared=True), args.repeat)
+            before = deep_page(filters)
+            deep_query, deep_params = opration.defect_page_query(before=before, **filters)
+            deep = timeit(lambda: execute(deep_query, deep_params, prepared=True), args.repeat)
+            with pool.cursor("EXPLAIN " + query, prepared=False) as cursor:
+                cursor.execute("EXPLAIN " + query, params)
+                plan = dict(zip(cursor.column_names, cursor.fetchall()[0]))
+            print(f"  {name:<24} {first * 1000:>10.1f} {deep * 1000:>12.1f}  {plan.get('key') or '-'}")
+
+    pool.close()
+    if args.drop:
+        with server.cursor(f"DROP DATABASE `{database}`", prepared=False) as cursor:
+            cursor.execute(f"DROP DATABASE `{database}`")
+    server.close()
+    return 0
+
+
+def timeit_ops(func, ops):
+    """执行 ops 次的总耗时（秒），先预热一次"""
+    func()
+    start = time.perf_counter()
+    for _ in range(ops):
+        func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能基准与一致性校验")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    morph_parser = subparsers.add_parser('morph', help="形态学处理链")
+    morph_parser.add_argument('--size', type=int, default=8000, help="基准图像边长")
+    morph_parser.add_argument('--repeat', type=int, default=3)
+    morph_parser.add_argument('--image', action='append', default=[], help="额外参与校验的真实图像")
+    morph_parser.set_defaults(func=bench_morph)
+
+    candidates_parser = subparsers.add_parser('candidates', help="候选区域提取")
+    candidates_parser.add_argument('--size', type=int, default=4000)
+    candidates_parser.add_argument('--noise', type=float, default=0.02, help="随机噪声点比例")
+    candidates_parser.add_argument('--repeat', type=int, default=3)
+    candidates_parser.set_defaults(func=bench_candidates)
+
+    tiles_parser = subparsers.add_parser('tiles', help="分块多线程分割")
+    tiles_parser.add_argument('--height', type=int, default=8000)
+    tiles_parser.add_argument('--width', type=int, default=16000)
+    tiles_parser.add_argument('--tile', type=int, default=2048)
+    tiles_parser.add_argument('--workers', type=int, default=None)
+    tiles_parser.add_argument('--repeat', type=int, default=3)
+    tiles_parser.set_defaults(func=bench_tiles)
+
+    stream_parser = subparsers.add_parser('stream', help="流式条带分割")
+    stream_parser.add_argument('--height', type=int, default=16000)
+    stream_parser.add_argument('--width', type=int, default=8192)
+    stream_parser.add_argument('--strip', type=int, default=512)
+    stream_parser.set_defaults(func=bench_stream)
+
+    prescreen_parser = subparsers.add_parser('prescreen', help="粗筛召回率与耗时")
+    prescreen_parser.add_argument('--size', type=int, default=8000)
+    prescreen_parser.add_argument('--defects', type=int, default=5, help="合成图像中的缺陷个数")
+    prescreen_parser.add_argument('--factor', type=int, action='append', default=None, help="抽样间隔，可多次指定")
+    prescreen_parser.add_argument('--image', action='append', default=[], help="额外参与校验的真实图像")
+    prescreen_parser.add_argument('--repeat', type=int, default=3)
+    prescreen_parser.set_defaults(func=bench_prescreen)
+
+    scaling_parser = subparsers.add_parser('train-scaling', help="多进程数据并行训练的吞吐量")
+    scaling_parser.add_argument('--procs', type=int, nargs='+', default=[1, 2, 4, 8], help="进程数")
+    scaling_parser.add_argument('--epochs', type=int, default=2)
+    scaling_parser.add_argument('--batch-size', type=int, default=16, help="每个进程的批大小")
+    scaling_parser.add_argument('--mode', choices=['full', 'features'], default='full')
+    scaling_parser.add_argument('--master-port', type=int, default=29500)
+    scaling_parser.add_argument('--script', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                 'train.py'), help="训练脚本")
+    scaling_parser.add_argument('train_args', nargs=argparse.REMAINDER, help="传给 train.py 的其他参数")
+    scaling_parser.set_defaults(func=bench_train_scaling)
+
+    db_parser = subparsers.add_parser('db', help="数据访问层每秒操作数（需要 MySQL）")
+    db_parser.add_argument('--ops', type=int, default=1000)
+    db_parser.set_defaults(func=bench_db)
+
+    db_save_parser = subparsers.add_parser('db-save', help="图片与缺陷的单事务批量写入（需要 MySQL）")
+    db_save_parser.add_argument('--defects', type=int, default=200, help="每张图片的缺陷数")
+    db_save_parser.add_argument('--repeat', type=int, default=10)
+    db_save_parser.set_defaults(func=bench_db_save)
+
+    db_query_parser = subparsers.add_parser('db-query', help="检测历史筛选查询建索引前后的耗时（需要 MySQL）")
+    db_query_parser.add_argument('--rows', type=int, default=10000000, help="合成缺陷表的行数")
+    db_query_parser.add_argument('--repeat', type=int, default=3)
+    db_query_parser.add_argument('--pages', type=int, default=20,
+                                 help="深翻页测试连续翻的页数（无索引时每页都是全表扫描）")
+    db_query_parser.add_argument('--database', default=None, help="合成数据所在的数据库，默认 <库名>_bench")
+    db_query_parser.add_argument('--drop', action='store_true', help="结束时删除合成数据所在的数据库")
+    db_query_parser.set_defaults(func=bench_db_query)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
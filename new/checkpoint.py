@@ -0,0 +1,111 @@
+"""
+自包含的模型检查点格式
+
+一个文件内包含：模型结构标识、分类头维度、类别映射、预处理参数与权重。
+推理时直接按检查点中的结构构建网络（不下载/加载ImageNet预训练权重），离线即可启动；
+新版本 PyTorch 下以 mmap 方式加载，权重按需从文件映射，不整体读入内存。
+仍兼容旧的只有 state_dict 的权重文件（元数据取默认值与 class_indices.json）。
+"""
+import os
+import json
+
+import torch
+from torchvision import transforms
+
+from model import model, ARCH, HEAD
+
+# 获取当前文件所在目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+CLASS_INDICES_PATH = os.path.join(current_dir, "class_indices.json")
+
+FORMAT = 'lanmo-classifier'
+VERSION = 1
+
+# 预处理参数 - EfficientNet的标准预处理（与训练时的val变换一致）
+PREPROCESS = {
+    'size': [224, 224],
+    'mean': [0.485, 0.456, 0.406],
+    'std': [0.229, 0.224, 0.225],
+}
+
+
+def _torch_load(path):
+    """以 mmap 方式加载（PyTorch 2.1 及以上），旧版本退回普通加载"""
+    try:
+        return torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+    except (TypeError, RuntimeError):
+        return torch.load(path, map_location='cpu')
+
+
+def _read_class_indices(path=CLASS_INDICES_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(net, path, class_indices, preprocess=PREPROCESS, arch=ARCH, head=HEAD):
+    """写出检查点（先写临时文件再替换，避免中途退出留下损坏的文件）"""
+    state = {
+        'format': FORMAT,
+        'version': VERSION,
+        'arch': arch,
+        'head': list(head),
+        'class_indices': {str(key): value for key, value in class_indices.items()},
+        'preprocess': preprocess,
+        'state_dict': net.state_dict(),
+    }
+    tmp_path = path + ".tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_checkpoint(path):
+    """读取检查点，旧格式（只有 state_dict）补全默认元数据，返回统一的字典"""
+    state = _torch_load(path)
+    if isinstance(state, dict) and state.get('format') == FORMAT:
+        return state
+    return {
+        'format': FORMAT,
+        'version': 0,
+        'arch': ARCH,
+        'head': list(HEAD),
+        'class_indices': _read_class_indices(),
+        'preprocess': PREPROCESS,
+        'state_dict': state,
+    }
+
+
+def save_training_state(path, state):
+    """写出可恢复的训练状态（先写临时文件再替换，中途退出时上一次的训练状态仍然完整）"""
+    tmp_path = path + ".tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_training_state(path):
+    """读取训练状态（含 numpy/random 的随机数状态，不能以 weights_only 方式加载）"""
+    try:
+        return torch.load(path, map_location='cpu', weights_only=False)
+    except TypeError:
+        return torch.load(path, map_location='cpu')
+
+
+def build_model(state):
+    """按检查点中的结构构建网络并加载权重（不使用预训练权重），返回 eval 模式的模型"""
+    if state['arch'] != ARCH:
+        raise ValueError(f"不支持的模型结构: {state['arch']}")
+    net = model(pretrained=False, head=tuple(state['head']))
+    net.load_state_dict(state['state_dict'])
+    # 关闭 Dropout
+    net.eval()
+    return net
+
+
+def build_transform(preprocess=PREPROCESS):
+    """按检查点中的预处理参数构建推理时的预处理"""
+    return transforms.Compose([
+        transforms.Resize(tuple(preprocess['size'])),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=preprocess['mean'], std=preprocess['std'])
+    ])
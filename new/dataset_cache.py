@@ -0,0 +1,221 @@
+"""
+预解码的训练/测试数据集缓存
+
+把 ImageFolder 目录结构的数据集（data/train、data/val、data/tes）一次性解码、缩放为 224x224 的 uint8 图像，
+写入一个内存映射的数据文件 {name}.u8 与索引文件 {name}.json。之后训练、测试时直接从内存映射中切片读取，
+不再逐张解码、缩放；归一化与随机翻转在整批张量上完成。
+
+索引中记录每个文件的修改时间与大小，新增或修改的文件再次构建时只处理变化的部分。
+
+用法:
+    python dataset_cache.py [--splits train val tes] [--workers 4]
+"""
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image
+
+import checkpoint
+
+# 获取当前文件所在目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(current_dir, "data")
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', '.webp')
+
+
+def scan_image_folder(root):
+    """按 ImageFolder 的规则扫描目录：子目录名排序后即为类别索引"""
+    classes = sorted(entry.name for entry in os.scandir(root) if entry.is_dir())
+    samples = []
+    for label, name in enumerate(classes):
+        for dirpath, dirnames, filenames in sorted(os.walk(os.path.join(root, name), followlinks=True)):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    samples.append((os.path.join(dirpath, filename), label))
+    return classes, samples
+
+
+def decode_image(path, size):
+    """解码并缩放为 (H, W, 3) 的 uint8 RGB 数组，与 transforms.Resize 对 PIL 图像的处理一致"""
+    with open(path, 'rb') as f:
+        image = Image.open(f).convert('RGB')
+    return np.asarray(image.resize((size[1], size[0]), Image.BILINEAR))
+
+
+def cache_paths(cache_dir, name):
+    return os.path.join(cache_dir, f"{name}.u8"), os.path.join(cache_dir, f"{name}.json")
+
+
+def build_cache(root, cache_dir=CACHE_DIR, name=None, size=tuple(checkpoint.PREPROCESS['size']), workers=4):
+    """
+    构建（或增量更新）数据集缓存，返回 (新解码的图像数, 总图像数)
+    未变化的文件沿用原来的存储位置；新增文件追加到数据文件末尾；修改过的文件在原位置重新解码；
+    删除的文件只从索引中去掉（其存储位置不再使用，需要回收空间时删除缓存重新构建）
+    """
+    if name is None:
+        name = os.path.basename(os.path.normpath(root))
+    os.makedirs(cache_dir, exist_ok=True)
+    data_path, index_path = cache_paths(cache_dir, name)
+
+    old = {}
+    slots = 0
+    if os.path.exists(index_path) and os.path.exists(data_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if tuple(index['size']) == tuple(size):
+            old = {entry['path']: entry for entry in index['entries']}
+            slots = index['slots']
+
+    classes, samples = scan_image_folder(root)
+    entries = []
+    todo = []
+    for path, label in samples:
+        rel = os.path.relpath(path, root)
+        st = os.stat(path)
+        entry = {'path': rel, 'label': label, 'mtime': st.st_mtime_ns, 'bytes': st.st_size}
+        previous = old.get(rel)
+        if previous is not None:
+            entry['slot'] = previous['slot']
+            if previous['mtime'] != entry['mtime'] or previous['bytes'] != entry['bytes']:
+                todo.append(entry)
+        else:
+            entry['slot'] = slots
+            slots += 1
+            todo.append(entry)
+        entries.append(entry)
+
+    # 数据文件按需扩展（已缓存的图像不移动、不重写）
+    image_bytes = size[0] * size[1] * 3
+    with open(data_path, 'ab' if old else 'wb') as f:
+        f.truncate(max(slots, 1) * image_bytes)
+    data = np.memmap(data_path, dtype=np.uint8, mode='r+', shape=(max(slots, 1), size[0], size[1], 3))
+
+    def decode(entry):
+        data[entry['slot']] = decode_image(os.path.join(root, entry['path']), size)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for done, _ in enumerate(executor.map(decode, todo), start=1):
+            print(f"\r解码 [{name}]: {done}/{len(todo)}", end="")
+    if todo:
+        print()
+    data.flush()
+    del data
+
+    # 索引最后写入（先写临时文件再替换），中途退出时旧索引仍然有效
+    index = {'size': list(size), 'classes': classes, 'slots': slots, 'entries': entries}
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+    return len(todo), len(entries)
+
+
+class MemmapDataset(torch.utils.data.Dataset):
+    """
+    从缓存读取样本，返回 (uint8 图像张量 (H, W, 3), 类别)
+    图像是内存映射上的切片，不复制；每个 DataLoader 工作进程首次访问时各自打开内存映射
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, name='train'):
+        self.data_path, index_path = cache_paths(cache_dir, name)
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.size = tuple(index['size'])
+        self.classes = index['classes']
+        self.class_to_idx = {name: label for label, name in enumerate(self.classes)}
+        self.shape = (max(index['slots'], 1), self.size[0], self.size[1], 3)
+        self.slots = np.array([entry['slot'] for entry in index['entries']], dtype=np.int64)
+        self.targets = [entry['label'] for entry in index['entries']]
+        self.data = None
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __getitem__(self, index):
+        if self.data is None:
+            # 'c'(写时复制)方式映射：读取不复制，张量可写也不会改动缓存文件
+            self.data = np.memmap(self.data_path, dtype=np.uint8, mode='c', shape=self.shape)
+        return torch.from_numpy(self.data[self.slots[index]]), self.targets[index]
+
+    def __getstate__(self):
+        # 内存映射不随数据集对象传给工作进程
+        state = self.__dict__.copy()
+        state['data'] = None
+        return state
+
+
+def prepare_batch(images, augment=False, generator=None, preprocess=checkpoint.PREPROCESS):
+    """
+    整批处理：(B, H, W, 3) uint8 -> (B, 3, H, W) 归一化的 float 张量
+    augment: 按样本随机水平翻转、垂直翻转（各 p=0.5），与训练时的 RandomHorizontalFlip/RandomVerticalFlip 一致
+    """
+    batch = images.permute(0, 3, 1, 2).float().div_(255)
+    if augment:
+        flips = torch.rand(2, len(batch), generator=generator) < 0.5
+        batch = torch.where(flips[0].view(-1, 1, 1, 1), batch.flip(3), batch)
+        batch = torch.where(flips[1].view(-1, 1, 1, 1), batch.flip(2), batch)
+    mean = torch.tensor(preprocess['mean']).view(1, 3, 1, 1)
+    std = torch.tensor(preprocess['std']).view(1, 3, 1, 1)
+    return batch.sub_(mean).div_(std)
+
+
+class BatchLoader:
+    """包装 DataLoader：逐批做 prepare_batch，迭代结果与 ImageFolder + transforms 的 DataLoader 相同"""
+
+    def __init__(self, loader, augment=False):
+        self.loader = loader
+        self.augment = augment
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for images, labels in self.loader:
+            yield prepare_batch(images, self.augment), labels
+
+
+def make_loader(name, batch_size=16, shuffle=False, augment=False, num_workers=2, cache_dir=CACHE_DIR,
+                generator=None, sampler=None):
+    """
+    创建读取缓存的数据加载器（多进程工作进程常驻，避免每个 epoch 重新启动）
+    generator: 打乱顺序使用的随机数生成器，默认使用 torch 全局随机数
+    sampler: 自定义采样器（如多进程训练的 DistributedSampler、样本下标列表），指定时忽略 shuffle 与 generator
+    """
+    dataset = MemmapDataset(cache_dir, name)
+    if sampler is None and shuffle:
+        sampler = torch.utils.data.RandomSampler(dataset, generator=generator)
+    # 常驻工作进程的种子只在第一个 epoch 抽取一次；用单独的生成器抽取，
+    # 使每个 epoch 消耗的全局随机数相同，从训练状态恢复后的随机序列与不中断时一致
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, sampler=sampler,
+                                         num_workers=num_workers, persistent_workers=num_workers > 0,
+                                         generator=torch.Generator())
+    return dataset, BatchLoader(loader, augment)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建预解码的数据集缓存")
+    parser.add_argument('--splits', nargs='+', default=['train', 'val', 'tes'])
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--workers', type=int, default=4, help="解码线程数")
+    args = parser.parse_args()
+
+    for split in args.splits:
+        root = os.path.join(args.data_dir, split)
+        if not os.path.isdir(root):
+            print(f"数据目录不存在，跳过: {root}")
+            continue
+        decoded, total = build_cache(root, args.cache_dir, split, workers=args.workers)
+        print(f"{split}: 共 {total} 张，本次解码 {decoded} 张")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
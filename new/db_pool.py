@@ -0,0 +1,243 @@
+"""
+MySQL 连接池
+
+进程内共享一组长连接，数据库配置只读取一次；每次操作从池中借出连接、用完归还，
+不再为每条语句重新建立 TCP 连接与认证。
+
+- 连接按需创建，最多 pool_size 个；全部借出时等待归还，超过 timeout 秒抛出 PoolError（mysql.connector.Error 的子类）
+- 健康检查：连接空闲超过 ping_interval 秒后，借出前先 ping（断开时自动重连）；执行出错且连接已断开时丢弃该连接
+- 预处理语句：每个连接按 SQL 文本缓存预处理游标，同一条语句只在服务器端准备一次
+- 连接为自动提交模式，单条语句不需要再单独 commit；多条语句需要原子执行时使用 transaction()
+"""
+import os
+import time
+import queue
+import threading
+from collections import OrderedDict
+from configparser import ConfigParser
+from contextlib import contextmanager
+
+from mysql.connector import MySQLConnection, Error
+from mysql.connector.errors import PoolError
+
+from read_config import read_db_config
+
+# 获取当前文件所在目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(current_dir, "config.ini")
+
+POOL_SIZE = 4
+TIMEOUT = 10.0
+PING_INTERVAL = 30.0
+STATEMENT_CACHE = 32
+
+
+def read_pool_config(filename=CONFIG_PATH, section='db_pool'):
+    """读取config.ini中的连接池配置，缺失时使用默认值"""
+    parser = ConfigParser()
+    parser.read(filename, encoding='utf-8')
+    config = {'pool_size': POOL_SIZE, 'timeout': TIMEOUT, 'ping_interval': PING_INTERVAL, 'prepared': True}
+    if parser.has_section(section):
+        config['pool_size'] = parser.getint(section, 'pool_size', fallback=POOL_SIZE)
+        config['timeout'] = parser.getfloat(section, 'timeout', fallback=TIMEOUT)
+        config['ping_interval'] = parser.getfloat(section, 'ping_interval', fallback=PING_INTERVAL)
+        config['prepared'] = parser.getboolean(section, 'prepared', fallback=True)
+    return config
+
+
+class PooledConnection:
+    """池中的一个连接：MySQL 连接 + 按 SQL 缓存的预处理游标 + 最近一次使用的时间"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = OrderedDict()
+        self.last_used = time.monotonic()
+
+    def cursor(self, query, prepared=True):
+        """取得执行 query 的游标：预处理游标按 SQL 缓存复用，其余情况新建普通游标（调用方负责关闭）"""
+        if not prepared:
+            return self.conn.cursor()
+        cursor = self.statements.get(query)
+        if cursor is None:
+            cursor = self.conn.cursor(prepared=True)
+            self.statements[query] = cursor
+            if len(self.statements) > STATEMENT_CACHE:
+                self.statements.popitem(last=False)[1].close()
+        else:
+            self.statements.move_to_end(query)
+        return cursor
+
+    def discard_statement(self, query):
+        cursor = self.statements.pop(query, None)
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Error:
+                pass
+
+    def reset_statements(self):
+        """重连后服务器端的预处理语句已失效，丢弃缓存的游标"""
+        self.statements.clear()
+
+    def close(self):
+        for cursor in self.statements.values():
+            try:
+                cursor.close()
+            except Error:
+                pass
+        self.statements.clear()
+        try:
+            self.conn.close()
+        except Error:
+            pass
+
+
+class ConnectionPool:
+    """线程安全的连接池"""
+
+    def __init__(self, db_config, pool_size=POOL_SIZE, timeout=TIMEOUT, ping_interval=PING_INTERVAL, prepared=True):
+        self.db_config = dict(db_config, autocommit=True)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.prepared = prepared
+        self.idle = queue.LifoQueue()   # 后进先出：优先复用最近用过的连接，多余的连接自然空闲
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = {'created': 0, 'reused': 0, 'pings': 0, 'reconnects': 0, 'discarded': 0, 'waits': 0}
+
+    def _connect(self):
+        conn = PooledConnection(MySQLConnection(**self.db_config))
+        self.stats['created'] += 1
+        return conn
+
+    def acquire(self):
+        """借出一个可用的连接"""
+        try:
+            pooled = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                if self.size < self.pool_size:
+                    self.size += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    return self._connect()
+                except Error:
+                    with self.lock:
+                        self.size -= 1
+                    raise
+            self.stats['waits'] += 1
+            try:
+                pooled = self.idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise PoolError(f"数据库连接池已满（{self.pool_size} 个），等待 {self.timeout} 秒后仍没有空闲连接")
+
+        self.stats['reused'] += 1
+        if time.monotonic() - pooled.last_used > self.ping_interval:
+            self._check(pooled)
+        return pooled
+
+    def _check(self, pooled):
+        """健康检查：ping 服务器，断开时重连（重连后预处理语句需要重新准备）"""
+        self.stats['pings'] += 1
+        try:
+            pooled.conn.ping(reconnect=False)
+        except Error:
+            self.stats['reconnects'] += 1
+            pooled.reset_statements()
+            try:
+                pooled.conn.reconnect(attempts=1, delay=0)
+            except Error:
+                self._discard(pooled)
+                raise
+
+    def release(self, pooled, broken=False):
+        """归还连接；broken 表示执行出错，此时连接已断开的直接丢弃"""
+        if broken:
+            try:
+                alive = pooled.conn.is_connected()
+            except Error:
+                alive = False
+            if not alive:
+                self._discard(pooled)
+                return
+        pooled.last_used = time.monotonic()
+        self.idle.put(pooled)
+
+    def _discard(self, pooled):
+        pooled.close()
+        self.stats['discarded'] += 1
+        with self.lock:
+            self.size -= 1
+
+    @contextmanager
+    def connection(self):
+        """借出连接，用完自动归还"""
+        pooled = self.acquire()
+        try:
+            yield pooled
+        except BaseException:
+            self.release(pooled, broken=True)
+            raise
+        self.release(pooled)
+
+    @contextmanager
+    def cursor(self, query, prepared=None):
+        """
+        借出连接并取得执行 query 的游标（自动提交模式，单条语句不需要 commit）
+        prepared: 是否使用预处理语句，默认按连接池配置；executemany 的批量插入应传 False（普通游标会改写为多行 INSERT）
+        """
+        prepared = self.prepared if prepared is None else prepared
+        with self.connection() as pooled:
+            cursor = pooled.cursor(query, prepared)
+            try:
+                yield cursor
+            except BaseException:
+                # 出错的预处理游标可能残留未读取的结果，不再复用
+                pooled.discard_statement(query)
+                raise
+            finally:
+                if not prepared:
+                    cursor.close()
+
+    @contextmanager
+    def transaction(self):
+        """在一个事务中执行多条语句：正常结束时提交，出错时回滚"""
+        with self.connection() as pooled:
+            pooled.conn.start_transaction()
+            try:
+                yield pooled
+            except BaseException:
+                try:
+                    pooled.conn.rollback()
+                except Error:
+                    pass
+                raise
+            pooled.conn.commit()
+
+    def close(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                pooled = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(pooled)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """获取进程内共享的连接池（首次调用时读取数据库与连接池配置）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = read_pool_config()
+            _pool = ConnectionPool(read_db_config(), config['pool_size'], config['timeout'],
+                                   config['ping_interval'], config['prepared'])
+    return _pool
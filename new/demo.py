@@ -1,12 +1,8 @@
-import glob
 import cv2
-import torch
-from PIL import Image
-from torchvision import transforms
 import matplotlib.pyplot as plt
-import json
 import os
-from model import model
+from engine import get_engine
+import segment
 
 # 获取当前文件所在目录
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -22,16 +18,8 @@ if src is None:
 
 src.shape
 # src = img1[1000:7000,1000:7000]
-gray = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)
-ret, binary = cv2.threshold(gray, 39, 255, cv2.THRESH_BINARY_INV)
-se = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3), (-1, -1))
-binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, se)
-
-binary = cv2.erode(binary,se,iterations=2)
-binary = cv2.dilate(binary,se,iterations=3)
-binary = cv2.dilate(binary,se,iterations=1)
-binary = cv2.erode(binary,se,iterations=2)
-binary = cv2.dilate(binary,se,iterations=1)
+segment_config = segment.read_segment_config()
+binary = segment.segment_binary(src, segment_config)
 
 # 保存二值化图像到独立文件夹
 binary_dir = os.path.join(current_dir, "data/binary")
@@ -40,79 +28,28 @@ binary_path = os.path.join(binary_dir, "binary.bmp")
 cv2.imwrite(binary_path, binary)
 print(f"二值化图像已保存到: {binary_path}")
 
-contours, hierarchy = cv2.findContours(binary, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-height, width = src.shape[:2]
-rects = []
-# 轮廓筛选
-index = 1
-for c in range(len(contours)):
-    # 轮廓外接矩形
-    x, y, w, h = cv2.boundingRect(contours[c])
-    # 轮廓面积
-    area = cv2.contourArea(contours[c])
-    if h > (height//2):
-        continue
-    if area < 800:
-        continue
-    if area > 150000:
-        continue
-    if w/h > 3:
-        continue
-    if h/w >3:
-        continue
-    rects.append([x, y, w, h])
-    # 保存检测到的区域
-    detect_dir = os.path.join(current_dir, "data/detect")
-    os.makedirs(detect_dir, exist_ok=True)
-    recimg = src[y:y + h, x:x + w]
-    cv2.imwrite(os.path.join(detect_dir, f"region_{index}.png"), recimg)
-    index += 1
-
-print(f"检测到 {len(rects)} 个可能的缺陷区域")
+# 轮廓筛选（提取方式由config.ini中[segmentation]的method决定）
+candidate_stats = {}
+rects = segment.find_candidates(binary, segment.DEFAULT_RULES, segment_config['method'],
+                                segment_config['suppress_nested'], candidate_stats)
+crops = segment.crop_regions(src, rects)
 
-# 设置检测图像路径
-image_path = os.path.join(current_dir, "data/detect")
-filepath = glob.glob(os.path.join(image_path, "*.png"))
-print(f"待分类的区域图像数量: {len(filepath)}")
-filepath = sorted(filepath, key=os.path.getctime)
+# 在后台保存检测到的区域（旁路输出，不参与分类）
+crop_writer = segment.CropWriter(os.path.join(current_dir, "data/detect"))
+crop_writer.save(crops)
 
-# 预处理 - 调整为EfficientNet的标准预处理
-data_transform = transforms.Compose(
-    [transforms.Resize((224, 224)),
-     transforms.ToTensor(),
-     transforms.Normalize((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))  # ImageNet标准化
-    ])
+print(f"检测到 {len(rects)} 个可能的缺陷区域 (重复的内轮廓: {candidate_stats['duplicates']})")
 
-# read class_indict
-try:
-    json_file = open(os.path.join(current_dir, 'class_indices.json'), 'r')
-    class_indict = json.load(json_file)
-except Exception as e:
-    print(f"读取类别索引文件失败: {e}")
-    exit(-1)
+# 获取推理引擎（后端由config.ini中[inference]的backend决定，加载模型并预热）
+engine = get_engine()
+class_indict = engine.class_indices
 
-def predict_MN(file_path):
-    img = Image.open(file_path)
-    img = data_transform(img)
-    img = torch.unsqueeze(img, dim=0)
-    with torch.no_grad():
-        result = model_instance(img)
-        result = torch.squeeze(result)
-        predict = torch.softmax(result, dim=0)
-        predict_cla = torch.argmax(predict).numpy()
-    return predict_cla, predict[predict_cla].item()
-
-# 获取模型
-model_instance = model()
-model_weight_path = os.path.join(current_dir, "EfficientNet_self1.pth")
-# 加载模型文件
-model_instance.load_state_dict(torch.load(model_weight_path, map_location='cpu'))
-# 关闭 Dropout
-model_instance.eval()
+# 所有区域在内存中批量分类，顺序与rects一致
+classes, probs = engine.classify(crops)
 
 defect_count = 0
-for i in range(0, len(filepath)):
-    predict_cla, prob = predict_MN(filepath[i])
+for i in range(0, len(rects)):
+    predict_cla, prob = classes[i], probs[i]
     class_name = class_indict[str(predict_cla)]
     print(f"区域 {i+1}: 预测类别 = {class_name}, 置信度 = {prob:.4f}")
     
@@ -132,3 +69,5 @@ os.makedirs(output_dir, exist_ok=True)
 output_path = os.path.join(output_dir, "detection_result.png")
 cv2.imwrite(output_path, src)
 print(f"\n检测结果已保存到: {output_path}")
+
+crop_writer.close()
@@ -0,0 +1,239 @@
+import os
+import json
+import hashlib
+import threading
+from configparser import ConfigParser
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+import checkpoint
+
+# 获取当前文件所在目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+WEIGHT_PATH = os.path.join(current_dir, "EfficientNet_self1.pth")
+ONNX_PATH = os.path.join(current_dir, "EfficientNet_self1.onnx")
+QUANTIZED_PATH = os.path.join(current_dir, "EfficientNet_self1_int8.pt")
+CLASS_INDICES_PATH = os.path.join(current_dir, "class_indices.json")
+CONFIG_PATH = os.path.join(current_dir, "config.ini")
+
+# 默认每次前向推理的批大小
+BATCH_SIZE = 32
+
+# 推理后端：eager(PyTorch) / onnxruntime(ONNX Runtime CPU，需先用 export.py onnx 导出模型)
+#           int8(训练后量化的TorchScript模型，需先用 export.py quantize 生成)
+#           torchscript(冻结的TorchScript模型，首次加载时生成并缓存在权重文件旁，权重变化后自动重建)
+BACKENDS = ('eager', 'onnxruntime', 'int8', 'torchscript')
+
+# 预处理 - EfficientNet的标准预处理（与训练时的val变换一致）
+data_transform = checkpoint.build_transform()
+
+
+def read_inference_config(filename=CONFIG_PATH, section='inference'):
+    """读取config.ini中的推理配置，缺失时使用默认值"""
+    parser = ConfigParser()
+    parser.read(filename, encoding='utf-8')
+    config = {'batch_size': BATCH_SIZE, 'backend': 'eager', 'onnx_path': ONNX_PATH, 'quantized_path': QUANTIZED_PATH,
+              'torchscript_optimize': True}
+    if parser.has_section(section):
+        config['batch_size'] = parser.getint(section, 'batch_size', fallback=BATCH_SIZE)
+        config['backend'] = parser.get(section, 'backend', fallback='eager')
+        config['torchscript_optimize'] = parser.getboolean(section, 'torchscript_optimize', fallback=True)
+        for key in ('onnx_path', 'quantized_path'):
+            path = parser.get(section, key, fallback='')
+            if path:
+                config[key] = os.path.join(current_dir, path)
+    return config
+
+
+def select_quantized_engine():
+    """选择CPU上的量化计算后端（x86 优先，旧版本 PyTorch 使用 fbgemm）"""
+    engines = torch.backends.quantized.supported_engines
+    torch.backends.quantized.engine = 'x86' if 'x86' in engines else 'fbgemm'
+    return torch.backends.quantized.engine
+
+
+def load_quantized_model(quantized_path=QUANTIZED_PATH):
+    """加载 export.py quantize 生成的int8 TorchScript模型"""
+    select_quantized_engine()
+    net = torch.jit.load(quantized_path, map_location='cpu')
+    net.eval()
+    return net
+
+
+def load_eager_model(weight_path=WEIGHT_PATH, state=None):
+    """按检查点构建模型并加载权重（不下载预训练权重），返回 eval 模式的 PyTorch 模型"""
+    if state is None:
+        state = checkpoint.load_checkpoint(weight_path)
+    return checkpoint.build_model(state)
+
+
+def file_hash(path):
+    """计算文件的SHA-256（分块读取）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def torchscript_cache_path(weight_path=WEIGHT_PATH):
+    """TorchScript缓存文件路径：与权重文件同目录、同名"""
+    return os.path.splitext(weight_path)[0] + ".torchscript.pt"
+
+
+def build_torchscript_model(weight_path=WEIGHT_PATH, cache_path=None):
+    """由权重文件构建 trace + freeze 的TorchScript模型，写入缓存文件（附带权重文件的哈希）"""
+    if cache_path is None:
+        cache_path = torchscript_cache_path(weight_path)
+    net = load_eager_model(weight_path)
+    with torch.no_grad():
+        frozen = torch.jit.freeze(torch.jit.trace(net, torch.zeros(1, 3, 224, 224)).eval())
+    # 先写临时文件再替换，避免中途退出留下损坏的缓存
+    tmp_path = cache_path + ".tmp"
+    torch.jit.save(frozen, tmp_path, _extra_files={'weight_hash': file_hash(weight_path)})
+    os.replace(tmp_path, cache_path)
+    return frozen
+
+
+def load_torchscript_model(weight_path=WEIGHT_PATH, optimize=True):
+    """
+    加载TorchScript模型：缓存文件中记录的权重哈希与当前权重文件一致时直接加载，否则重新构建缓存
+    optimize: 加载后再做 optimize_for_inference（该步骤生成的图无法序列化，每次加载时执行）
+    """
+    cache_path = torchscript_cache_path(weight_path)
+    frozen = None
+    if os.path.exists(cache_path):
+        extra_files = {'weight_hash': ''}
+        try:
+            cached = torch.jit.load(cache_path, map_location='cpu', _extra_files=extra_files)
+            if extra_files['weight_hash'].decode() == file_hash(weight_path):
+                frozen = cached
+        except Exception as e:
+            print(f"TorchScript缓存无法加载，重新构建: {e}")
+    if frozen is None:
+        frozen = build_torchscript_model(weight_path, cache_path)
+    if optimize:
+        frozen = torch.jit.optimize_for_inference(frozen)
+    return frozen
+
+
+def create_onnx_session(onnx_path=ONNX_PATH):
+    """创建 ONNX Runtime CPU 推理会话（开启全部图优化）"""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+
+
+class InferenceEngine:
+    """缺陷分类推理引擎 - 统一持有模型，所有调用方共用同一条批量推理路径"""
+
+    def __init__(self, weight_path=WEIGHT_PATH, batch_size=BATCH_SIZE, warmup=True, backend='eager',
+                 onnx_path=ONNX_PATH, quantized_path=QUANTIZED_PATH, torchscript_optimize=True):
+        if backend not in BACKENDS:
+            raise ValueError(f"未知的推理后端: {backend}，可选 {BACKENDS}")
+        self.weight_path = weight_path
+        self.batch_size = batch_size
+        self.backend = backend
+        self.model = None
+        self.session = None
+
+        # 检查点中的类别映射与预处理参数（onnxruntime/int8 后端可以不提供权重文件，此时使用默认值）
+        state = checkpoint.load_checkpoint(weight_path) if os.path.exists(weight_path) else None
+
+        # 加载模型（onnxruntime 后端只加载导出的 ONNX 文件，不构建 PyTorch 模型）
+        if backend == 'onnxruntime':
+            self.session = create_onnx_session(onnx_path)
+            self.input_name = self.session.get_inputs()[0].name
+        elif backend == 'int8':
+            self.model = load_quantized_model(quantized_path)
+        elif backend == 'torchscript':
+            self.model = load_torchscript_model(weight_path, torchscript_optimize)
+        else:
+            self.model = load_eager_model(weight_path, state)
+
+        # 加载类别索引与预处理参数
+        if state is not None:
+            self.class_indices = state['class_indices']
+            self.transform = checkpoint.build_transform(state['preprocess'])
+        else:
+            with open(CLASS_INDICES_PATH, 'r', encoding='utf-8') as f:
+                self.class_indices = json.load(f)
+            self.transform = data_transform
+
+        if warmup:
+            self.warmup()
+
+    def warmup(self):
+        """预热 - 加载时先跑一次前向，避免首次检测时的初始化开销"""
+        dummy = torch.zeros(1, 3, 224, 224)
+        with torch.inference_mode():
+            self.logits(dummy)
+
+    def logits(self, batch):
+        """对预处理后的批次张量 (N, 3, 224, 224) 做一次前向，返回 logits 张量 (N, 8)"""
+        if self.session is not None:
+            return torch.from_numpy(self.session.run(None, {self.input_name: batch.numpy()})[0])
+        return self.model(batch)
+
+    def preprocess(self, image):
+        """将OpenCV读取的BGR数组(或灰度数组)转换为模型输入张量"""
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+        else:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return self.transform(Image.fromarray(image))
+
+    def classify(self, images, batch_size=None):
+        """
+        批量分类
+        images: BGR数组列表(如cv2.imread的结果或原图上的裁剪区域)
+        返回 (classes, probs)：每个输入的预测类别及其置信度
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+
+        classes = np.zeros(len(images), dtype=np.int64)
+        probs = np.zeros(len(images), dtype=np.float32)
+
+        with torch.inference_mode():
+            for start in range(0, len(images), batch_size):
+                batch = torch.stack([self.preprocess(img) for img in images[start:start + batch_size]])
+                predict = torch.softmax(self.logits(batch), dim=1)
+                prob, cla = torch.max(predict, dim=1)
+                classes[start:start + len(cla)] = cla.numpy()
+                probs[start:start + len(prob)] = prob.numpy()
+
+        return classes, probs
+
+    def class_name(self, cla):
+        """根据类别索引获取类别名称"""
+        return self.class_indices.get(str(cla), f"未知类别{cla}")
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """获取进程内共享的推理引擎（首次调用时加载模型）"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            config = read_inference_config()
+            try:
+                _engine = InferenceEngine(batch_size=config['batch_size'], backend=config['backend'],
+                                          onnx_path=config['onnx_path'], quantized_path=config['quantized_path'],
+                                          torchscript_optimize=config['torchscript_optimize'])
+            except Exception as e:
+                if config['backend'] == 'eager':
+                    raise
+                # ONNX文件缺失或未安装 onnxruntime 时退回 PyTorch 推理
+                print(f"{config['backend']} 后端加载失败，改用 eager: {e}")
+                _engine = InferenceEngine(batch_size=config['batch_size'])
+    return _engine
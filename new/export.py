@@ -0,0 +1,325 @@
+"""
+模型导出与一致性校验脚本
+
+用法:
+    python export.py onnx [--weights EfficientNet_self1.pth] [--output EfficientNet_self1.onnx] [--check-dir data/tes]
+    python export.py quantize [--calib-dir data/train] [--eval-dir data/tes] [--output EfficientNet_self1_int8.pt]
+    python export.py torchscript [--weights EfficientNet_self1.pth] [--batch-size 1 --batch-size 32]
+    python export.py checkpoint [--weights EfficientNet_self1.pth] [--output EfficientNet_self1.ckpt | --in-place]
+"""
+import os
+import sys
+import time
+import argparse
+from configparser import ConfigParser
+
+import numpy as np
+import torch
+from torchvision import datasets
+
+import engine
+import checkpoint
+
+# 获取当前文件所在目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+TEST_DIR = os.path.join(current_dir, "data/tes")
+TRAIN_DIR = os.path.join(current_dir, "data/train")
+
+
+def read_quantization_config(filename=engine.CONFIG_PATH, section='quantization'):
+    """读取config.ini中的量化配置：受保护的缺陷类别及其允许的最大准确率下降"""
+    parser = ConfigParser()
+    parser.read(filename, encoding='utf-8')
+    config = {'guard_classes': ['class5NG', 'class7NG'], 'max_drop': 0.02, 'calib_batches': 32}
+    if parser.has_section(section):
+        guard = parser.get(section, 'guard_classes', fallback='')
+        if guard:
+            config['guard_classes'] = [name.strip() for name in guard.split(',') if name.strip()]
+        config['max_drop'] = parser.getfloat(section, 'max_drop', fallback=0.02)
+        config['calib_batches'] = parser.getint(section, 'calib_batches', fallback=32)
+    return config
+
+
+def export_onnx(weight_path=engine.WEIGHT_PATH, onnx_path=engine.ONNX_PATH, opset=17):
+    """把训练好的权重导出为ONNX模型，批大小维度为动态，可按任意批大小推理"""
+    net = engine.load_eager_model(weight_path)
+    dummy = torch.zeros(1, 3, 224, 224)
+    torch.onnx.export(net, dummy, onnx_path,
+                      input_names=['input'], output_names=['logits'],
+                      dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+                      opset_version=opset)
+    return onnx_path
+
+
+def iter_test_batches(data_dir=TEST_DIR, batch_size=32):
+    """按批读取测试集（ImageFolder目录结构），预处理与推理引擎一致"""
+    dataset = datasets.ImageFolder(root=data_dir, transform=engine.data_transform)
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=0)
+    for images, labels in loader:
+        yield images, labels
+
+
+def confusion_matrix(logits, data_dir=TEST_DIR, batch_size=32, num_classes=8):
+    """在ImageFolder目录上评估，返回混淆矩阵 (行: 真实类别, 列: 预测类别)"""
+    matrix = np.zeros((num_classes, num_classes), dtype=np.int64)
+    with torch.inference_mode():
+        for images, labels in iter_test_batches(data_dir, batch_size):
+            preds = logits(images).argmax(dim=1)
+            matrix += np.bincount(labels.numpy() * num_classes + preds.numpy(),
+                                  minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+    return matrix
+
+
+def per_class_accuracy(matrix):
+    """每个类别的准确率（召回率），没有样本的类别为 nan"""
+    totals = matrix.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.diag(matrix) / totals
+
+
+def quantize_model(weight_path=engine.WEIGHT_PATH, calib_dir=TRAIN_DIR, calib_batches=32, batch_size=16):
+    """
+    训练后量化：特征提取部分做静态int8量化（在训练集上校准激活范围），分类头的Linear层做动态量化
+    返回 (fp32模型, 量化后的TorchScript模型)
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping, default_dynamic_qconfig
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    net = engine.load_eager_model(weight_path)
+    qconfig_mapping = get_default_qconfig_mapping(engine.select_quantized_engine())
+    qconfig_mapping.set_module_name('classifier', default_dynamic_qconfig)
+    example = (torch.zeros(1, 3, 224, 224),)
+    prepared = prepare_fx(engine.load_eager_model(weight_path), qconfig_mapping, example)
+
+    # 校准：用训练集（验证集的预处理，不做随机增强）统计各层激活的取值范围
+    with torch.inference_mode():
+        for index, (images, labels) in enumerate(iter_test_batches(calib_dir, batch_size)):
+            if index >= calib_batches:
+                break
+            prepared(images)
+
+    quantized = convert_fx(prepared)
+    scripted = torch.jit.freeze(torch.jit.trace(quantized, example).eval())
+    return net, scripted
+
+
+def compare_logits(reference, candidate, data_dir=TEST_DIR, batch_size=32):
+    """
+    逐批比较两个推理引擎在测试集上的 logits
+    返回 (样本数, 最大绝对误差, 预测类别不一致的样本数, 参考耗时, 待测耗时)
+    """
+    count, max_diff, mismatches = 0, 0.0, 0
+    t_ref = t_new = 0.0
+    with torch.inference_mode():
+        for images, labels in iter_test_batches(data_dir, batch_size):
+            start = time.perf_counter()
+            expected = reference.logits(images)
+            t_ref += time.perf_counter() - start
+            start = time.perf_counter()
+            actual = candidate.logits(images)
+            t_new += time.perf_counter() - start
+
+            count += len(images)
+            max_diff = max(max_diff, float((expected - actual).abs().max()))
+            mismatches += int((expected.argmax(dim=1) != actual.argmax(dim=1)).sum())
+    return count, max_diff, mismatches, t_ref, t_new
+
+
+def cmd_onnx(args):
+    """导出ONNX模型，并在测试集上与 eager 模式比较 logits"""
+    export_onnx(args.weights, args.output, args.opset)
+    print(f"ONNX模型已导出到: {args.output}")
+
+    if not os.path.isdir(args.check_dir):
+        print(f"测试集目录不存在，跳过一致性校验: {args.check_dir}")
+        return 0
+
+    eager = engine.InferenceEngine(args.weights, warmup=False)
+    onnx = engine.InferenceEngine(args.weights, warmup=False, backend='onnxruntime', onnx_path=args.output)
+    count, max_diff, mismatches, t_ref, t_new = compare_logits(eager, onnx, args.check_dir, args.batch_size)
+    print(f"测试集样本数: {count}")
+    print(f"logits 最大绝对误差: {max_diff:.2e} (允许 {args.atol:.0e})")
+    print(f"预测类别不一致: {mismatches}")
+    print(f"eager: {t_ref * 1000:.1f} ms, onnxruntime: {t_new * 1000:.1f} ms ({t_ref / max(t_new, 1e-9):.2f}x)")
+    if max_diff > args.atol or mismatches:
+        print("一致性校验失败")
+        return 1
+    print("一致性校验通过")
+    return 0
+
+
+def cmd_quantize(args):
+    """int8量化：对比fp32模型的各类别准确率与混淆矩阵，受保护类别准确率下降超过阈值时不写出模型"""
+    config = read_quantization_config()
+    max_drop = config['max_drop'] if args.max_drop is None else args.max_drop
+    for path in (args.calib_dir, args.eval_dir):
+        if not os.path.isdir(path):
+            print(f"数据目录不存在: {path}")
+            return 1
+
+    start = time.perf_counter()
+    net, quantized = quantize_model(args.weights, args.calib_dir, config['calib_batches'])
+    print(f"量化完成: {time.perf_counter() - start:.1f} s (校准 {config['calib_batches']} 批)")
+
+    classes = datasets.ImageFolder(root=args.eval_dir).classes
+    fp32_matrix = confusion_matrix(net, args.eval_dir, num_classes=len(classes))
+    int8_matrix = confusion_matrix(quantized, args.eval_dir, num_classes=len(classes))
+    fp32_acc = per_class_accuracy(fp32_matrix)
+    int8_acc = per_class_accuracy(int8_matrix)
+
+    total = fp32_matrix.sum()
+    print(f"总体准确率: fp32 {np.trace(fp32_matrix) / total:.4f}, int8 {np.trace(int8_matrix) / total:.4f}")
+    print(f"{'类别':<10}{'样本数':>8}{'fp32':>10}{'int8':>10}{'变化':>10}")
+    for index, name in enumerate(classes):
+        print(f"{name:<10}{fp32_matrix[index].sum():>8}{fp32_acc[index]:>10.4f}{int8_acc[index]:>10.4f}"
+              f"{int8_acc[index] - fp32_acc[index]:>+10.4f}")
+    print("混淆矩阵变化 (int8 - fp32，行: 真实类别, 列: 预测类别):")
+    print(int8_matrix - fp32_matrix)
+
+    # 准确率门限：受保护的缺陷类别不允许明显退化
+    failed = []
+    for name in config['guard_classes']:
+        if name not in classes:
+            print(f"测试集中没有受保护类别: {name}")
+            continue
+        index = classes.index(name)
+        drop = fp32_acc[index] - int8_acc[index]
+        if drop > max_drop:
+            failed.append(f"{name} 下降 {drop:.4f}")
+    if failed:
+        print(f"准确率下降超过阈值 {max_drop}，不写出量化模型: {', '.join(failed)}")
+        return 1
+
+    save_scripted(quantized, args.output)
+    print(f"量化模型已保存到: {args.output}")
+    return 0
+
+
+def save_scripted(module, path):
+    """写出TorchScript模型（先写临时文件再替换，避免中途退出留下损坏的文件）"""
+    tmp_path = path + ".tmp"
+    module.save(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def measure_latency(net, batch_size, repeat=10):
+    """单次前向的平均耗时（秒），先预热3次"""
+    batch = torch.randn(batch_size, 3, 224, 224)
+    with torch.inference_mode():
+        for _ in range(3):
+            net.logits(batch)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            net.logits(batch)
+    return (time.perf_counter() - start) / repeat
+
+
+def cmd_torchscript(args):
+    """构建TorchScript缓存，对比 eager 与 TorchScript 的启动耗时与单次推理耗时"""
+    cache_path = engine.torchscript_cache_path(args.weights)
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+
+    def startup(backend, optimize=True):
+        start = time.perf_counter()
+        net = engine.InferenceEngine(args.weights, backend=backend, torchscript_optimize=optimize)
+        return net, time.perf_counter() - start
+
+    eager, t_eager = startup('eager')
+    scripted, t_cold = startup('torchscript')
+    scripted, t_warm = startup('torchscript')
+    frozen, t_frozen = startup('torchscript', optimize=False)
+    print(f"TorchScript缓存: {cache_path}")
+    print("启动耗时（含加载与预热）:")
+    print(f"  eager:                         {t_eager * 1000:.0f} ms")
+    print(f"  torchscript 首次（构建缓存）:  {t_cold * 1000:.0f} ms")
+    print(f"  torchscript 命中缓存:          {t_warm * 1000:.0f} ms")
+    print(f"  torchscript 命中缓存(不优化):  {t_frozen * 1000:.0f} ms")
+
+    print("单次推理耗时:")
+    for batch_size in args.batch_size or [1, 32]:
+        t_ref = measure_latency(eager, batch_size, args.repeat)
+        t_opt = measure_latency(scripted, batch_size, args.repeat)
+        t_fr = measure_latency(frozen, batch_size, args.repeat)
+        print(f"  批大小 {batch_size:>3}: eager {t_ref * 1000:.1f} ms, "
+              f"torchscript {t_opt * 1000:.1f} ms ({t_ref / t_opt:.2f}x), "
+              f"不优化 {t_fr * 1000:.1f} ms ({t_ref / t_fr:.2f}x)")
+    return 0
+
+
+def cmd_checkpoint(args):
+    """把旧的 state_dict 权重文件转换为自包含检查点，并对比两种格式的模型加载耗时"""
+    if args.in_place:
+        args.output = args.weights
+    elif args.output is None:
+        args.output = os.path.splitext(args.weights)[0] + ".ckpt"
+    state = checkpoint.load_checkpoint(args.weights)
+    if state['version'] == 0:
+        net = checkpoint.build_model(state)
+        checkpoint.save_checkpoint(net, args.output, state['class_indices'])
+        print(f"已转换为自包含检查点: {args.output}")
+    else:
+        print(f"已经是自包含检查点 (版本 {state['version']}): {args.weights}")
+        args.output = args.weights
+
+    start = time.perf_counter()
+    checkpoint.build_model(checkpoint.load_checkpoint(args.output))
+    t_new = time.perf_counter() - start
+    print(f"自包含检查点加载: {t_new * 1000:.0f} ms")
+
+    # 旧的加载方式：先构建带ImageNet预训练权重的模型，再用训练好的权重覆盖（离线时可能失败）
+    try:
+        from model import model
+        start = time.perf_counter()
+        net = model()
+        net.load_state_dict(state['state_dict'])
+        t_old = time.perf_counter() - start
+        print(f"旧方式加载(预训练权重 + 覆盖): {t_old * 1000:.0f} ms ({t_old / t_new:.2f}x)")
+    except Exception as e:
+        print(f"旧方式加载失败（需要联网或本地缓存的预训练权重）: {e}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型导出与一致性校验")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    onnx_parser = subparsers.add_parser('onnx', help="导出ONNX模型（动态批大小）")
+    onnx_parser.add_argument('--weights', default=engine.WEIGHT_PATH)
+    onnx_parser.add_argument('--output', default=engine.ONNX_PATH)
+    onnx_parser.add_argument('--opset', type=int, default=17)
+    onnx_parser.add_argument('--check-dir', default=TEST_DIR, help="一致性校验使用的测试集目录")
+    onnx_parser.add_argument('--batch-size', type=int, default=32)
+    onnx_parser.add_argument('--atol', type=float, default=1e-3, help="logits 允许的最大绝对误差")
+    onnx_parser.set_defaults(func=cmd_onnx)
+
+    quantize_parser = subparsers.add_parser('quantize', help="int8训练后量化（带准确率门限）")
+    quantize_parser.add_argument('--weights', default=engine.WEIGHT_PATH)
+    quantize_parser.add_argument('--output', default=engine.QUANTIZED_PATH)
+    quantize_parser.add_argument('--calib-dir', default=TRAIN_DIR, help="校准使用的训练集目录")
+    quantize_parser.add_argument('--eval-dir', default=TEST_DIR, help="准确率对比使用的测试集目录")
+    quantize_parser.add_argument('--max-drop', type=float, default=None,
+                                 help="受保护类别允许的最大准确率下降，默认取config.ini中[quantization]的max_drop")
+    quantize_parser.set_defaults(func=cmd_quantize)
+
+    torchscript_parser = subparsers.add_parser('torchscript', help="构建TorchScript缓存并对比耗时")
+    torchscript_parser.add_argument('--weights', default=engine.WEIGHT_PATH)
+    torchscript_parser.add_argument('--batch-size', type=int, action='append', default=None,
+                                    help="对比的批大小，可多次指定")
+    torchscript_parser.add_argument('--repeat', type=int, default=10)
+    torchscript_parser.set_defaults(func=cmd_torchscript)
+
+    checkpoint_parser = subparsers.add_parser('checkpoint', help="转换为自包含检查点并对比加载耗时")
+    checkpoint_parser.add_argument('--weights', default=engine.WEIGHT_PATH)
+    checkpoint_output = checkpoint_parser.add_mutually_exclusive_group()
+    checkpoint_output.add_argument('--output', default=None, help="输出路径，默认与权重文件同名、扩展名为 .ckpt")
+    checkpoint_output.add_argument('--in-place', action='store_true', help="直接覆盖原权重文件")
+    checkpoint_parser.set_defaults(func=cmd_checkpoint)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+冻结主干网络的特征缓存
+
+model() 冻结了 EfficientNet 主干的全部参数，训练时只有分类头在更新。这里对每张图像只做一次主干前向，
+把池化后的1280维特征按4种翻转组合（不翻转、水平、垂直、水平+垂直，即训练时随机翻转的全部结果）
+写入内存映射的 .npy 文件，之后每个 epoch 只需在缓存的特征上训练分类头。
+
+随机水平翻转(p=0.5)与随机垂直翻转(p=0.5)相互独立，等价于在4种组合中等概率选一种，
+因此每个 epoch 为每个样本随机选一个组合，与原来的数据增强分布一致。
+"""
+import os
+import json
+
+import numpy as np
+import torch
+
+# 4种翻转组合对应的张量维度 (N, C, H, W)：W为水平方向，H为垂直方向
+FLIPS = ((), (3,), (2,), (2, 3))
+FEATURE_DIM = 1280
+
+
+def backbone_features(net, images):
+    """主干网络前向：特征提取 + 全局平均池化，返回 (N, 1280)"""
+    return torch.flatten(net.avgpool(net.features(images)), 1)
+
+
+def _meta(dataset, flips):
+    return {'samples': [[os.path.relpath(path, dataset.root), label] for path, label in dataset.samples],
+            'flips': [list(flip) for flip in flips]}
+
+
+def extract_features(net, dataset, cache_dir, name, flips=FLIPS, batch_size=32):
+    """
+    提取并缓存数据集的特征，缓存与数据集的样本列表一致时直接打开
+    dataset: 使用不含随机增强的预处理的 ImageFolder
+    返回 (features, labels)：features 为只读内存映射数组 (N, len(flips), 1280)，labels 为 (N,)
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    feature_path = os.path.join(cache_dir, f"{name}_features.npy")
+    label_path = os.path.join(cache_dir, f"{name}_labels.npy")
+    meta_path = os.path.join(cache_dir, f"{name}_meta.json")
+
+    meta = _meta(dataset, flips)
+    if os.path.exists(feature_path) and os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == meta:
+                return np.load(feature_path, mmap_mode='r'), np.load(label_path)
+
+    # 缓存不存在或数据集有变化：重新提取（先删除元数据，中途退出时不会误用不完整的缓存）
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    features = np.lib.format.open_memmap(feature_path, mode='w+', dtype=np.float32,
+                                         shape=(len(dataset), len(flips), FEATURE_DIM))
+    labels = np.array([label for path, label in dataset.samples], dtype=np.int64)
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=0)
+
+    net.eval()
+    start = 0
+    with torch.inference_mode():
+        for images, batch_labels in loader:
+            for index, dims in enumerate(flips):
+                flipped = torch.flip(images, dims) if dims else images
+                features[start:start + len(images), index] = backbone_features(net, flipped).numpy()
+            start += len(images)
+            print(f"\r提取特征 [{name}]: {start}/{len(dataset)}", end="")
+    print()
+
+    features.flush()
+    del features
+    np.save(label_path, labels)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    return np.load(feature_path, mmap_mode='r'), labels
+
+
+def sample_flips(features, indices, generator=None):
+    """为每个样本随机选择一种翻转组合，返回 (len(indices), 1280) 的特征张量"""
+    choice = torch.randint(features.shape[1], (len(indices),), generator=generator).numpy()
+    return torch.from_numpy(np.ascontiguousarray(features[indices, choice]))
@@ -20,8 +20,9 @@ CREATE TABLE IF NOT EXISTS picture (
     id INT AUTO_INCREMENT PRIMARY KEY,
     url VARCHAR(500) NOT NULL,
     num INT DEFAULT 0,
-    createtime DATETIME DEFAULT CURRENT_TIMESTAMP,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    createtime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_picture_createtime (createtime)
 );
 
 -- 5. 创建缺陷表
@@ -32,9 +33,12 @@ CREATE TABLE IF NOT EXISTS defect (
     cla VARCHAR(100) NOT NULL,
     prob FLOAT NOT NULL,
     location VARCHAR(255) NOT NULL,
-    createtime DATETIME DEFAULT CURRENT_TIMESTAMP,
+    createtime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (ficid) REFERENCES picture(id) ON DELETE CASCADE
+    FOREIGN KEY (ficid) REFERENCES picture(id) ON DELETE CASCADE,
+    -- 检测历史按检测时间、类别筛选（已有数据库执行 migrate_history_indexes.sql 添加，createtime 同时改为 NOT NULL）
+    INDEX idx_defect_createtime (createtime),
+    INDEX idx_defect_cla_createtime (cla, createtime)
 );
 
 -- 6. 插入默认管理员用户（可选）
@@ -0,0 +1,87 @@
+"""
+多进程数据并行训练启动器（CPU，gloo 后端）
+
+在本机启动 N 个训练进程，按 torchrun 的约定设置环境变量 WORLD_SIZE/RANK/LOCAL_RANK/MASTER_ADDR/MASTER_PORT，
+train.py 据此初始化进程组。多台机器时在每台机器上各运行一次，--node-rank 依次为 0..nnodes-1，
+--master-addr 都填0号机器的地址（各机器需能访问该地址的 --master-port 端口）。
+
+每个进程的计算线程数默认为 本机CPU核数 / 进程数，避免多个进程的线程互相争抢。
+
+用法:
+    python launch.py --nproc 4 train.py --mode features --epochs 20
+    # 两台机器，每台4个进程
+    python launch.py --nnodes 2 --node-rank 0 --master-addr 192.168.1.10 --nproc 4 train.py --epochs 20
+    python launch.py --nnodes 2 --node-rank 1 --master-addr 192.168.1.10 --nproc 4 train.py --epochs 20
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+MASTER_PORT = 29500
+
+
+def launch(script, script_args, nproc=1, nnodes=1, node_rank=0, master_addr='127.0.0.1',
+           master_port=MASTER_PORT, threads=None, cwd=None):
+    """启动本机的 nproc 个进程并等待结束，任一进程失败时结束其余进程，返回退出码"""
+    if threads is None:
+        threads = max(1, (os.cpu_count() or 1) // nproc)
+    processes = []
+    for local_rank in range(nproc):
+        env = dict(os.environ)
+        env.update({
+            'WORLD_SIZE': str(nnodes * nproc),
+            'RANK': str(node_rank * nproc + local_rank),
+            'LOCAL_RANK': str(local_rank),
+            'LOCAL_WORLD_SIZE': str(nproc),
+            'MASTER_ADDR': master_addr,
+            'MASTER_PORT': str(master_port),
+            'OMP_NUM_THREADS': str(threads),
+        })
+        processes.append(subprocess.Popen([sys.executable, script] + list(script_args), env=env, cwd=cwd))
+
+    status = 0
+    try:
+        while processes:
+            for process in list(processes):
+                code = process.poll()
+                if code is None:
+                    continue
+                processes.remove(process)
+                if code != 0:
+                    print(f"训练进程 {process.pid} 异常退出: {code}，结束其余进程")
+                    status = code
+                    for other in processes:
+                        other.terminate()
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        status = 1
+    for process in processes:
+        process.wait()
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程数据并行训练启动器")
+    parser.add_argument('--nproc', type=int, default=1, help="本机进程数")
+    parser.add_argument('--nnodes', type=int, default=1, help="机器数")
+    parser.add_argument('--node-rank', type=int, default=0, help="本机序号（0..nnodes-1）")
+    parser.add_argument('--master-addr', default='127.0.0.1', help="0号机器的地址")
+    parser.add_argument('--master-port', type=int, default=MASTER_PORT)
+    parser.add_argument('--threads', type=int, default=None, help="每个进程的计算线程数，默认 CPU核数/进程数")
+    parser.add_argument('script', help="训练脚本，如 train.py")
+    parser.add_argument('script_args', nargs=argparse.REMAINDER, help="传给训练脚本的参数")
+    args = parser.parse_args()
+
+    if not 0 <= args.node_rank < args.nnodes:
+        print(f"--node-rank 应在 0..{args.nnodes - 1} 之间")
+        return 2
+    return launch(args.script, args.script_args, args.nproc, args.nnodes, args.node_rank, args.master_addr,
+                  args.master_port, args.threads)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+分类指标累加器
+
+在训练/验证的前向过程中逐批累加损失、准确率与混淆矩阵，不需要为统计指标再额外遍历一遍数据集。
+"""
+import numpy as np
+import torch
+import torch.distributed as dist
+
+
+class MetricsAccumulator:
+    """逐批累加：样本加权的平均损失、准确率、混淆矩阵 (行: 真实类别, 列: 预测类别)"""
+
+    def __init__(self, num_classes=8):
+        self.num_classes = num_classes
+        self.reset()
+
+    def reset(self):
+        self.loss_sum = 0.0
+        self.count = 0
+        self.confusion = np.zeros((self.num_classes, self.num_classes), dtype=np.int64)
+
+    def update(self, outputs, labels, loss=None):
+        """outputs: logits (N, C)；labels: (N,)；loss: 该批的平均损失（张量或数值）"""
+        preds = torch.argmax(outputs.detach(), dim=1).cpu().numpy()
+        labels = labels.cpu().numpy()
+        if outputs.shape[1] > self.num_classes:
+            # 分类头输出的类别数多于数据集的类别数时，按输出维度扩大混淆矩阵
+            self._grow(outputs.shape[1])
+        n = self.num_classes
+        # 一次 bincount 得到整批的混淆矩阵增量
+        self.confusion += np.bincount(labels * n + preds, minlength=n * n).reshape(n, n)
+        if loss is not None:
+            self.loss_sum += float(loss) * len(labels)
+        self.count += len(labels)
+
+    def _grow(self, num_classes):
+        """扩大混淆矩阵到 num_classes 类"""
+        confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        confusion[:self.num_classes, :self.num_classes] = self.confusion
+        self.confusion = confusion
+        self.num_classes = num_classes
+
+    def all_reduce(self):
+        """多进程训练时汇总所有进程的累加结果（各进程调用后得到相同的全局指标），未初始化进程组时不做任何事"""
+        if not (dist.is_available() and dist.is_initialized()) or dist.get_world_size() == 1:
+            return self
+        size = torch.tensor([self.num_classes], dtype=torch.int64)
+        dist.all_reduce(size, op=dist.ReduceOp.MAX)
+        if int(size) > self.num_classes:
+            self._grow(int(size))
+        # 损失和以 float64 汇总；计数与混淆矩阵为整数，汇总结果精确
+        loss_sum = torch.tensor([self.loss_sum], dtype=torch.float64)
+        counts = torch.from_numpy(np.append(self.confusion.ravel(), self.count))
+        dist.all_reduce(loss_sum)
+        dist.all_reduce(counts)
+        self.loss_sum = float(loss_sum)
+        counts = counts.numpy()
+        self.confusion = counts[:-1].reshape(self.num_classes, self.num_classes)
+        self.count = int(counts[-1])
+        return self
+
+    @property
+    def loss(self):
+        return self.loss_sum / max(self.count, 1)
+
+    @property
+    def accuracy(self):
+        return float(np.trace(self.confusion)) / max(self.count, 1)
+
+    def per_class_accuracy(self):
+        """每个类别的准确率（召回率），没有样本的类别为 nan"""
+        totals = self.confusion.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.diag(self.confusion) / totals
+
+    def per_class_precision(self):
+        """每个类别的精确率（预测为该类的样本中预测正确的比例），没有预测为该类的样本时为 nan"""
+        totals = self.confusion.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.diag(self.confusion) / totals
@@ -0,0 +1,27 @@
+-- 检测历史按检测时间、类别筛选、分页所需的表结构调整
+-- 已有数据库执行一次即可（新建的数据库由 init_database.sql 直接按调整后的结构创建）:
+--     mysql -u root -p < migrate_history_indexes.sql
+-- ALGORITHM=INPLACE, LOCK=NONE: 在线修改，执行期间检测程序可以继续写入
+
+USE lanmo;
+
+-- 历史记录按 (createtime, id) 分页，createtime 为 NULL 的行会让之后的页全部为空：
+-- 先用入库时间补齐缺失的检测时间，再改为 NOT NULL
+UPDATE picture SET createtime = COALESCE(created_at, NOW()) WHERE createtime IS NULL;
+UPDATE defect SET createtime = COALESCE(created_at, NOW()) WHERE createtime IS NULL;
+
+-- 图片记录按检测时间筛选、分页
+ALTER TABLE picture
+    MODIFY createtime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ADD INDEX idx_picture_createtime (createtime),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- 缺陷记录按检测时间筛选、分页；按类别 + 检测时间筛选（同一类别内按时间有序，分页不需要排序）
+ALTER TABLE defect
+    MODIFY createtime DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ADD INDEX idx_defect_createtime (createtime),
+    ADD INDEX idx_defect_cla_createtime (cla, createtime),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+SHOW INDEX FROM picture;
+SHOW INDEX FROM defect;
@@ -2,13 +2,19 @@ import torch
 import torch.nn as nn
 import torchvision.models as models
 
-def model():
+# 模型结构标识与分类头各层的维度（1280维特征 -> 512 -> 256 -> 8类）
+ARCH = 'efficientnet_b0'
+HEAD = (1280, 512, 256, 8)
+
+def model(pretrained=True, head=HEAD):
     """
     创建EfficientNet模型用于锂电池隔膜缺陷检测
     返回修改后的EfficientNet模型，输出8个类别
+    pretrained: 是否加载ImageNet预训练权重（训练时使用；推理时权重随后会被覆盖，传 False 避免下载）
     """
     # 加载预训练的EfficientNet-B0，使用新的weights参数
-    efficientnet = models.efficientnet_b0(weights=models.EfficientNet_B0_Weights.IMAGENET1K_V1)
+    weights = models.EfficientNet_B0_Weights.IMAGENET1K_V1 if pretrained else None
+    efficientnet = models.efficientnet_b0(weights=weights)
     
     # 冻结特征提取层参数
     for param in efficientnet.parameters():
@@ -18,19 +24,20 @@ def model():
     # EfficientNet的最后一层是classifier，输入特征维度是1280
     efficientnet.classifier = nn.Sequential(
         nn.Dropout(p=0.2, inplace=False),  # 改为inplace=False
-        nn.Linear(1280, 512),
+        nn.Linear(head[0], head[1]),
         nn.ReLU(inplace=False),  # 改为inplace=False
         nn.Dropout(p=0.2, inplace=False),  # 改为inplace=False
-        nn.Linear(512, 256),
+        nn.Linear(head[1], head[2]),
         nn.ReLU(inplace=False),  # 改为inplace=False
-        nn.Linear(256, 8),  # 8个输出类别
+        nn.Linear(head[2], head[3]),  # 8个输出类别
     )
     
     return efficientnet
 
-def get_model_summary():
-    """获取模型结构摘要"""
-    model_instance = model()
+def get_model_summary(model_instance=None):
+    """获取模型结构摘要（参数量与权重无关，未传入模型时不加载预训练权重）"""
+    if model_instance is None:
+        model_instance = model(pretrained=False)
     total_params = sum(p.numel() for p in model_instance.parameters())
     trainable_params = sum(p.numel() for p in model_instance.parameters() if p.requires_grad)
     
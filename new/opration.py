@@ -1,406 +1,328 @@
-from mysql.connector import MySQLConnection, Error
-from read_config import read_db_config
+import time
+
+from mysql.connector import Error
+
+from db_pool import get_pool
+
+# 所有操作共用进程内的连接池（db_pool.py）：数据库配置只读取一次，连接复用，语句以预处理方式执行
+
+# 批量写入时每条多行 INSERT 的最大行数（避免超过服务器的 max_allowed_packet）
+BULK_ROWS = 1000
+# 分页查询每页的行数
+PAGE_SIZE = 200
+# 分页查询只读取界面需要的列（createtime 放在最后一列，作为下一页的起点）
+PICTURE_COLUMNS = "id, url, num, createtime"
+DEFECT_COLUMNS = "id, ficid, url, cla, prob, location, createtime"
+
+
+def _fetchall(query, args=()):
+    with get_pool().cursor(query) as cursor:
+        cursor.execute(query, args)
+        return cursor.fetchall()
+
+
+def _execute(query, args):
+    """执行单条写入语句，返回 lastrowid"""
+    with get_pool().cursor(query) as cursor:
+        cursor.execute(query, args)
+
+        if cursor.lastrowid:
+            print('last insert id', cursor.lastrowid)
+        else:
+            print('last insert id not found')
+        return cursor.lastrowid
+
+
+def _executemany(query, rows):
+    # 普通游标的 executemany 会把多行合并为一条多行 INSERT
+    with get_pool().cursor(query, prepared=False) as cursor:
+        cursor.executemany(query, rows)
+
 
 def query_login(username, password):
     query = "SELECT * FROM user WHERE username = %s AND password = %s"
     args = (username, password,)
-    
-    conn = None
-    cursor = None
-    try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
 
-        cursor = conn.cursor()
-        cursor.execute(query, args)
-        results = cursor.fetchall()
-        conn.commit()
-        return results
+    try:
+        return _fetchall(query, args)
     except Error as e:
         print('Error:', e)
         return []
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 def query_username(username):
     query = "SELECT * FROM user WHERE username = %s"
     args = (username,)
-    
-    conn = None
-    cursor = None
-    try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
 
-        cursor = conn.cursor()
-        cursor.execute(query, args)
-        results = cursor.fetchall()
-        conn.commit()
-        return results
+    try:
+        return _fetchall(query, args)
     except Error as e:
         print('Error:', e)
         return []
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 
 def insert_user(username, password):
     query = "INSERT INTO user(username, password) " \
             "VALUES(%s,%s)"
     args = (username, password)
-    
-    conn = None
-    cursor = None
-    try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
 
-        cursor = conn.cursor()
-        cursor.execute(query, args)
-
-        if cursor.lastrowid:
-            print('last insert id', cursor.lastrowid)
-        else:
-            print('last insert id not found')
-
-        conn.commit()
-        return cursor.lastrowid
+    try:
+        return _execute(query, args)
     except Error as error:
         print(error)
         return None
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 
 def delete_user(id):
     query = "DELETE FROM user WHERE id = %s"  # 修复SQL语法错误：FROM不是FORM
     args = (id,)
-    
-    conn = None
-    cursor = None
-    try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
-
-        cursor = conn.cursor()
-        cursor.execute(query, args)
-
-        if cursor.lastrowid:
-            print('last insert id', cursor.lastrowid)
-        else:
-            print('last insert id not found')
 
-        conn.commit()
+    try:
+        _execute(query, args)
     except Error as error:
         print(error)
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 
 def insert_picture(url, num, createtime):
     query = "INSERT INTO picture(url, num, createtime) " \
             "VALUES(%s,%s,%s)"
     args = (url, num, createtime)
-    
-    conn = None
-    cursor = None
-    try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
-
-        cursor = conn.cursor()
-        cursor.execute(query, args)
-
-        if cursor.lastrowid:
-            print('last insert id', cursor.lastrowid)
-        else:
-            print('last insert id not found')
 
-        conn.commit()
-        return cursor.lastrowid
+    try:
+        return _execute(query, args)
     except Error as error:
         print(error)
         return None
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 
 def insert_pictures(pictures):
     query = "INSERT INTO picture(url, num, createtime) " \
             "VALUES(%s,%s,%s)"
-    
-    conn = None
-    cursor = None
-    try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
-
-        cursor = conn.cursor()
-        cursor.executemany(query, pictures)
 
-        conn.commit()
+    try:
+        _executemany(query, pictures)
     except Error as e:
         print('Error:', e)
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 
 def update_picture(id, url, num, createtime):
     query = "UPDATE picture SET url=%s,num=%s,createtime=%s WHERE id = %s"
     args = (url, num, createtime, id)
-    
-    conn = None
-    cursor = None
-    try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
-
-        cursor = conn.cursor()
-        cursor.execute(query, args)
-
-        if cursor.lastrowid:
-            print('last insert id', cursor.lastrowid)
-        else:
-            print('last insert id not found')
 
-        conn.commit()
+    try:
+        _execute(query, args)
     except Error as error:
         print(error)
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 
 def delete_picture(id):
     query = "DELETE FROM picture WHERE id = %s"  # 修复SQL语法错误：FROM不是FORM
     args = (id,)
-    
-    conn = None
-    cursor = None
-    try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
-
-        cursor = conn.cursor()
-        cursor.execute(query, args)
-
-        if cursor.lastrowid:
-            print('last insert id', cursor.lastrowid)
-        else:
-            print('last insert id not found')
 
-        conn.commit()
+    try:
+        _execute(query, args)
     except Error as error:
         print(error)
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 
 def insert_defect(ficid, url, cla, prob, location, createtime):
     query = "INSERT INTO defect(ficid, url, cla, prob, location, createtime) " \
             "VALUES(%s,%s,%s,%s,%s,%s)"
     args = (ficid, url, cla, prob, location, createtime)
-    
-    conn = None
-    cursor = None
-    try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
 
-        cursor = conn.cursor()
-        cursor.execute(query, args)
-
-        if cursor.lastrowid:
-            print('last insert id', cursor.lastrowid)
-        else:
-            print('last insert id not found')
-
-        conn.commit()
+    try:
+        _execute(query, args)
     except Error as error:
         print(error)
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 
 def update_defect(id, ficid, url, cla, prob, location, createtime):
     query = "UPDATE defect SET ficid=%s,url=%s,cla=%s,prob=%s,location=%s," \
             "createtime=%s WHERE id = %s"
     args = (ficid, url, cla, prob, location, createtime, id)
-    
-    conn = None
-    cursor = None
-    try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
-
-        cursor = conn.cursor()
-        cursor.execute(query, args)
 
-        if cursor.lastrowid:
-            print('last insert id', cursor.lastrowid)
-        else:
-            print('last insert id not found')
-
-        conn.commit()
+    try:
+        _execute(query, args)
     except Error as error:
         print(error)
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 
 def delete_defect(id):
     query = "DELETE FROM defect WHERE id = %s"  # 修复SQL语法错误：FROM不是FORM
     args = (id,)
-    
-    conn = None
-    cursor = None
-    try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
-
-        cursor = conn.cursor()
-        cursor.execute(query, args)
 
-        if cursor.lastrowid:
-            print('last insert id', cursor.lastrowid)
-        else:
-            print('last insert id not found')
-
-        conn.commit()
+    try:
+        _execute(query, args)
     except Error as error:
         print(error)
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 
 def insert_defects(defects):
     query = "INSERT INTO defect(ficid, url, cla, prob, location, createtime) " \
             "VALUES(%s,%s,%s,%s,%s,%s)"
-    
-    conn = None
-    cursor = None
-    try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
-
-        cursor = conn.cursor()
-        cursor.executemany(query, defects)
 
-        conn.commit()
+    try:
+        _executemany(query, defects)
     except Error as e:
         print('Error:', e)
+
+
+PICTURE_INSERT = "INSERT INTO picture(url, num, createtime) " \
+                 "VALUES(%s,%s,%s)"
+DEFECT_INSERT = "INSERT INTO defect(ficid, url, cla, prob, location, createtime) " \
+                "VALUES(%s,%s,%s,%s,%s,%s)"
+
+
+def _insert_result(pooled, url, num, createtime, defects):
+    """在已开启事务的连接上写入一张图片及其缺陷，返回 (picid, 写入行数)"""
+    # 与其他语句一样按连接池配置决定是否使用预处理语句；普通游标用完即关闭
+    prepared = get_pool().prepared
+    cursor = pooled.cursor(PICTURE_INSERT, prepared)
+    try:
+        cursor.execute(PICTURE_INSERT, (url, num, createtime))
+        picid = cursor.lastrowid
     finally:
-        if cursor:
+        if not prepared:
             cursor.close()
-        if conn:
-            conn.close()
+
+    rows = [(picid,) + tuple(defect) for defect in defects]
+    cursor = pooled.cursor(DEFECT_INSERT, prepared=False)
+    try:
+        for index in range(0, len(rows), BULK_ROWS):
+            cursor.executemany(DEFECT_INSERT, rows[index:index + BULK_ROWS])
+    finally:
+        cursor.close()
+    return picid, 1 + len(rows)
+
+
+def save_picture_with_defects(url, num, createtime, defects):
+    """
+    在一个事务中写入一张图片及其全部缺陷：picture 一行，defect 按批 executemany（合并为多行 INSERT），
+    只使用一个连接、提交一次；任何一步失败整体回滚，不会留下只写了一半的图片记录
+    defects: [(url, cla, prob, location, createtime), ...]，ficid 取新插入图片的 id
+    返回 (picid, 写入行数, 耗时秒)，失败时返回 None
+    """
+    start = time.perf_counter()
+    try:
+        with get_pool().transaction() as pooled:
+            picid, rows = _insert_result(pooled, url, num, createtime, defects)
+        return picid, rows, time.perf_counter() - start
+    except Error as error:
+        print(error)
+        return None
+
+
+def save_results(results):
+    """
+    在一个事务中写入多张图片的检测结果，results: [(url, num, createtime, defects), ...]
+    返回写入的总行数；出错时整体回滚并抛出 mysql.connector.Error（由调用方决定重试或暂存，见 result_sink.py）
+    """
+    total = 0
+    with get_pool().transaction() as pooled:
+        for url, num, createtime, defects in results:
+            total += _insert_result(pooled, url, num, createtime, defects)[1]
+    return total
 
 
 def queryAll_picture():
     query = "SELECT * FROM picture"
-    
-    conn = None
-    cursor = None
+
     try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
-
-        cursor = conn.cursor()
-        cursor.execute(query)
-        results = cursor.fetchall()
-        conn.commit()
-        return results
+        return _fetchall(query)
     except Error as e:
         print('数据库查询错误:', e)
         print('注意: 如果您没有配置MySQL数据库，请忽略此错误。程序将继续运行。')
         return []  # 返回空列表，避免程序崩溃
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+
+
+def _page_query(table, columns, conditions, args, before, limit):
+    """
+    按 (createtime, id) 从新到旧的 keyset 分页查询：before 为上一页最后一行的 (createtime, id)，None 表示第一页
+    createtime 为 NOT NULL（init_database.sql / migrate_history_indexes.sql），分页条件不需要处理 NULL，
+    排序与条件直接使用列本身（套 COALESCE 等函数会用不上索引）
+    筛选条件与分页条件都在数据库中执行，配合 createtime / (cla, createtime) 索引，每页只读取需要的行，
+    不论翻到第几页、表有多大，每页的耗时都相同（OFFSET 分页需要先扫描并丢弃前面的所有行）
+    """
+    conditions, args = list(conditions), list(args)
+    if before is not None:
+        conditions.append("(createtime < %s OR (createtime = %s AND id < %s))")
+        args += [before[0], before[0], before[1]]
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"SELECT {columns} FROM {table}{where} ORDER BY createtime DESC, id DESC LIMIT %s"
+    return query, tuple(args) + (limit,)
+
+
+def _time_conditions(start, end):
+    """检测时间范围：start <= createtime < end，None 表示不限"""
+    conditions, args = [], []
+    if start is not None:
+        conditions.append("createtime >= %s")
+        args.append(start)
+    if end is not None:
+        conditions.append("createtime < %s")
+        args.append(end)
+    return conditions, args
+
+
+def picture_page_query(start=None, end=None, before=None, limit=PAGE_SIZE):
+    """图片记录分页查询的 SQL 与参数（见 query_picture_page）"""
+    conditions, args = _time_conditions(start, end)
+    return _page_query("picture", PICTURE_COLUMNS, conditions, args, before, limit)
+
+
+def defect_page_query(start=None, end=None, cla=None, min_prob=None, max_prob=None, before=None, limit=PAGE_SIZE):
+    """缺陷记录分页查询的 SQL 与参数（见 query_defect_page）"""
+    conditions, args = _time_conditions(start, end)
+    if cla is not None:
+        conditions.insert(0, "cla = %s")
+        args.insert(0, cla)
+    if min_prob is not None:
+        conditions.append("prob >= %s")
+        args.append(min_prob)
+    if max_prob is not None:
+        conditions.append("prob < %s")
+        args.append(max_prob)
+    return _page_query("defect", DEFECT_COLUMNS, conditions, args, before, limit)
+
+
+def query_picture_page(start=None, end=None, before=None, limit=PAGE_SIZE):
+    """
+    从新到旧分页查询图片记录，返回 [(id, url, num, createtime), ...]
+    start/end: 检测时间范围（start <= createtime < end）；before: 上一页最后一行的 (createtime, id)
+    出错时抛出 mysql.connector.Error（返回空列表会被分页当作已经没有更多记录），由调用方显示错误
+    """
+    return _fetchall(*picture_page_query(start, end, before, limit))
+
+
+def query_defect_page(start=None, end=None, cla=None, min_prob=None, max_prob=None, before=None, limit=PAGE_SIZE):
+    """
+    按检测时间、类别、置信度筛选缺陷记录，从新到旧分页返回 [(id, ficid, url, cla, prob, location, createtime), ...]
+    例如上周置信度低于0.7的漏涂: query_defect_page(start, end, cla="漏涂(class5NG)", max_prob=0.7)
+    start/end: 检测时间范围（start <= createtime < end）；min_prob/max_prob: min_prob <= prob < max_prob；None 表示不限
+    before: 上一页最后一行的 (createtime, id)；出错时抛出 mysql.connector.Error，同 query_picture_page
+    """
+    return _fetchall(*defect_page_query(start, end, cla, min_prob, max_prob, before, limit))
 
 
 def queryAll_defect():
     query = "SELECT * FROM defect"
-    
-    conn = None
-    cursor = None
+
     try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
-
-        cursor = conn.cursor()
-        cursor.execute(query)
-        results = cursor.fetchall()
-        conn.commit()
-        return results
+        return _fetchall(query)
     except Error as e:
         print('数据库查询错误:', e)
         print('注意: 如果您没有配置MySQL数据库，请忽略此错误。程序将继续运行。')
         return []  # 返回空列表，避免程序崩溃
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 def query_defect(fid):
     query = "SELECT * FROM defect WHERE ficid = %s"
     args = (fid,)
-    
-    conn = None
-    cursor = None
-    try:
-        db_config = read_db_config()
-        conn = MySQLConnection(**db_config)
 
-        cursor = conn.cursor()
-        cursor.execute(query, args)
-        results = cursor.fetchall()
-        conn.commit()
-        return results
+    try:
+        return _fetchall(query, args)
     except Error as e:
         print('数据库查询错误:', e)
         print('注意: 如果您没有配置MySQL数据库，请忽略此错误。程序将继续运行。')
         return []  # 返回空列表，避免程序崩溃
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 def main():
     # results = queryAll_picture()
@@ -0,0 +1,400 @@
+"""
+检测结果的后台写入（write-behind）
+
+检测流程只把结果放入有界队列后立即返回，后台线程按条数或时间凑批，一个事务写入 MySQL（opration.save_results）。
+MySQL 不可用（连接失败、断开、连接池等待超时，以及认证、权限、表结构、配置等与数据无关的问题）或队列已满时，结果追加到本地 SQLite 暂存文件（data/spool.sqlite），
+数据库恢复后按提交顺序补写；程序退出时未写入的结果也落到暂存文件，下次启动后继续补写。
+
+数据本身有误（如字段超长）的结果不会一直重试阻塞后面的结果，单独移入暂存文件的 dead 表并打印错误。
+
+用法:
+    python result_sink.py status      # 查看暂存文件中等待补写、写入失败的结果数
+    python result_sink.py replay      # 立即补写暂存的结果
+"""
+import os
+import sys
+import json
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+import traceback
+import itertools
+from collections import deque
+from configparser import ConfigParser
+
+import numpy as np
+from mysql.connector import Error
+from mysql.connector.errors import InterfaceError, OperationalError, PoolError
+
+# 获取当前文件所在目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(current_dir, "config.ini")
+SPOOL_PATH = os.path.join(current_dir, "data", "spool.sqlite")
+
+# 按数据库暂时不可用处理（结果落到暂存文件，之后重试）的错误码：这些错误与数据本身无关，
+# 修好配置、权限或表结构后重试即可写入，不能当作数据有误移入 dead 表
+TRANSIENT_ERRNO = (
+    1040,                # 连接数过多
+    1044, 1045,          # 无权访问数据库、用户名或密码错误
+    1049,                # 数据库不存在
+    1054, 1146,          # 列不存在、表不存在（表结构未创建或未迁移）
+    1142, 1143,          # 无权执行该语句、无权访问该列
+    1205, 1213,          # 锁等待超时、死锁
+    1290, 1792, 1836,    # 服务器只读（维护、主从切换）
+)
+
+
+def read_sink_config(filename=CONFIG_PATH, section='result_sink'):
+    """读取config.ini中的后台写入配置，缺失时使用默认值"""
+    parser = ConfigParser()
+    parser.read(filename, encoding='utf-8')
+    config = {'batch_size': 50, 'flush_interval': 1.0, 'queue_size': 1000, 'retry_interval': 5.0,
+              'spool_path': SPOOL_PATH, 'auto_save': False}
+    if parser.has_section(section):
+        config['batch_size'] = parser.getint(section, 'batch_size', fallback=50)
+        config['flush_interval'] = parser.getfloat(section, 'flush_interval', fallback=1.0)
+        config['queue_size'] = parser.getint(section, 'queue_size', fallback=1000)
+        config['retry_interval'] = parser.getfloat(section, 'retry_interval', fallback=5.0)
+        spool_path = parser.get(section, 'spool_path', fallback='')
+        if spool_path:
+            config['spool_path'] = os.path.join(current_dir, spool_path)
+        config['auto_save'] = parser.getboolean(section, 'auto_save', fallback=False)
+    return config
+
+
+def is_transient(error):
+    """
+    数据库暂时不可用（稍后重试）：连接、认证、权限、表结构、只读等问题，以及 mysql.connector 以外的异常
+    （如读取数据库配置出错）；其余的 mysql.connector 错误视为这条数据本身有误
+    """
+    if not isinstance(error, Error):
+        return True
+    return isinstance(error, (InterfaceError, OperationalError, PoolError)) or \
+        getattr(error, 'errno', None) in TRANSIENT_ERRNO
+
+
+class Spool:
+    """
+    本地暂存文件（SQLite，只追加、按序号顺序读取）
+    spool: 等待补写的结果；dead: 数据有误、无法写入的结果（保留以便排查）
+    """
+
+    def __init__(self, path=SPOOL_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS spool (seq INTEGER PRIMARY KEY, payload TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS dead (seq INTEGER PRIMARY KEY, payload TEXT NOT NULL, "
+                          "error TEXT, time REAL)")
+        self.lock = threading.Lock()
+
+    def append(self, items):
+        """items: [(序号, 结果)]，一个事务写入"""
+        if not items:
+            return
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("INSERT INTO spool(seq, payload) VALUES(?, ?)",
+                                      [(seq, json.dumps(result, ensure_ascii=False)) for seq, result in items])
+
+    def peek(self, limit, before=None):
+        """按序号顺序取出最早的 limit 条（只取序号小于 before 的）"""
+        with self.lock:
+            if before is None:
+                rows = self.conn.execute("SELECT seq, payload FROM spool ORDER BY seq LIMIT ?", (limit,))
+            else:
+                rows = self.conn.execute("SELECT seq, payload FROM spool WHERE seq < ? ORDER BY seq LIMIT ?",
+                                         (before, limit))
+            return [(seq, json.loads(payload)) for seq, payload in rows.fetchall()]
+
+    def remove(self, seqs):
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("DELETE FROM spool WHERE seq = ?", [(seq,) for seq in seqs])
+
+    def bury(self, seq, result, error):
+        """数据有误的结果移入 dead 表（同时从 spool 中删除）"""
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.execute("INSERT OR REPLACE INTO dead(seq, payload, error, time) VALUES(?, ?, ?, ?)",
+                                  (seq, json.dumps(result, ensure_ascii=False), str(error), time.time()))
+                self.conn.execute("DELETE FROM spool WHERE seq = ?", (seq,))
+
+    def count(self, table='spool'):
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def max_seq(self):
+        with self.lock:
+            row = self.conn.execute("SELECT MAX(seq) FROM (SELECT seq FROM spool UNION ALL SELECT seq FROM dead)")
+            return row.fetchone()[0] or 0
+
+    def nbytes(self):
+        """暂存文件占用的字节数（含 WAL 日志）"""
+        return sum(os.path.getsize(path) for path in (self.path, self.path + "-wal") if os.path.exists(path))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class ResultSink:
+    """后台写入检测结果：有界队列 + 按条数/时间凑批的事务写入 + 数据库不可用时落盘暂存、恢复后按序补写"""
+
+    def __init__(self, writer=None, spool_path=SPOOL_PATH, batch_size=50, flush_interval=1.0, queue_size=1000,
+                 retry_interval=5.0):
+        """writer: 在一个事务中写入一批结果的函数，返回写入的行数，默认 opration.save_results"""
+        if writer is None:
+            import opration
+            writer = opration.save_results
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.spool = Spool(spool_path)
+        # 序号接着暂存文件中的最大序号，重启后补写的顺序仍与提交顺序一致
+        self.counter = itertools.count(self.spool.max_seq() + 1)
+        self.counter_lock = threading.Lock()
+
+        self.available = True
+        self.retry_at = 0.0
+        self.last_error = None
+        self.last_flush_error = None
+        self.latencies = deque(maxlen=256)
+        self.flush_rows = deque(maxlen=256)
+        self.stats = {'submitted': 0, 'written': 0, 'replayed': 0, 'spilled': 0, 'overflow': 0, 'dead': 0,
+                      'rows': 0}
+
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="ResultSink", daemon=True)
+        self.thread.start()
+
+    def submit(self, url, num, createtime, defects):
+        """
+        提交一张图片的检测结果，立即返回（不等待数据库）
+        defects: [(url, cla, prob, location, createtime), ...]；队列已满时直接写入本地暂存文件
+        返回 True 表示已进入写入队列，False 表示已直接暂存到本地文件
+        """
+        result = [url, int(num), createtime, [[_plain(value) for value in defect] for defect in defects]]
+        with self.counter_lock:
+            item = (next(self.counter), result)
+        self.stats['submitted'] += 1
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.spool.append([item])
+            self.stats['overflow'] += 1
+            return False
+        return True
+
+    # ---- 后台线程 ----
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch = self._gather()
+                if batch:
+                    self._flush(batch)
+                    batch = []
+                self._replay()
+            except Exception as error:
+                # 意外的错误不能让后台线程退出（否则队列满后所有结果都只能溢出到暂存文件）：
+                # 打印错误，这一批落到暂存文件，稍后重试
+                traceback.print_exc()
+                self._mark_unavailable(error)
+                if batch:
+                    try:
+                        self.spool.append(batch)
+                        self.stats['spilled'] += len(batch)
+                    except Exception:
+                        traceback.print_exc()
+            if self.stopping.is_set() and self.queue.empty():
+                return
+
+    def _gather(self):
+        """等待第一条结果，之后凑满 batch_size 条或等满 flush_interval 秒"""
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self.stopping.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # 停止时不再等待，把队列中剩余的结果一起取出
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _ready(self):
+        return self.available or time.monotonic() >= self.retry_at
+
+    def _flush(self, batch):
+        """写入一批结果；暂存文件中还有更早的结果或数据库不可用时，追加到暂存文件以保持顺序"""
+        if self.spool.count() == 0 and self._ready():
+            done = self._write(batch)
+            self.stats['written'] += done
+            batch = batch[done:]
+        if batch:
+            self.spool.append(batch)
+            self.stats['spilled'] += len(batch)
+
+    def _replay(self):
+        """数据库可用时按序号补写暂存的结果（只补写比队列中最早的结果更早提交的部分）"""
+        while self._ready():
+            with self.queue.mutex:
+                before = self.queue.queue[0][0] if self.queue.queue else None
+            items = self.spool.peek(self.batch_size, before)
+            if not items:
+                return
+            done = self._write(items, spooled=True)
+            self.spool.remove([seq for seq, result in items[:done]])
+            self.stats['replayed'] += done
+            if done < len(items):
+                return
+
+    def _write(self, items, spooled=False):
+        """
+        按顺序写入，返回已处理（写入成功，或数据有误已移入 dead 表）的前几条的条数
+        整批失败且不是连接问题时逐条重试，找出有问题的那条
+        """
+        start = time.perf_counter()
+        try:
+            rows = self.writer([result for seq, result in items])
+        except Exception as error:
+            self.last_flush_error = f"{time.strftime('%H:%M:%S')} {error}"
+            if is_transient(error):
+                self._mark_unavailable(error)
+                return 0
+            if len(items) == 1:
+                seq, result = items[0]
+                print(f"检测结果写入失败，已移入暂存文件的 dead 表 (序号 {seq}): {error}")
+                self.spool.bury(seq, result, error)
+                self.stats['dead'] += 1
+                return 1
+            done = 0
+            for item in items:
+                if self._write([item], spooled) == 0:
+                    break
+                done += 1
+            return done
+        elapsed = time.perf_counter() - start
+        self.latencies.append(elapsed)
+        self.flush_rows.append(rows or 0)
+        self.stats['rows'] += rows or 0
+        if not self.available:
+            print("数据库已恢复，开始补写暂存的检测结果")
+        self.available = True
+        self.last_error = None
+        return len(items)
+
+    def _mark_unavailable(self, error):
+        if self.available:
+            print(f"数据库不可用，检测结果暂存到本地: {error}")
+        self.available = False
+        self.retry_at = time.monotonic() + self.retry_interval
+        self.last_error = str(error)
+
+    # ---- 对外接口 ----
+
+    def close(self, timeout=10.0):
+        """停止后台线程；来不及写入数据库的结果全部落到暂存文件"""
+        self.stopping.set()
+        self.thread.join(timeout)
+        remaining = []
+        while True:
+            try:
+                remaining.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        self.spool.append(remaining)
+        self.stats['spilled'] += len(remaining)
+        if not self.thread.is_alive():
+            self.spool.close()
+
+    def metrics(self):
+        """队列深度、写入耗时（毫秒）、写入速度（最近若干批的 行/秒）、暂存文件大小等运行指标"""
+        latencies = np.array(self.latencies) * 1000
+        seconds = latencies.sum() / 1000
+        return dict(self.stats, **{
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'spool_rows': self.spool.count(),
+            'spool_bytes': self.spool.nbytes(),
+            'dead_rows': self.spool.count('dead'),
+            'db_available': self.available,
+            'last_error': self.last_error,
+            'last_flush_error': self.last_flush_error,
+            'rows_per_sec': float(sum(self.flush_rows) / seconds) if seconds > 0 else None,
+            'flush_latency_ms': {
+                'last': float(latencies[-1]) if len(latencies) else None,
+                'mean': float(latencies.mean()) if len(latencies) else None,
+                'p95': float(np.percentile(latencies, 95)) if len(latencies) else None,
+            },
+        })
+
+
+def _plain(value):
+    """numpy 数值转为 Python 数值，便于写入 JSON 暂存文件"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_sink():
+    """获取进程内共享的后台写入器（首次调用时启动后台线程，程序退出时把未写入的结果落盘）"""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            import atexit
+            config = read_sink_config()
+            _sink = ResultSink(spool_path=config['spool_path'], batch_size=config['batch_size'],
+                               flush_interval=config['flush_interval'], queue_size=config['queue_size'],
+                               retry_interval=config['retry_interval'])
+            atexit.register(_sink.close)
+    return _sink
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检测结果后台写入的本地暂存文件")
+    parser.add_argument('command', choices=['status', 'replay'])
+    parser.add_argument('--spool', default=None, help="暂存文件，默认取config.ini中[result_sink]的配置")
+    args = parser.parse_args()
+
+    config = read_sink_config()
+    spool_path = args.spool or config['spool_path']
+    if args.command == 'status':
+        spool = Spool(spool_path)
+        print(f"暂存文件: {spool_path} ({spool.nbytes()} 字节)")
+        print(f"等待补写: {spool.count()} 条, 写入失败(dead): {spool.count('dead')} 条")
+        return 0
+
+    sink = ResultSink(spool_path=spool_path, batch_size=config['batch_size'], flush_interval=0.1,
+                      retry_interval=config['retry_interval'])
+    sink.close(timeout=None)
+    spool = Spool(spool_path)
+    print(f"已补写 {sink.stats['replayed']} 条，剩余 {spool.count()} 条，写入失败(dead) {spool.count('dead')} 条")
+    return 0 if spool.count() == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,362 @@
+import os
+import glob
+import threading
+from configparser import ConfigParser
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+import cv2
+import numpy as np
+
+# 获取当前文件所在目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(current_dir, "config.ini")
+
+# 二值化阈值（暗色缺陷 -> 前景255）
+THRESHOLD = 39
+
+# 候选区域筛选规则 - demo.py / startDetection 使用的参数
+DEFAULT_RULES = {
+    'max_height_div': 2,   # 高度不能超过图像高度的1/2
+    'min_area': 800,
+    'max_area': 150000,
+    'max_aspect': 3,       # 宽高比、高宽比上限
+    'min_size': 0,         # 最小边长限制（0表示不限制）
+    'max_size_div': 0,     # 最大边长不能超过图像尺寸的1/n（0表示不限制）
+}
+
+# 更严格的筛选规则 - detectDefects 使用的参数
+STRICT_RULES = {
+    'max_height_div': 3,
+    'min_area': 1000,
+    'max_area': 50000,
+    'max_aspect': 2,
+    'min_size': 30,
+    'max_size_div': 4,
+}
+
+
+# 形态学处理链（3x3矩形核）：
+#   开运算 -> 腐蚀x2 -> 膨胀x3 -> 膨胀x1 -> 腐蚀x2 -> 膨胀x1
+# 矩形核迭代n次等价于 (2n+1)x(2n+1) 矩形核运算一次，开运算拆成腐蚀+膨胀，
+# 相邻同类操作合并后只剩6次运算，结果与原处理链逐像素一致
+MORPH_STEPS = (
+    (cv2.MORPH_ERODE, 3),
+    (cv2.MORPH_DILATE, 3),
+    (cv2.MORPH_ERODE, 5),
+    (cv2.MORPH_DILATE, 9),
+    (cv2.MORPH_ERODE, 5),
+    (cv2.MORPH_DILATE, 3),
+)
+
+# 形态学处理的总影响半径（像素），分块处理时的重叠宽度不能小于该值
+MORPH_RADIUS = sum(size // 2 for op, size in MORPH_STEPS)
+
+_kernels = {size: cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+            for size in set(size for op, size in MORPH_STEPS)}
+
+
+def binarize(src, out=None, tmp=None):
+    """
+    对BGR原图进行灰度化、阈值分割和形态学处理，返回二值图
+    out/tmp: 可选的预分配缓冲区（与原图同尺寸的uint8单通道数组），重复处理同尺寸图像时可避免反复分配
+    """
+    out = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=out)
+    cv2.threshold(out, THRESHOLD, 255, cv2.THRESH_BINARY_INV, dst=out)
+    if tmp is None:
+        tmp = np.empty_like(out)
+
+    # 在两个缓冲区之间来回运算，每一步都不再分配新数组
+    a, b = out, tmp
+    for op, size in MORPH_STEPS:
+        if op == cv2.MORPH_ERODE:
+            cv2.erode(a, _kernels[size], dst=b)
+        else:
+            cv2.dilate(a, _kernels[size], dst=b)
+        a, b = b, a
+    return a
+
+
+def binarize_tiled(src, tile_size=2048, workers=None, out=None):
+    """
+    分块多线程二值化 - 适用于超宽线扫图像
+    每块向外扩展 MORPH_RADIUS 像素的重叠边单独处理（OpenCV运算会释放GIL，可多核并行），
+    只把块中心部分写回整图，结果与 binarize 逐像素一致，且不再需要整图尺寸的灰度/中间缓冲区
+    """
+    height, width = src.shape[:2]
+    if out is None:
+        out = np.empty((height, width), dtype=np.uint8)
+    halo = MORPH_RADIUS
+
+    def process(tile):
+        y0, x0 = tile
+        y1, x1 = min(y0 + tile_size, height), min(x0 + tile_size, width)
+        # 带重叠边的处理范围
+        ty0, tx0 = max(0, y0 - halo), max(0, x0 - halo)
+        ty1, tx1 = min(height, y1 + halo), min(width, x1 + halo)
+        mask = binarize(src[ty0:ty1, tx0:tx1])
+        out[y0:y1, x0:x1] = mask[y0 - ty0:y1 - ty0, x0 - tx0:x1 - tx0]
+
+    tiles = [(y0, x0) for y0 in range(0, height, tile_size) for x0 in range(0, width, tile_size)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() 用于把子线程中的异常抛回调用方
+        list(executor.map(process, tiles))
+    return out
+
+
+def prescreen_rois(src, factor=4):
+    """
+    粗筛：在按 factor 间隔抽样的小图上做阈值分割和一次膨胀，返回可能含缺陷的原图区域 [(x0, y0, x1, y1), ...]
+    原处理链中任何最终的前景像素都来自一个全部低于阈值的5x5区域（开运算后再腐蚀x2），
+    且与该区域的距离不超过7像素，因此 factor<=4 时抽样一定能命中，不会漏检
+    """
+    height, width = src.shape[:2]
+    sampled = src[::factor, ::factor]
+    rows = np.arange(0, height, factor)
+    cols = np.arange(0, width, factor)
+    # 抽样时补上最后一行/列，保证贴边的缺陷也能被命中
+    if rows[-1] != height - 1:
+        sampled = np.concatenate([sampled, src[height - 1:, ::factor]], axis=0)
+        rows = np.append(rows, height - 1)
+    if cols[-1] != width - 1:
+        sampled = np.concatenate([sampled, src[rows, width - 1:]], axis=1)
+        cols = np.append(cols, width - 1)
+    small = cv2.cvtColor(np.ascontiguousarray(sampled), cv2.COLOR_BGR2GRAY)
+    ret, small = cv2.threshold(small, THRESHOLD, 255, cv2.THRESH_BINARY_INV)
+
+    # 区域外扩：缺陷最远延伸7像素 + 形态学处理所需的 MORPH_RADIUS 上下文，取 2*MORPH_RADIUS
+    reach = -(-2 * MORPH_RADIUS // factor)
+    small = cv2.dilate(small, cv2.getStructuringElement(cv2.MORPH_RECT, (2 * reach + 1, 2 * reach + 1)))
+
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(small, connectivity=8)
+    rois = []
+    for bx, by, bw, bh, area in stats[1:]:
+        x0, y0 = cols[bx], rows[by]
+        x1, y1 = cols[bx + bw - 1] + 1, rows[by + bh - 1] + 1
+        rois.append((int(x0), int(y0), int(x1), int(y1)))
+    return rois
+
+
+def binarize_prescreen(src, factor=4, max_coverage=0.5):
+    """
+    先粗筛再精分割：只在粗筛得到的区域内运行全分辨率处理链，其余部分直接为背景
+    区域内只取距离区域边缘 MORPH_RADIUS 以上（或贴着图像边界）的部分写回，结果与 binarize 一致
+    粗筛区域（各区域的并集，区域之间可能重叠）超过整图的 max_coverage 时返回 None，由调用方改用整图处理；
+    max_coverage >= 1 时总是使用粗筛
+    """
+    height, width = src.shape[:2]
+    rois = prescreen_rois(src, factor)
+
+    halo = MORPH_RADIUS
+    out = np.zeros((height, width), dtype=np.uint8)
+    if max_coverage < 1:
+        # 在输出图上涂出区域的并集来统计覆盖面积，之后清零继续使用
+        for x0, y0, x1, y1 in rois:
+            out[y0:y1, x0:x1] = 1
+        covered = cv2.countNonZero(out)
+        if covered > max_coverage * height * width:
+            return None
+        out[:] = 0
+    for x0, y0, x1, y1 in rois:
+        mask = binarize(src[y0:y1, x0:x1])
+        # 区域边缘 halo 范围内的结果不可信（贴着图像边界的一侧除外）
+        cy0 = y0 if y0 == 0 else y0 + halo
+        cx0 = x0 if x0 == 0 else x0 + halo
+        cy1 = y1 if y1 == height else y1 - halo
+        cx1 = x1 if x1 == width else x1 - halo
+        if cy1 <= cy0 or cx1 <= cx0:
+            continue
+        out[cy0:cy1, cx0:cx1] = mask[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0]
+    return out
+
+
+def prescreen_recall(src, factor=4, rules=DEFAULT_RULES, method='contours'):
+    """粗筛召回率校验：返回 (召回率, 漏检的候选矩形列表)，以全分辨率整图处理的候选区域为基准"""
+    expected = find_candidates(binarize(src), rules, method)
+    binary = binarize_prescreen(src, factor, max_coverage=1.0)
+    if binary is None:
+        # 粗筛未启用（理论上 max_coverage=1.0 时不会发生），按整图处理，召回率为 1
+        binary = binarize(src)
+    found = set(map(tuple, find_candidates(binary, rules, method)))
+    missed = [rect for rect in expected if tuple(rect) not in found]
+    recall = 1.0 if not expected else 1 - len(missed) / len(expected)
+    return recall, missed
+
+
+def binarize_reference(src):
+    """原始的逐步形态学处理链，仅用于校验 binarize 的结果"""
+    gray = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)
+    ret, binary = cv2.threshold(gray, THRESHOLD, 255, cv2.THRESH_BINARY_INV)
+    se = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3), (-1, -1))
+    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, se)
+    binary = cv2.erode(binary, se, iterations=2)
+    binary = cv2.dilate(binary, se, iterations=3)
+    binary = cv2.dilate(binary, se, iterations=1)
+    binary = cv2.erode(binary, se, iterations=2)
+    binary = cv2.dilate(binary, se, iterations=1)
+    return binary
+
+
+def rule_mask(boxes, areas, height, width, rules):
+    """
+    向量化的筛选规则：一次性对所有候选区域判断，返回布尔掩码
+    boxes: (N, 4) 数组 [x, y, w, h]；areas: (N,) 数组
+    """
+    w = boxes[:, 2].astype(np.float64)
+    h = boxes[:, 3].astype(np.float64)
+    keep = h <= (height // rules['max_height_div'])
+    keep &= areas >= rules['min_area']
+    keep &= areas <= rules['max_area']
+    keep &= w / h <= rules['max_aspect']
+    keep &= h / w <= rules['max_aspect']
+    if rules['min_size']:
+        keep &= (w >= rules['min_size']) & (h >= rules['min_size'])
+    if rules['max_size_div']:
+        keep &= (w <= width // rules['max_size_div']) & (h <= height // rules['max_size_div'])
+    return keep
+
+
+def sort_stats(boxes, areas, nested):
+    """
+    按外接矩形左上角 (y, x) 排序（稳定排序），候选区域的顺序不随轮廓检索方式、是否去除内轮廓而改变
+    """
+    order = np.lexsort((boxes[:, 0], boxes[:, 1]))
+    return boxes[order], areas[order], nested[order]
+
+
+def contour_stats(binary):
+    """
+    轮廓路径：返回所有轮廓的外接矩形 (N, 4)、轮廓面积 (N,) 与是否为内轮廓 (N,)
+    使用两级层次结构(RETR_CCOMP)，孔洞等内轮廓与其所属缺陷的外轮廓可以区分开；
+    RETR_CCOMP 的轮廓顺序与原来的 RETR_LIST 不同，统一按 (y, x) 排序
+    """
+    contours, hierarchy = cv2.findContours(binary, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = np.array([cv2.boundingRect(c) for c in contours], dtype=np.int64).reshape(-1, 4)
+    areas = np.array([cv2.contourArea(c) for c in contours], dtype=np.float64)
+    if hierarchy is None:
+        nested = np.zeros(0, dtype=bool)
+    else:
+        # hierarchy[0][i] = [next, previous, first_child, parent]，有父轮廓的即为内轮廓
+        nested = hierarchy[0][:, 3] != -1
+    return sort_stats(boxes, areas, nested)
+
+
+def component_stats(binary):
+    """
+    连通域路径：一次原生调用得到所有连通域的外接矩形 (N, 4) 与像素面积 (N,)
+    注意：面积为像素个数（contourArea为轮廓多边形面积，数值略小），且不会产生孔洞的内轮廓
+    """
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    # 第0个连通域为背景
+    boxes = stats[1:, :4].astype(np.int64)
+    areas = stats[1:, cv2.CC_STAT_AREA].astype(np.float64)
+    return sort_stats(boxes, areas, np.zeros(len(boxes), dtype=bool))
+
+
+# 候选区域提取方式
+CANDIDATE_METHODS = {
+    'contours': contour_stats,
+    'components': component_stats,
+}
+
+
+def find_candidates(binary, rules=DEFAULT_RULES, method='contours', suppress_nested=True, stats=None):
+    """
+    在二值图上提取候选区域并按规则筛选，返回候选矩形列表 [[x, y, w, h], ...]
+    method: 'contours' 为原始的轮廓方式；'components' 为连通域统计方式，噪声多的图像上更快
+    suppress_nested: 去掉孔洞等内轮廓，同一个缺陷只保留一个候选区域（只分类、计数一次）
+    stats: 可选的字典，写入 candidates(候选数) 与 duplicates(满足筛选规则的内轮廓重复数)
+    """
+    height, width = binary.shape[:2]
+    boxes, areas, nested = CANDIDATE_METHODS[method](binary)
+    return filter_candidates(boxes, areas, nested, height, width, rules, suppress_nested, stats)
+
+
+def filter_candidates(boxes, areas, nested, height, width, rules=DEFAULT_RULES, suppress_nested=True, stats=None):
+    """
+    对已提取的候选区域统计 (boxes, areas, nested) 按规则筛选，参数含义同 find_candidates
+    只修改筛选规则时可复用已有的轮廓统计，无需重新提取轮廓
+    """
+    keep = rule_mask(boxes, areas, height, width, rules)
+    duplicates = int((keep & nested).sum())
+    if suppress_nested:
+        keep &= ~nested
+    if stats is not None:
+        stats['candidates'] = int(keep.sum())
+        stats['duplicates'] = duplicates
+    return boxes[keep].tolist()
+
+
+def read_segment_config(filename=CONFIG_PATH, section='segmentation'):
+    """读取config.ini中的分割配置，缺失时使用默认值"""
+    parser = ConfigParser()
+    parser.read(filename, encoding='utf-8')
+    config = {'method': 'contours', 'suppress_nested': True, 'tile_size': 0, 'tile_workers': 0, 'prescreen': 0}
+    if parser.has_section(section):
+        config['method'] = parser.get(section, 'method', fallback='contours')
+        config['suppress_nested'] = parser.getboolean(section, 'suppress_nested', fallback=True)
+        config['tile_size'] = parser.getint(section, 'tile_size', fallback=0)
+        config['tile_workers'] = parser.getint(section, 'tile_workers', fallback=0)
+        config['prescreen'] = parser.getint(section, 'prescreen', fallback=0)
+    return config
+
+
+def segment_binary(src, config):
+    """按配置选择粗筛、整图或分块方式得到二值图"""
+    if config['prescreen'] > 0:
+        binary = binarize_prescreen(src, config['prescreen'])
+        if binary is not None:
+            return binary
+    if config['tile_size'] > 0:
+        return binarize_tiled(src, config['tile_size'], config['tile_workers'] or None)
+    return binarize(src)
+
+
+def crop_regions(src, rects):
+    """按候选矩形从原图上取出区域（NumPy视图，不复制、不落盘），顺序与rects一致"""
+    return [src[y:y + h, x:x + w] for x, y, w, h in rects]
+
+
+class CropWriter:
+    """候选区域异步落盘 - 可选的旁路输出，不阻塞检测主流程"""
+
+    def __init__(self, output_dir, max_workers=1):
+        self.output_dir = output_dir
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # 只保存尚未完成的任务：完成后由回调移除并打印异常，长时间运行时不会越积越多
+        self.futures = set()
+        self.lock = threading.Lock()
+
+    def save(self, crops, prefix="region"):
+        """提交一组区域图像，在后台清理旧文件后写为 {prefix}_{index}.png"""
+        # 复制一份，避免调用方随后在原图上绘制标注时影响落盘内容
+        crops = [crop.copy() for crop in crops]
+        future = self.executor.submit(self._write, crops, prefix)
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.futures.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            print(f"候选区域落盘失败 ({self.output_dir}): {future.exception()}")
+
+    def _write(self, crops, prefix):
+        os.makedirs(self.output_dir, exist_ok=True)
+        # 清理上一张图像遗留的区域文件
+        for old_file in glob.glob(os.path.join(self.output_dir, f"{prefix}_*.png")):
+            os.remove(old_file)
+        for index, crop in enumerate(crops, start=1):
+            cv2.imwrite(os.path.join(self.output_dir, f"{prefix}_{index}.png"), crop)
+        return len(crops)
+
+    def wait(self):
+        """等待所有已提交的落盘任务完成（失败的任务已在完成时打印）"""
+        with self.lock:
+            futures = list(self.futures)
+        wait_futures(futures)
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
@@ -0,0 +1,180 @@
+"""
+检测流程中间结果缓存
+
+按图像文件缓存各阶段的中间结果：解码后的原图、二值图、轮廓统计、分类后的检测结果。
+缓存键为 文件标识(路径 + 修改时间 + 文件大小) + 阶段名 + 该阶段依赖的处理参数，文件被修改后旧结果自动失效；
+总占用超过字节预算时按最近最少使用(LRU)淘汰。
+
+缓存返回的数组与缓存共享内存，调用方不能原地修改（需要标注时先 copy）。
+"""
+import os
+import threading
+from collections import OrderedDict
+from configparser import ConfigParser
+
+import cv2
+import numpy as np
+
+import segment
+
+# 获取当前文件所在目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(current_dir, "config.ini")
+
+# 默认缓存预算（MB）
+MAX_MB = 512
+
+
+def read_cache_config(filename=CONFIG_PATH, section='cache'):
+    """读取config.ini中的缓存配置，缺失时使用默认值"""
+    parser = ConfigParser()
+    parser.read(filename, encoding='utf-8')
+    config = {'max_mb': MAX_MB}
+    if parser.has_section(section):
+        config['max_mb'] = parser.getint(section, 'max_mb', fallback=MAX_MB)
+    return config
+
+
+def binary_params(config):
+    """
+    二值图依赖的处理参数
+    分块处理与整图处理结果逐像素一致，因此分块参数不参与缓存键；粗筛间隔大于4时可能漏检，需要参与
+    """
+    return (segment.THRESHOLD, segment.MORPH_STEPS, config['prescreen'])
+
+
+def contour_params(config):
+    """轮廓统计依赖的处理参数（不含筛选规则，修改规则时复用同一份轮廓）"""
+    return binary_params(config) + (config['method'],)
+
+
+def _nbytes(value):
+    """估算缓存项占用的字节数"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value) + 64
+    return 64
+
+
+class StageCache:
+    """按文件与处理参数缓存中间结果的LRU缓存"""
+
+    def __init__(self, max_bytes=MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()   # (路径, 阶段, 参数) -> (文件标识, 值, 字节数)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def file_id(path):
+        """文件标识：修改时间与文件大小，文件不存在时返回 None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, path, stage, params=()):
+        """查询缓存，未命中或文件已变化时返回 None"""
+        key = (os.path.abspath(path), stage, params)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == self.file_id(path):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                # 文件已被修改，丢弃旧结果
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, path, stage, value, params=()):
+        """写入缓存并按字节预算淘汰最久未使用的项"""
+        key = (os.path.abspath(path), stage, params)
+        nbytes = _nbytes(value)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if nbytes > self.max_bytes:
+                return value
+            self.entries[key] = (self.file_id(path), value, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+        return value
+
+    def _remove(self, key):
+        self.total_bytes -= self.entries.pop(key)[2]
+
+    def invalidate(self, path=None):
+        """清除某个文件（默认全部）的缓存"""
+        with self.lock:
+            if path is None:
+                self.entries.clear()
+                self.total_bytes = 0
+                return
+            path = os.path.abspath(path)
+            for key in [key for key in self.entries if key[0] == path]:
+                self._remove(key)
+
+    # ---- 各阶段：命中时直接返回，未命中时从上一阶段计算并写入缓存 ----
+
+    def image(self, path):
+        """解码后的BGR原图，读取失败返回 None"""
+        image = self.get(path, 'image')
+        if image is None:
+            image = cv2.imread(path)
+            if image is None:
+                return None
+            self.put(path, 'image', image)
+        return image
+
+    def binary(self, path, config):
+        """二值图（阈值分割 + 形态学处理），config 为 segment.read_segment_config() 的结果"""
+        params = binary_params(config)
+        binary = self.get(path, 'binary', params)
+        if binary is None:
+            image = self.image(path)
+            if image is None:
+                return None
+            binary = self.put(path, 'binary', segment.segment_binary(image, config), params)
+        return binary
+
+    def contours(self, path, config):
+        """轮廓统计 (boxes, areas, nested, (height, width))，附带图像尺寸供筛选规则使用"""
+        params = contour_params(config)
+        contours = self.get(path, 'contours', params)
+        if contours is None:
+            binary = self.binary(path, config)
+            if binary is None:
+                return None
+            boxes, areas, nested = segment.CANDIDATE_METHODS[config['method']](binary)
+            contours = self.put(path, 'contours', (boxes, areas, nested, binary.shape[:2]), params)
+        return contours
+
+    def candidates(self, path, config, rules=segment.DEFAULT_RULES, stats=None):
+        """按规则筛选后的候选矩形，只修改规则时复用缓存的轮廓统计"""
+        contours = self.contours(path, config)
+        if contours is None:
+            return None
+        boxes, areas, nested, (height, width) = contours
+        return segment.filter_candidates(boxes, areas, nested, height, width, rules,
+                                         config['suppress_nested'], stats)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """获取进程内共享的中间结果缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = read_cache_config()
+            _cache = StageCache(config['max_mb'] * 1024 * 1024)
+    return _cache
@@ -0,0 +1,236 @@
+"""
+线扫相机流式检测
+
+隔膜是连续卷材，线扫相机按固定高度的条带(strip)输出图像。本模块把条带依次放入滚动缓冲区，
+每到一个条带就完成分割与分类，跨条带的缺陷等其完整后再输出，坐标为整卷上的绝对坐标。
+
+用法:
+    python stream.py --files data/strips/*.bmp
+    python stream.py --raw data/web.raw --width 16384 --strip-height 512
+"""
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+import segment
+
+
+class StripSegmenter:
+    """
+    条带分割器 - 维护滚动缓冲区，输出已完整的候选区域
+    ref_height: 筛选规则中"高度不能超过图像高度的1/n"所参照的高度，默认取条带高度
+    max_buffer_rows: 缓冲区行数上限，超过时强制输出；默认 ref_height + 2 * 条带高度 + 4 * halo
+    """
+
+    def __init__(self, rules=segment.DEFAULT_RULES, method='contours', ref_height=None, max_buffer_rows=None,
+                 suppress_nested=True):
+        self.rules = rules
+        self.method = method
+        self.suppress_nested = suppress_nested
+        self.ref_height = ref_height
+        self.max_buffer_rows = max_buffer_rows
+        self.halo = segment.MORPH_RADIUS
+
+        self.buffer = None       # 保留的图像行（BGR）
+        self.buffer_top = 0      # buffer第0行在整卷上的绝对行号
+        self.emitted_limit = 0   # 底边(y+h)不超过该值的区域都已输出过
+        self.carry = None        # 已丢弃的超高区域在缓冲区可信首行之上一行的像素（0/255 单行）
+
+    def push(self, strip):
+        """
+        放入一个条带，返回 (rects, crops)：本次新完成的候选区域（绝对坐标）及其图像
+        """
+        if self.buffer is None:
+            self.buffer = strip
+        else:
+            self.buffer = np.concatenate([self.buffer, strip], axis=0)
+        if self.ref_height is None:
+            self.ref_height = strip.shape[0]
+        if self.max_buffer_rows is None:
+            self.max_buffer_rows = self.ref_height + 2 * strip.shape[0] + 4 * self.halo
+        return self._process(final=False)
+
+    def flush(self):
+        """流结束时调用，输出缓冲区中剩余的全部区域"""
+        if self.buffer is None:
+            return [], []
+        return self._process(final=True)
+
+    def _process(self, final):
+        height, width = self.buffer.shape[:2]
+        binary = segment.binarize(self.buffer)
+        max_h = self.ref_height // self.rules['max_height_div']
+
+        # 缓冲区上下边缘 halo 行内的形态学结果受截断影响，不可信
+        # （流开始处与结束处的边缘与整图处理时的图像边界一致，可信）
+        valid_top = 0 if self.buffer_top == 0 else self.halo
+        valid_bottom = height if final else height - self.halo
+        binary[:valid_top] = 0
+
+        # 已丢弃的超高区域：在可信首行之上接一段 max_h + 1 行的延伸，
+        # 与其相连的后续部分高度必然超限，和整图处理一样被筛掉，也不会再撑大缓冲区
+        offset = 0
+        if self.carry is not None:
+            stub = np.repeat(self.carry[None], max_h + 1, axis=0)
+            binary = np.concatenate([stub, binary[valid_top:]], axis=0)
+            offset = valid_top - (max_h + 1)
+
+        boxes, areas, nested = segment.CANDIDATE_METHODS[self.method](binary)
+        boxes[:, 1] += offset
+        bottoms = boxes[:, 1] + boxes[:, 3]
+
+        # 完整区域：最下一行距可信区域底部至少一行（该行不含本区域像素，区域不会再向下延伸）
+        limit = valid_bottom if final else valid_bottom - 1
+        complete = bottoms <= limit
+        force = False
+        if not final and self.max_buffer_rows and height > self.max_buffer_rows:
+            # 兜底：缓冲区仍超过上限时，强制按当前范围输出
+            complete[:] = True
+            limit = valid_bottom
+            force = True
+
+        # 只输出此前尚未输出过的区域
+        new = complete & (bottoms + self.buffer_top > self.emitted_limit)
+        keep = new & segment.rule_mask(boxes, areas, self.ref_height, width, self.rules)
+        if self.suppress_nested:
+            keep &= ~nested
+        rects = boxes[keep]
+        crops = segment.crop_regions(self.buffer, rects.tolist())
+        # 裁剪区域在缓冲区被截断后仍需有效，复制一份
+        crops = [crop.copy() for crop in crops]
+        rects[:, 1] += self.buffer_top
+
+        # 计算下一次需要保留的起始行：未完成区域的最高行，且保留 halo 行作为形态学上下文；
+        # 高度已超过 max_h 的未完成区域无论如何都会被筛掉，不为它保留缓冲区
+        pending = ~complete
+        oversized = pending & (boxes[:, 3] > max_h)
+        pending &= ~oversized
+        retain_from = limit
+        if pending.any():
+            retain_from = min(retain_from, int(boxes[pending, 1].min()))
+        retain_from = max(0, retain_from - self.halo)
+        if force or final:
+            retain_from = max(retain_from, height - self.halo)
+
+        # 记录被截断的超高区域在新缓冲区可信首行之上一行的像素，供下一次接续
+        self.carry = None
+        if oversized.any() and not force and not final and retain_from > 0:
+            row = retain_from + self.halo - 1 - offset
+            count, labels, stats = cv2.connectedComponentsWithStats(binary, connectivity=8)[:3]
+            tall = stats[:, cv2.CC_STAT_HEIGHT] > max_h
+            tall[0] = False
+            carry = np.where(tall[labels[row]], 255, 0).astype(np.uint8)
+            if carry.any():
+                self.carry = carry
+
+        self.emitted_limit = max(self.emitted_limit, self.buffer_top + limit)
+        self.buffer = self.buffer[retain_from:].copy()
+        self.buffer_top += retain_from
+        return rects.tolist(), crops
+
+
+class LineScanInspector:
+    """流式检测：条带分割 + 批量分类，输出带绝对坐标的缺陷记录"""
+
+    def __init__(self, engine, rules=segment.DEFAULT_RULES, method='contours', ref_height=None,
+                 max_buffer_rows=None, suppress_nested=True):
+        self.engine = engine
+        self.segmenter = StripSegmenter(rules, method, ref_height, max_buffer_rows, suppress_nested)
+
+    def _classify(self, rects, crops):
+        defects = []
+        if not rects:
+            return defects
+        classes, probs = self.engine.classify(crops)
+        for (x, y, w, h), cla, prob in zip(rects, classes, probs):
+            defects.append({
+                'x': x, 'y': y, 'w': w, 'h': h,
+                'cla': int(cla),
+                'class_name': self.engine.class_name(int(cla)),
+                'prob': float(prob),
+            })
+        return defects
+
+    def push(self, strip):
+        """处理一个条带，返回本次新完成的检测结果"""
+        return self._classify(*self.segmenter.push(strip))
+
+    def flush(self):
+        return self._classify(*self.segmenter.flush())
+
+    def run(self, strips):
+        """依次处理条带序列，逐条带产出 (条带序号, 检测结果, 处理耗时)"""
+        index = 0
+        for index, strip in enumerate(strips):
+            start = time.perf_counter()
+            defects = self.push(strip)
+            yield index, defects, time.perf_counter() - start
+        start = time.perf_counter()
+        yield index + 1, self.flush(), time.perf_counter() - start
+
+
+def iter_file_strips(paths):
+    """从图像文件序列读取条带（每个文件一个条带，按文件顺序拼接）"""
+    for path in paths:
+        strip = cv2.imread(path)
+        if strip is None:
+            raise FileNotFoundError(f"无法读取条带图像: {path}")
+        yield strip
+
+
+def iter_raw_strips(stream, width, strip_height, channels=1):
+    """从原始8位数据流读取条带（线扫相机输出的逐行数据）"""
+    strip_bytes = width * strip_height * channels
+    while True:
+        data = stream.read(strip_bytes)
+        if not data:
+            break
+        rows = len(data) // (width * channels)
+        strip = np.frombuffer(data[:rows * width * channels], dtype=np.uint8)
+        strip = strip.reshape(rows, width, channels)
+        if channels == 1:
+            strip = cv2.cvtColor(strip, cv2.COLOR_GRAY2BGR)
+        yield strip
+
+
+def main():
+    parser = argparse.ArgumentParser(description="线扫相机流式检测")
+    parser.add_argument('--files', nargs='+', help="按顺序排列的条带图像文件")
+    parser.add_argument('--raw', help="原始8位数据流文件，'-'表示标准输入")
+    parser.add_argument('--width', type=int, help="原始数据流的行宽（像素）")
+    parser.add_argument('--strip-height', type=int, default=512, help="原始数据流的条带高度（行）")
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--ref-height', type=int, default=None, help="筛选规则参照的图像高度，默认取条带高度")
+    parser.add_argument('--max-buffer-rows', type=int, default=None,
+                        help="缓冲区行数上限，默认 参照高度 + 2 * 条带高度 + 4 * 形态学半径")
+    args = parser.parse_args()
+
+    if args.files:
+        strips = iter_file_strips(args.files)
+    elif args.raw and args.width:
+        stream = sys.stdin.buffer if args.raw == '-' else open(args.raw, 'rb')
+        strips = iter_raw_strips(stream, args.width, args.strip_height, args.channels)
+    else:
+        parser.error("请指定 --files 或 --raw 与 --width")
+
+    from engine import get_engine
+    config = segment.read_segment_config()
+    inspector = LineScanInspector(get_engine(), method=config['method'], ref_height=args.ref_height,
+                                  max_buffer_rows=args.max_buffer_rows, suppress_nested=config['suppress_nested'])
+
+    total = 0
+    for index, defects, elapsed in inspector.run(strips):
+        for defect in defects:
+            if "NG" in defect['class_name']:
+                total += 1
+                print(f"[条带 {index}] 缺陷 {defect['class_name']} 置信度 {defect['prob']:.4f} "
+                      f"位置({defect['x']},{defect['y']},{defect['w']},{defect['h']})")
+        print(f"条带 {index} 处理耗时: {elapsed * 1000:.1f} ms")
+    print(f"检测到 {total} 个缺陷")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,25 @@
 import torch
-import torch.nn as nn
 from torchvision import transforms, datasets
 # import matplotlib.pyplot as plt
-# import numpy as np
+import numpy as np
 # import torch.optim as optim
 from draw_matrix import plot_confusion_matrix
 
 import os
-from model import model
-
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+import sys
+import json
+import time
+import argparse
+from engine import InferenceEngine, read_inference_config
+import dataset_cache
+from metrics import MetricsAccumulator
 
 # 使用绝对路径确保能找到数据目录
 current_dir = os.path.dirname(os.path.abspath(__file__))
 image_path = os.path.join(current_dir, "data")
+model_weight_path = os.path.join(current_dir, "EfficientNet_self1.pth")  # 使用绝对路径
+# 评估结果（JSON），写在权重文件旁边，与被评估的模型对应（不随运行时的当前目录变化）
+report_path = os.path.splitext(model_weight_path)[0] + "_test_report.json"
 
 data_transform = transforms.Compose(
     [
@@ -22,56 +28,158 @@ data_transform = transforms.Compose(
         transforms.Normalize((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))  # ImageNet标准化
     ])
 
-test_dataset = datasets.ImageFolder(root=os.path.join(image_path, "tes"),
-                                    transform=data_transform)
-
-test_num = len(test_dataset)
-print(test_num)
-test_loader = torch.utils.data.DataLoader(test_dataset,  # 导入的训练集
-                                          batch_size=1,  # 每批训练的样本数
-                                          shuffle=True,  # 是否打乱训练集
-                                          num_workers=0)  # 使用线程数，在windows下设置为0
-
-# 获取模型
-model_instance = model()
-
-model_weight_path = os.path.join(current_dir, "EfficientNet_self1.pth")  # 使用绝对路径
-# 加载模型文件
-model_instance.load_state_dict(torch.load(model_weight_path, map_location='cpu'))
-
-model_instance.eval()
-acc = 0.0
-predict_list = []
-conf_matrix = torch.zeros(8, 8)  # 修改为8x8的混淆矩阵
-# 更新混淆矩阵
-def confusion_matrix(preds, labels, conf_matrix):
-    conf_matrix[labels, preds] += 1
-    return conf_matrix
-
-
-with torch.no_grad():
-    for test_data in test_loader:
-        test_images, test_labels = test_data
-
-        # 扩大维度
-
-        output = torch.squeeze(model_instance(test_images))  # 将输出压缩，即压缩掉 batch 这个维度
-        predict = torch.softmax(output, dim=0)
-        predict_cla = torch.argmax(predict).numpy()
-        print(str(predict_cla), (test_labels).item())
-        #         if predict_cla==int((test_labels).item()):
-        #             acc += 1
-        conf_matrix = confusion_matrix(predict_cla, labels=test_labels, conf_matrix=conf_matrix)
-        if predict_cla == int((test_labels).item()):
-            acc += 1
-
-test_accurate = acc / test_num
-
-print(test_accurate)
-print(conf_matrix)
-
 attack_types = ['class1OK', 'class2OK', 'class3OK', 'class4OK', 'class5NG', 'class6OK', 'class7NG', 'class8OK']  # 更新类别标签
-plot_confusion_matrix(conf_matrix.numpy(), classes=attack_types, normalize=True,
-                                title='Normalized confusion matrix')
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="在测试集上评估模型")
+    parser.add_argument('--batch-size', type=int, default=64, help="评估的批大小")
+    parser.add_argument('--latency-batch-sizes', type=int, nargs='*', default=[1, 8, 32],
+                        help="另外统计推理耗时分位数的批大小（评估的批大小总会统计）")
+    parser.add_argument('--latency-batches', type=int, default=20, help="每个批大小最多计时的批数")
+    parser.add_argument('--data-cache', action='store_true', help="使用预解码的数据集缓存（data/cache，自动增量构建）")
+    parser.add_argument('--workers', type=int, default=2, help="使用数据集缓存时 DataLoader 的工作进程数")
+    parser.add_argument('--report', default=report_path, help="评估结果JSON文件")
+    return parser.parse_args()
+
+
+def make_loader(args, batch_size):
+    """按批读取测试集（不打乱）"""
+    if args.data_cache:
+        # 预解码缓存：图像只解码、缩放一次，多进程读取
+        return dataset_cache.make_loader("tes", batch_size=batch_size, num_workers=args.workers,
+                                         cache_dir=os.path.join(image_path, "cache"))
+    test_dataset = datasets.ImageFolder(root=os.path.join(image_path, "tes"), transform=data_transform)
+    test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size, shuffle=False, num_workers=0)
+    return test_dataset, test_loader
+
+
+def evaluate(inference, test_loader, num_classes=8):
+    """
+    整批推理，每批用一次 bincount 更新混淆矩阵
+    返回 (MetricsAccumulator, 每批推理耗时列表（秒）, 总耗时（秒，含数据读取））
+    """
+    metrics = MetricsAccumulator(num_classes)
+    latencies = []
+    start = time.perf_counter()
+    with torch.no_grad():
+        for test_images, test_labels in test_loader:
+            batch_start = time.perf_counter()
+            outputs = inference.logits(test_images)
+            latencies.append(time.perf_counter() - batch_start)
+            metrics.update(outputs, test_labels)
+    return metrics, latencies, time.perf_counter() - start
+
+
+def measure_latency(inference, test_loader, max_batches):
+    """
+    在测试集的前 max_batches 批上计时，返回每批推理耗时列表（秒）
+    预热是第一批额外多推理一次（不计时），测试集只有一批时也有计时结果
+    """
+    latencies = []
+    with torch.no_grad():
+        for index, (test_images, test_labels) in enumerate(test_loader):
+            if index >= max_batches:
+                break
+            if index == 0:
+                inference.logits(test_images)
+            start = time.perf_counter()
+            inference.logits(test_images)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def latency_summary(latencies, batch_size):
+    """每批耗时的分位数（毫秒）与吞吐量；没有计时结果时各项为 None（JSON 中为 null）"""
+    if not latencies:
+        return {'batches': 0, 'mean_ms': None, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None,
+                'images_per_sec': None}
+    ms = np.array(latencies) * 1000
+    return {
+        'batches': len(ms),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'images_per_sec': float(batch_size * len(ms) / ms.sum() * 1000),
+    }
+
+
+def main():
+    args = parse_args()
+    if args.data_cache:
+        dataset_cache.build_cache(os.path.join(image_path, "tes"), os.path.join(image_path, "cache"), "tes")
+
+    # 获取模型（推理后端由config.ini中[inference]的backend决定：eager / onnxruntime / int8 / torchscript）
+    inference_config = read_inference_config()
+    inference = InferenceEngine(model_weight_path, batch_size=args.batch_size, warmup=False,
+                                backend=inference_config['backend'],
+                                onnx_path=inference_config['onnx_path'],
+                                quantized_path=inference_config['quantized_path'],
+                                torchscript_optimize=inference_config['torchscript_optimize'])
+    print(f"推理后端: {inference.backend}")
+
+    test_dataset, test_loader = make_loader(args, args.batch_size)
+    test_num = len(test_dataset)
+    print(test_num)
+
+    # 预热：第一批的耗时不计入分位数
+    with torch.no_grad():
+        inference.logits(next(iter(test_loader))[0])
+    metrics, latencies, total_time = evaluate(inference, test_loader, len(attack_types))
+    conf_matrix = metrics.confusion
+    test_accurate = metrics.accuracy
+    print(test_accurate)
+    print(conf_matrix)
+    print(f"评估 {test_num} 张: {total_time:.2f} s ({test_num / total_time:.1f} 张/秒)")
+
+    latency = {args.batch_size: latency_summary(latencies, args.batch_size)}
+    for batch_size in args.latency_batch_sizes:
+        if batch_size not in latency:
+            latency[batch_size] = latency_summary(
+                measure_latency(inference, make_loader(args, batch_size)[1], args.latency_batches), batch_size)
+
+    # 类别名取自检查点的类别映射
+    names = [inference.class_indices.get(str(index), str(index)) for index in range(metrics.num_classes)]
+    precision = metrics.per_class_precision()
+    recall = metrics.per_class_accuracy()
+    support = conf_matrix.sum(axis=1)
+    print(f"{'类别':<10} {'精确率':>8} {'召回率':>8} {'样本数':>6}")
+    for index, name in enumerate(names):
+        print(f"{name:<10} {precision[index]:>8.4f} {recall[index]:>8.4f} {support[index]:>6d}")
+    print(f"{'批大小':>6} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'张/秒':>8}")
+    for batch_size, summary in sorted(latency.items()):
+        if not summary['batches']:
+            print(f"{batch_size:>6} {'样本不足':>9}")
+            continue
+        print(f"{batch_size:>6} {summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f} "
+              f"{summary['images_per_sec']:>8.1f}")
+
+    # nan（没有样本/没有预测为该类）在JSON中写为 null
+    report = {
+        'weights': model_weight_path,
+        'backend': inference.backend,
+        'images': test_num,
+        'batch_size': args.batch_size,
+        'eval_seconds': total_time,
+        'accuracy': test_accurate,
+        'classes': names,
+        'confusion_matrix': conf_matrix.tolist(),
+        'per_class': [{'class': name,
+                       'precision': None if np.isnan(precision[index]) else float(precision[index]),
+                       'recall': None if np.isnan(recall[index]) else float(recall[index]),
+                       'support': int(support[index])}
+                      for index, name in enumerate(names)],
+        'latency': {str(batch_size): summary for batch_size, summary in sorted(latency.items())},
+    }
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"评估结果已保存到: {args.report}")
+
+    plot_confusion_matrix(conf_matrix.astype(np.float32), classes=attack_types, normalize=True,
+                          title='Normalized confusion matrix')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 被测模块都在上一级目录（new/）下，直接按模块名导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
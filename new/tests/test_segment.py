@@ -0,0 +1,60 @@
+"""
+分割处理链的一致性校验：优化后的实现（合并的形态学运算、分块多线程、粗筛）与原始逐步处理链结果必须逐像素相同
+"""
+import cv2
+import numpy as np
+import pytest
+
+import segment
+
+
+def random_image(height, width, seed):
+    """随机灰度噪声 + 大小、深浅不一的暗斑（部分贴着图像边界），BGR"""
+    rng = np.random.default_rng(seed)
+    gray = rng.integers(30, 110, (height, width), dtype=np.uint8)
+    for _ in range(int(rng.integers(3, 12))):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        cv2.circle(gray, (x, y), int(rng.integers(2, 40)), int(rng.integers(0, 40)), -1)
+    # 细长的划痕
+    x0, y0 = int(rng.integers(0, width)), int(rng.integers(0, height))
+    cv2.line(gray, (x0, y0), (int(rng.integers(0, width)), int(rng.integers(0, height))), 5, 3)
+    gray = cv2.GaussianBlur(gray, (3, 3), 0)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+SHAPES = [(240, 320), (301, 517), (97, 640)]
+SEEDS = [0, 1, 2]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("shape", SHAPES)
+def test_binarize_matches_reference(shape, seed):
+    src = random_image(*shape, seed)
+    assert np.array_equal(segment.binarize(src), segment.binarize_reference(src))
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("tile_size", [64, 100])
+def test_binarize_tiled_matches_binarize(tile_size, seed):
+    src = random_image(301, 517, seed)
+    expected = segment.binarize(src)
+    assert np.array_equal(segment.binarize_tiled(src, tile_size=tile_size, workers=2), expected)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("shape", SHAPES)
+def test_binarize_prescreen_factor4_matches_binarize(shape, seed):
+    src = random_image(*shape, seed)
+    binary = segment.binarize_prescreen(src, factor=4, max_coverage=1.0)
+    assert binary is not None
+    assert np.array_equal(binary, segment.binarize(src))
+    recall, missed = segment.prescreen_recall(src, factor=4)
+    assert recall == 1.0 and not missed
+
+
+@pytest.mark.parametrize('method', sorted(segment.CANDIDATE_METHODS))
+@pytest.mark.parametrize('suppress_nested', [True, False])
+def test_candidate_order(method, suppress_nested):
+    binary = segment.binarize(random_image(301, 517, 0))
+    rects = segment.find_candidates(binary, method=method, suppress_nested=suppress_nested)
+    assert rects == sorted(rects, key=lambda rect: (rect[1], rect[0]))
@@ -4,17 +4,28 @@ from torchvision import transforms, datasets, utils
 import matplotlib.pyplot as plt
 import numpy as np
 import torch.optim as optim
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
 
 import os
 import json
 import time
+import random
+import argparse
 
 from model import model, get_model_summary
+from checkpoint import save_checkpoint, save_training_state, load_training_state
+import features
+import dataset_cache
+from metrics import MetricsAccumulator
 
 # 使用GPU训练
 device = torch.device("cpu")  # 改为使用CPU
-with open(os.path.join("train.log"), "a") as log:
-    log.write(str(device) + "\n")
+
+# 多进程数据并行训练（gloo 后端）：由 launch.py 或 torchrun 通过环境变量启动，单进程时为 0/0/1
+rank = 0
+local_rank = 0
+world_size = 1
 
 # 数据预处理 - 调整为EfficientNet的标准预处理
 data_transform = {
@@ -34,155 +45,454 @@ data_transform = {
 }
 
 image_path = os.path.join(os.path.dirname(__file__), "data")
-# 导入训练集并进行预处理
-train_dataset = datasets.ImageFolder(root=image_path + "/train",
-                                     transform=data_transform["train"])
-train_num = len(train_dataset)
-print(train_num)
-# 按batch_size分批次加载训练集
-train_loader = torch.utils.data.DataLoader(train_dataset,  # 导入的训练集
-                                           batch_size=16,  # 每批训练的样本数
-                                           shuffle=True,  # 是否打乱训练集
-                                           num_workers=0)  # 使用线程数，在windows下设置为0
-
-# 导入、加载 验证集
-# 导入验证集并进行预处理
-validate_dataset = datasets.ImageFolder(root=image_path + "/val",
-                                        transform=data_transform["val"])
-val_num = len(validate_dataset)
-print(val_num)
-# 加载验证集
-validate_loader = torch.utils.data.DataLoader(validate_dataset,  # 导入的验证集
-                                              batch_size=16,
-                                              shuffle=True,
-                                              num_workers=0)
-
-lm_list = train_dataset.class_to_idx
-
-cla_dict = dict((val, key) for key, val in lm_list.items())
-
-json_str = json.dumps(cla_dict, indent=4)
-with open('class_indices.json', 'w') as json_file:
-    json_file.write(json_str)
-
-# 获取模型
-net = model()
-
-# 打印模型信息
-model_info = get_model_summary()
-print(f"模型: {model_info['model_name']}")
-print(f"总参数: {model_info['total_parameters']:,}")
-print(f"可训练参数: {model_info['trainable_parameters']:,}")
-
-net.to(device)  # 分配网络到指定的设备（GPU/CPU）训练
-
-loss_function = nn.CrossEntropyLoss()  # 交叉熵损失
-optimizer = optim.Adam(net.parameters(), lr=0.0001)  # 优化器（训练参数，学习率）
-
 save_path = './EfficientNet_self1.pth'
-best_acc = 0.0
-acc_tra = []
-acc_val = []
-loss_tra = []
-loss_val = []
-
-epoch_num = 20
-
-for epoch in range(epoch_num):
-    net.train()  # 训练过程中开启 Dropout
-    train_loss = 0.0  # 每个 epoch 都会对 running_loss  清零
-    time_start = time.perf_counter()  # 对训练一个 epoch 计时
-
-    acc_train = 0.0
-
-    for step, data in enumerate(train_loader, start=0):  # 遍历训练集，step从0开始计算
-        images, labels = data  # 获取训练集的图像和标签
-        optimizer.zero_grad()  # 清除历史梯度
-
-        outputs = net(images.to(device))  # 正向传播
-        loss = loss_function(outputs, labels.to(device))  # 计算损失
-        loss.backward()  # 反向传播
-        optimizer.step()  # 优化器更新参数
-        train_loss += loss.item()
-
-        # 打印训练进度（使训练过程可视化）
-        rate = (step + 1) / len(train_loader)  # 当前进度 = 当前step / 训练一轮epoch所需总step
-        a = "*" * int(rate * 50)
-        b = "." * int((1 - rate) * 50)
-        #         with open(os.path.join("train.log"), "a") as log:     #写入日志
-        #               log.write(str("\rtrain loss: {:^3.0f}%[{}->{}]{:.3f}".format(int(rate * 100), a, b, loss))+"\n")
-        print("\rtrain loss: {:^3.0f}%[{}->{}]{:.3f}".format(int(rate * 100), a, b, loss), end="")
-    print()
-    with open(os.path.join("train.log"), "a") as log:
-        log.write(str('%f s' % (time.perf_counter() - time_start)) + "\n")
-    print('%f s' % (time.perf_counter() - time_start))
-
-    val_loss = 0.0
-    for step1, val_data in enumerate(validate_loader, start=0):
-        val_images, val_labels = val_data
-        outputs = net(val_images.to(device))
-        loss1 = loss_function(outputs, val_labels.to(device))  # 计算损失
-        val_loss += loss1.item()
-
-    net.eval()  # 验证过程中关闭 Dropout
-    acc = 0.0
-    acc1 = 0.0
-
+feature_cache_dir = os.path.join(image_path, "features")
+# 每个 epoch 的指标记录（JSON Lines，每行一个 epoch）
+history_path = 'train_history.jsonl'
+# 训练曲线图
+plot_path = 'train_history.png'
+# 可恢复的训练状态（模型、优化器、学习率调度、随机数状态、指标记录）
+train_state_path = './train_state.pth'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="训练缺陷分类模型")
+    parser.add_argument('--mode', choices=['full', 'features'], default='full',
+                        help="full: 每个epoch完整前向整个网络; features: 主干特征只提取一次并缓存，只训练分类头")
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=16, help="每个进程的批大小（多进程时总批大小为 进程数 x 批大小）")
+    parser.add_argument('--lr', type=float, default=0.0001)
+    parser.add_argument('--data-cache', action='store_true',
+                        help="使用预解码的数据集缓存（data/cache，自动增量构建），多进程读取")
+    parser.add_argument('--workers', type=int, default=2, help="使用数据集缓存时 DataLoader 的工作进程数")
+    parser.add_argument('--seed', type=int, default=0, help="随机数种子")
+    parser.add_argument('--checkpoint', default=train_state_path, help="训练状态文件")
+    parser.add_argument('--checkpoint-every', type=int, default=1, help="每隔几个epoch写出一次训练状态")
+    parser.add_argument('--resume', nargs='?', const=train_state_path, default=None,
+                        help="从训练状态文件恢复训练（默认 %s）" % train_state_path)
+    parser.add_argument('--patience', type=int, default=5,
+                        help="验证损失连续几个epoch不下降时提前停止，0 表示不提前停止")
+    parser.add_argument('--lr-patience', type=int, default=2, help="验证损失连续几个epoch不下降时降低学习率")
+    parser.add_argument('--lr-factor', type=float, default=0.5, help="降低学习率的倍数")
+    return parser.parse_args()
+
+
+def init_distributed():
+    """
+    按环境变量 WORLD_SIZE/RANK/LOCAL_RANK/MASTER_ADDR/MASTER_PORT 初始化 gloo 进程组
+    没有设置（直接 python train.py）时按单进程训练，不初始化进程组
+    """
+    global rank, local_rank, world_size
+    world_size = int(os.environ.get('WORLD_SIZE', 1))
+    if world_size > 1:
+        dist.init_process_group('gloo')
+        rank = dist.get_rank()
+        local_rank = int(os.environ.get('LOCAL_RANK', rank))
+
+
+def local_first(func, *args, **kwargs):
+    """同一台机器上的进程共用缓存目录：本机0号进程先构建缓存，其余进程等它完成后直接读取"""
+    if world_size > 1 and local_rank != 0:
+        dist.barrier()
+    result = func(*args, **kwargs)
+    if world_size > 1 and local_rank == 0:
+        dist.barrier()
+    return result
+
+
+def shard(indices):
+    """验证数据分片：各进程取互不重叠的一部分（不补齐），指标汇总后与单进程一致"""
+    return indices[rank::world_size]
+
+
+def log(*args, **kwargs):
+    """只在0号进程打印（多进程训练时各进程的输出相同，不重复打印 N 次）"""
+    if rank == 0:
+        print(*args, **kwargs)
+
+
+def evaluate(net, loader, loss_function, num_classes):
+    """验证：eval 模式（关闭 Dropout）下遍历一次，同时得到损失、准确率与混淆矩阵"""
+    net.eval()
+    metrics = MetricsAccumulator(num_classes)
     with torch.no_grad():
-        for step1, val_data in enumerate(validate_loader, start=0):
-            val_images, val_labels = val_data
-            outputs = net(val_images.to(device))
-            #             loss1 = loss_function(outputs, val_labels.to(device))    # 计算损失
-            #             val_loss += loss1.item()
-
-            predict_y = torch.max(outputs, dim=1)[1]  # 以output中值最大位置对应的索引（标签）作为预测输出
-            acc += (predict_y == val_labels.to(device)).sum().item()
-        val_accurate = acc / val_num
-
-        for train_data in train_loader:
-            train_images, train_labels = train_data
-            outputs = net(train_images.to(device))
-            predict_y = torch.max(outputs, dim=1)[1]  # 以output中值最大位置对应的索引（标签）作为预测输出
-            acc1 += (predict_y == train_labels.to(device)).sum().item()
-        train_accurate = acc1 / train_num
-
-        print('[epoch %d]  train_accuracy: %.3f \n' %
-              (epoch + 1, train_accurate))
+        for images, labels in loader:
+            outputs = net(images.to(device))
+            labels = labels.to(device)
+            metrics.update(outputs, labels, loss_function(outputs, labels))
+    return metrics
+
+
+def log_epoch(epoch, train_metrics, val_metrics, train_time, epoch_time, lr):
+    """打印并以 JSON Lines 写入本 epoch 的指标记录"""
+    record = {
+        'epoch': epoch + 1,
+        'train_loss': train_metrics.loss,
+        'train_accuracy': train_metrics.accuracy,
+        'val_loss': val_metrics.loss,
+        'val_accuracy': val_metrics.accuracy,
+        'val_confusion': val_metrics.confusion.tolist(),
+        'train_time': train_time,
+        'epoch_time': epoch_time,
+        'lr': lr,
+        'train_samples': train_metrics.count,
+        'world_size': world_size,
+    }
+    if rank != 0:
+        return record
+    with open(history_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    with open(os.path.join("train.log"), "a") as log_file:
+        log_file.write(str('%f s' % epoch_time) + "\n")
+    print('[epoch %d] train_loss: %.3f  train_accuracy: %.3f  val_loss: %.3f  val_accuracy: %.3f  epoch: %.2f s' %
+          (epoch + 1, train_metrics.loss, train_metrics.accuracy, val_metrics.loss, val_metrics.accuracy,
+           epoch_time))
+    return record
+
+
+def rng_state(generator):
+    """当前的全部随机数状态：torch 全局、打乱顺序用的 generator、numpy、random"""
+    return {
+        'torch': torch.get_rng_state(),
+        'generator': generator.get_state(),
+        'numpy': np.random.get_state(),
+        'random': random.getstate(),
+    }
+
+
+def gather_rng_state(generator):
+    """收集所有进程的随机数状态（按 rank 排列）"""
+    state = rng_state(generator)
+    if world_size == 1:
+        return [state]
+    states = [None] * world_size
+    dist.all_gather_object(states, state)
+    return states
+
+
+def set_rng_state(state, generator):
+    torch.set_rng_state(state['torch'])
+    generator.set_state(state['generator'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['random'])
+
+
+def fit(net, optimizer, train_epoch, validate, args, cla_dict, generator):
+    """
+    训练主循环：每个epoch训练、验证、记录指标
+    - 验证准确率提高时保存最佳模型检查点（save_path）
+    - 验证损失连续 lr_patience 个epoch不下降时降低学习率，连续 patience 个epoch不下降时提前停止
+    - 每 checkpoint_every 个epoch（以及结束时）写出完整的训练状态（模型、优化器、学习率调度、随机数状态、指标记录），
+      --resume 从中恢复；随机数状态在epoch边界保存与恢复，恢复后的训练与不中断时逐批一致
+    train_epoch(epoch): 训练一个epoch，返回本进程训练集部分的 MetricsAccumulator
+    validate(): 返回本进程验证集部分的 MetricsAccumulator
+    多进程时各进程的指标在这里汇总，只有0号进程写出检查点、训练状态与指标记录
+    """
+    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=args.lr_factor,
+                                                     patience=args.lr_patience)
+    progress = {'epoch': 0, 'best_acc': 0.0, 'best_loss': float('inf'), 'bad_epochs': 0, 'stopped': False,
+                'history': []}
+
+    if args.resume:
+        # 0号进程读取训练状态并广播，多台机器时其余机器上不需要有该文件
+        state = [load_training_state(args.resume) if rank == 0 else None]
+        if world_size > 1:
+            dist.broadcast_object_list(state)
+        state = state[0]
+        if state['mode'] != args.mode:
+            log(f"训练状态的模式为 {state['mode']}，与当前 --mode {args.mode} 不一致")
+        net.load_state_dict(state['model'])
+        optimizer.load_state_dict(state['optimizer'])
+        scheduler.load_state_dict(state['scheduler'])
+        progress = state['progress']
+        rng = state['rng'] if isinstance(state['rng'], list) else [state['rng']]
+        if len(rng) != world_size:
+            log(f"训练状态保存时为 {len(rng)} 个进程，当前 {world_size} 个进程，随机序列与不中断时不同")
+        set_rng_state(rng[rank % len(rng)], generator)
+        log(f"从训练状态恢复: {args.resume}（已完成 {progress['epoch']} 个epoch）")
+    # 指标记录与训练状态保持一致：恢复时丢弃检查点之后（中断前）写入的记录
+    if rank == 0:
+        with open(history_path, "w", encoding="utf-8") as f:
+            for record in progress['history']:
+                f.write(json.dumps(record) + "\n")
+
+    for epoch in range(progress['epoch'], args.epochs):
+        if progress['stopped']:
+            break
+        time_start = time.perf_counter()  # 对训练一个 epoch 计时
+        train_metrics = train_epoch(epoch)
+        train_time = time.perf_counter() - time_start
+        val_metrics = validate()
+        # 汇总各进程的指标：所有进程得到相同的验证损失，学习率调度与提前停止的判断一致
+        train_metrics.all_reduce()
+        val_metrics.all_reduce()
+        lr = optimizer.param_groups[0]['lr']
+        record = log_epoch(epoch, train_metrics, val_metrics, train_time, time.perf_counter() - time_start, lr)
+        progress['history'].append(record)
 
         # 保存准确率最高的那次网络参数
-        if val_accurate > best_acc:
-            best_acc = val_accurate
-            torch.save(net.state_dict(), save_path)
-        #         with open(os.path.join("train.log"), "a") as log:
-        #               log.write(str('[epoch %d] train_loss: %.3f  test_accuracy: %.3f \n' %
-        #               (epoch + 1, train_loss / step, val_accurate))+"\n")
-        print('[epoch %d] train_loss: %.3f  val_accuracy: %.3f  val_loss: %.3f\n' %
-              (epoch + 1, train_loss / step, val_accurate, val_loss / step1))
-
-        loss_tra.append(train_loss / step)
-        loss_val.append(val_loss / step1)
-        acc_tra.append(train_accurate)
-        acc_val.append(val_accurate)
-
-with open(os.path.join("train.log"), "a") as log:
-    log.write(str('Finished Training') + "\n")
-print('Finished Training')
-print('best_val_acc: %.3f' % (best_acc))
-
-x1 = range(0, epoch_num)
-plt.subplot(221)
-plt.plot(x1, acc_tra, "b")
-plt.plot(x1, acc_val)
-plt.legend(['tra_acc', 'val_acc'])
-plt.title("acc vs epoch")
-plt.ylabel("acc")
-plt.show()
-x2 = range(0, epoch_num)
-plt.subplot(222)
-plt.plot(x2, loss_tra, "b")
-plt.plot(x2, loss_val)
-plt.legend(['tra_loss', 'val_loss'])
-plt.title("loss vs epoch")
-plt.ylabel("loss")
-plt.show()
-
+        if val_metrics.accuracy > progress['best_acc']:
+            progress['best_acc'] = val_metrics.accuracy
+            # 自包含检查点：结构、类别映射、预处理参数与权重，推理时无需预训练权重与 class_indices.json
+            if rank == 0:
+                save_checkpoint(net, save_path, cla_dict)
+
+        # 学习率调度与提前停止都以验证损失为准
+        scheduler.step(val_metrics.loss)
+        if val_metrics.loss < progress['best_loss']:
+            progress['best_loss'] = val_metrics.loss
+            progress['bad_epochs'] = 0
+        else:
+            progress['bad_epochs'] += 1
+        progress['epoch'] = epoch + 1
+        if args.patience and progress['bad_epochs'] >= args.patience:
+            progress['stopped'] = True
+            if rank == 0:
+                print(f"验证损失已连续 {args.patience} 个epoch没有下降，提前停止")
+
+        if progress['epoch'] % args.checkpoint_every == 0 or progress['stopped'] or progress['epoch'] == args.epochs:
+            # 各进程的模型与优化器状态相同，只有随机数状态不同：收集后由0号进程写出
+            rng = gather_rng_state(generator)
+            if rank == 0:
+                save_training_state(args.checkpoint, {
+                    'mode': args.mode,
+                    'model': net.state_dict(),
+                    'optimizer': optimizer.state_dict(),
+                    'scheduler': scheduler.state_dict(),
+                    'progress': progress,
+                    'rng': rng,
+                })
+
+    return progress['best_acc'], progress['history']
+
+
+def train_full(net, train_loader, validate_loader, loss_function, optimizer, cla_dict, args, generator,
+               sampler=None):
+    """
+    每个epoch对整个网络做前向
+    训练损失与准确率在训练过程中累加；验证集在 eval 模式下只遍历一次，得到损失、准确率与混淆矩阵
+    多进程时 train_loader 使用 DistributedSampler（sampler）分片，DistributedDataParallel 在反向传播时对梯度做 all-reduce
+    """
+    train_net = DistributedDataParallel(net) if world_size > 1 else net
+
+    def train_epoch(epoch):
+        if sampler is not None:
+            sampler.set_epoch(epoch)  # 每个epoch的打乱顺序不同，各进程一致
+        train_net.train()  # 训练过程中开启 Dropout
+        train_metrics = MetricsAccumulator(len(cla_dict))
+
+        for step, data in enumerate(train_loader, start=0):  # 遍历训练集，step从0开始计算
+            images, labels = data  # 获取训练集的图像和标签
+            labels = labels.to(device)
+            optimizer.zero_grad()  # 清除历史梯度
+
+            outputs = train_net(images.to(device))  # 正向传播
+            loss = loss_function(outputs, labels)  # 计算损失
+            loss.backward()  # 反向传播
+            optimizer.step()  # 优化器更新参数
+            train_metrics.update(outputs, labels, loss.item())
+
+            # 打印训练进度（使训练过程可视化）
+            rate = (step + 1) / len(train_loader)  # 当前进度 = 当前step / 训练一轮epoch所需总step
+            a = "*" * int(rate * 50)
+            b = "." * int((1 - rate) * 50)
+            if rank == 0:
+                print("\rtrain loss: {:^3.0f}%[{}->{}]{:.3f}".format(int(rate * 100), a, b, loss), end="")
+        if rank == 0:
+            print()
+        return train_metrics
+
+    def validate():
+        return evaluate(net, validate_loader, loss_function, len(cla_dict))
+
+    return fit(net, optimizer, train_epoch, validate, args, cla_dict, generator)
+
+
+def train_features(net, train_dataset, validate_dataset, loss_function, optimizer, cla_dict, args, generator):
+    """
+    缓存特征训练：主干特征只提取一次（训练集4种翻转组合、验证集不翻转），之后每个epoch只训练分类头
+    训练集的预处理与验证集相同（不含随机翻转），翻转在特征提取时以确定的组合完成
+    """
+    time_start = time.perf_counter()
+    train_dataset.transform = data_transform["val"]
+    train_features_, train_labels = local_first(features.extract_features, net, train_dataset, feature_cache_dir,
+                                                "train")
+    val_features, val_labels = local_first(features.extract_features, net, validate_dataset, feature_cache_dir,
+                                           "val", flips=features.FLIPS[:1])
+    val_features = torch.from_numpy(np.array(shard(val_features[:, 0])))
+    val_labels = torch.from_numpy(shard(val_labels))
+    log('特征缓存就绪: %f s' % (time.perf_counter() - time_start))
+
+    head = net.classifier
+    train_head = DistributedDataParallel(head) if world_size > 1 else head
+
+    def train_epoch(epoch):
+        train_head.train()  # 训练过程中开启 Dropout
+        train_metrics = MetricsAccumulator(len(cla_dict))
+        # 各进程的 generator 状态相同，得到相同的打乱顺序后按 rank 分片；
+        # 补齐为进程数的整数倍（与 DistributedSampler 相同），各进程的批数一致
+        order = torch.randperm(len(train_labels), generator=generator).numpy()
+        order = np.concatenate([order, order[:(-len(order)) % world_size]])[rank::world_size]
+        for start in range(0, len(order), args.batch_size):
+            indices = order[start:start + args.batch_size]
+            inputs = features.sample_flips(train_features_, indices)
+            labels = torch.from_numpy(train_labels[indices])
+            optimizer.zero_grad()
+            outputs = train_head(inputs)
+            loss = loss_function(outputs, labels)
+            loss.backward()
+            optimizer.step()
+            # 训练损失与准确率直接取训练过程中的结果，不再额外遍历一遍训练集
+            train_metrics.update(outputs, labels, loss.item())
+        return train_metrics
+
+    def validate():
+        head.eval()  # 验证过程中关闭 Dropout
+        val_metrics = MetricsAccumulator(len(cla_dict))
+        with torch.no_grad():
+            outputs = head(val_features)
+            val_metrics.update(outputs, val_labels, loss_function(outputs, val_labels))
+        return val_metrics
+
+    # 主干为冻结的预训练权重，与分类头一起写入检查点
+    return fit(net, optimizer, train_epoch, validate, args, cla_dict, generator)
+
+
+def plot_history(history, path=plot_path):
+    """把准确率、损失曲线保存为图片（训练可能在无界面的服务器上运行，不弹出窗口）"""
+    acc_tra = [record['train_accuracy'] for record in history]
+    acc_val = [record['val_accuracy'] for record in history]
+    loss_tra = [record['train_loss'] for record in history]
+    loss_val = [record['val_loss'] for record in history]
+    epoch_num = len(history)
+    x1 = range(0, epoch_num)
+    plt.figure(figsize=(12, 5))
+    plt.subplot(121)
+    plt.plot(x1, acc_tra, "b")
+    plt.plot(x1, acc_val)
+    plt.legend(['tra_acc', 'val_acc'])
+    plt.title("acc vs epoch")
+    plt.ylabel("acc")
+    x2 = range(0, epoch_num)
+    plt.subplot(122)
+    plt.plot(x2, loss_tra, "b")
+    plt.plot(x2, loss_val)
+    plt.legend(['tra_loss', 'val_loss'])
+    plt.title("loss vs epoch")
+    plt.ylabel("loss")
+    plt.savefig(path)
+    plt.close()
+
+
+def main():
+    args = parse_args()
+    init_distributed()
+
+    if rank == 0:
+        with open(os.path.join("train.log"), "a") as log_file:
+            log_file.write(str(device) + (" x %d" % world_size if world_size > 1 else "") + "\n")
+
+    # Dropout 等随机数各进程不同；打乱顺序的 generator 各进程相同
+    torch.manual_seed(args.seed + rank)
+    np.random.seed(args.seed + rank)
+    random.seed(args.seed + rank)
+    # 训练集打乱顺序使用独立的随机数生成器，其状态随训练状态一起保存
+    generator = torch.Generator().manual_seed(args.seed)
+
+    # 导入训练集并进行预处理
+    train_dataset = datasets.ImageFolder(root=image_path + "/train",
+                                         transform=data_transform["train"])
+    train_num = len(train_dataset)
+    log(train_num)
+    # 按batch_size分批次加载训练集
+    train_loader = torch.utils.data.DataLoader(train_dataset,  # 导入的训练集
+                                               batch_size=args.batch_size,  # 每批训练的样本数
+                                               shuffle=True,  # 是否打乱训练集
+                                               num_workers=0,  # 使用线程数，在windows下设置为0
+                                               generator=generator)
+
+    # 导入、加载 验证集
+    # 导入验证集并进行预处理
+    validate_dataset = datasets.ImageFolder(root=image_path + "/val",
+                                            transform=data_transform["val"])
+    val_num = len(validate_dataset)
+    log(val_num)
+    # 加载验证集
+    validate_loader = torch.utils.data.DataLoader(validate_dataset,  # 导入的验证集
+                                                  batch_size=args.batch_size,
+                                                  shuffle=True,
+                                                  num_workers=0)
+    train_sampler = val_sampler = None
+    if world_size > 1:
+        # 训练集按进程分片（DistributedSampler 按 seed + epoch 打乱，各进程一致）；验证集各进程取不重叠的一部分
+        train_sampler = torch.utils.data.DistributedSampler(train_dataset, world_size, rank, seed=args.seed)
+        val_sampler = shard(list(range(val_num)))
+        train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=args.batch_size,
+                                                   sampler=train_sampler, num_workers=0)
+        validate_loader = torch.utils.data.DataLoader(validate_dataset, batch_size=args.batch_size,
+                                                      sampler=val_sampler, num_workers=0)
+
+    if args.data_cache:
+        # 预解码缓存：图像只解码、缩放一次，归一化与随机翻转按整批完成，多进程读取
+        cache_dir = os.path.join(image_path, "cache")
+        for split in ("train", "val"):
+            decoded, total = local_first(dataset_cache.build_cache, os.path.join(image_path, split), cache_dir,
+                                         split)
+            log(f"数据集缓存 {split}: 共 {total} 张，本次解码 {decoded} 张")
+        _, train_loader = dataset_cache.make_loader("train", args.batch_size, shuffle=True, augment=True,
+                                                    num_workers=args.workers, cache_dir=cache_dir,
+                                                    generator=generator, sampler=train_sampler)
+        _, validate_loader = dataset_cache.make_loader("val", args.batch_size, shuffle=True,
+                                                       num_workers=args.workers, cache_dir=cache_dir,
+                                                       sampler=val_sampler)
+
+    lm_list = train_dataset.class_to_idx
+
+    cla_dict = dict((val, key) for key, val in lm_list.items())
+
+    json_str = json.dumps(cla_dict, indent=4)
+    if rank == 0:
+        with open('class_indices.json', 'w') as json_file:
+            json_file.write(json_str)
+
+    # 获取模型：续训时全部权重随训练状态恢复，不需要预训练权重；
+    # 否则由本机0号进程先下载预训练权重到缓存，其余进程等它完成后直接读取缓存
+    if args.resume:
+        net = model(pretrained=False)
+    else:
+        net = local_first(model)
+
+    # 打印模型信息
+    model_info = get_model_summary(net)
+    log(f"模型: {model_info['model_name']}")
+    log(f"总参数: {model_info['total_parameters']:,}")
+    log(f"可训练参数: {model_info['trainable_parameters']:,}")
+
+    net.to(device)  # 分配网络到指定的设备（GPU/CPU）训练
+
+    loss_function = nn.CrossEntropyLoss()  # 交叉熵损失
+    optimizer = optim.Adam(net.parameters(), lr=args.lr)  # 优化器（训练参数，学习率）
+
+    if args.mode == 'features':
+        best_acc, history = train_features(net, train_dataset, validate_dataset, loss_function, optimizer,
+                                           cla_dict, args, generator)
+    else:
+        best_acc, history = train_full(net, train_loader, validate_loader, loss_function, optimizer, cla_dict,
+                                       args, generator, train_sampler)
+
+    if world_size > 1:
+        dist.destroy_process_group()
+    if rank != 0:
+        return
+
+    with open(os.path.join("train.log"), "a") as log_file:
+        log_file.write(str('Finished Training') + "\n")
+    print('Finished Training')
+    print('best_val_acc: %.3f' % (best_acc))
+
+    plot_history(history)
+    print(f"训练曲线已保存到: {plot_path}")
+
+
+if __name__ == '__main__':
+    main()